@@ -0,0 +1,483 @@
+"""
+パフォーマンス計測スクリプト
+各処理のマイクロベンチマークを実行する
+
+使い方:
+    python benchmark.py            # すべて実行
+    python benchmark.py date_parse # 指定したベンチマークのみ実行
+"""
+
+import os
+import re
+import sys
+import time
+import queue
+import random
+import tempfile
+import logging
+import tracemalloc
+import logging.handlers
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.data_processor import DataProcessor
+from utils.analytics import MealAnalytics
+from utils.meal_record import MealBatch
+from utils.csv_handler import CSVHandler
+from utils.history_archive import HistoryArchive
+from utils.history_writer import HistoryWriter
+from utils.logger import _QueueHandler
+
+WEEKDAYS_JP = ['月', '火', '水', '木', '金', '土', '日']
+SAMPLE_MENUS = ['*ﾗｲｽM', '*ﾗｲｽL', '*豆腐', '*味噌汁', '*国産さばの生姜煮', '*冷やしそば', '*焼肉ビビンバ丼M']
+SAMPLE_HOURS = ['08:15', '12:10', '13:55', '18:21']
+
+def create_sample_records(count: int, days: int = 365):
+    """ベンチマーク用の食事履歴データを作成（新しい順）"""
+    rng = random.Random(0)
+    today = datetime.now()
+    records = []
+    for i in range(count):
+        date = today - timedelta(days=(i * days) // count)
+        date_str = f"{date.month}月{date.day}日({WEEKDAYS_JP[date.weekday()]}[{date.weekday()}])"
+        records.append({
+            'date': date_str,
+            'hour': rng.choice(SAMPLE_HOURS),
+            'menus': rng.sample(SAMPLE_MENUS, 2),
+            'amount': f"{rng.randint(100, 1200)}円"
+        })
+    return records
+
+def timed(func, *args):
+    """関数の実行時間（秒）と戻り値を取得"""
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+# --- 日付解析 -------------------------------------------------------------
+
+def _legacy_parse_date(date_str):
+    """変更前の日付解析（比較用）"""
+    match = re.search(r'(\d+)月(\d+)日', date_str)
+    if match:
+        month = int(match.group(1))
+        day = int(match.group(2))
+        current_year = datetime.now().year
+        year = current_year - 1 if month > datetime.now().month else current_year
+        return datetime(year, month, day)
+    return None
+
+def _legacy_filter_and_group(records):
+    """変更前のフィルタリング・グループ化（比較用）"""
+    ten_days_ago = datetime.now() - timedelta(days=10)
+    sorted_data = sorted(records, key=lambda d: _legacy_parse_date(d['date']) or datetime.min, reverse=True)
+    recent = [d for d in sorted_data if (_legacy_parse_date(d['date']) or datetime.min) >= ten_days_ago]
+    grouped = {}
+    for data in records:
+        key = re.sub(r'\([月火水木金土日]\[[0-6]\]\)', '', data['date']).strip()
+        grouped.setdefault(key, []).append(data)
+    return recent, grouped
+
+def _current_filter_and_group(records):
+    """正規化済みフィールドを使ったフィルタリング・グループ化"""
+    recent = DataProcessor.filter_recent_ten_days_data(records)
+    grouped = DataProcessor.group_data_by_date(records)
+    return recent, grouped
+
+def benchmark_date_parse(count: int = 100_000):
+    """日付解析・フィルタリング・グループ化のベンチマーク"""
+    print(f"[date_parse] {count:,}件")
+    legacy_time, _ = timed(_legacy_filter_and_group, create_sample_records(count))
+    current_time, _ = timed(_current_filter_and_group, create_sample_records(count))
+    print(f"  変更前: {legacy_time:.3f}秒")
+    print(f"  変更後: {current_time:.3f}秒 ({legacy_time / current_time:.1f}倍)")
+
+# --- 利用分析 -------------------------------------------------------------
+
+def benchmark_analytics(count: int = 1_000_000):
+    """利用分析（列形式への変換と集計）のベンチマーク"""
+    print(f"[analytics] {count:,}件")
+    records = create_sample_records(count)
+    load_time, analytics = timed(MealAnalytics.from_records, records)
+    summary_time, _ = timed(analytics.get_summary)
+    print(f"  DataFrame作成: {load_time:.3f}秒")
+    print(f"  集計: {summary_time:.3f}秒")
+
+# --- レコード形式 ---------------------------------------------------------
+
+def measure_memory(func, *args):
+    """関数が確保したまま保持しているメモリ量（バイト）と戻り値を取得"""
+    tracemalloc.start()
+    result = func(*args)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, result
+
+def peak_memory(func, *args):
+    """関数実行中のピークメモリ量（バイト）を取得"""
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def benchmark_meal_record(count: int = 200_000):
+    """辞書形式と列形式コンテナのメモリ量・分析前処理のベンチマーク"""
+    print(f"[meal_record] {count:,}件")
+    dict_bytes, records = measure_memory(create_sample_records, count)
+    DataProcessor.resolve_dates(records)
+    batch_time, batch = timed(MealBatch.from_records, records)
+    batch_bytes, _ = measure_memory(MealBatch.from_records, records)
+    print(f"  辞書形式: {dict_bytes / count:.0f}バイト/件")
+    print(f"  列形式:   {batch_bytes / count:.0f}バイト/件 (変換 {batch_time:.3f}秒)")
+    
+    records_time, _ = timed(MealAnalytics.from_records, records)
+    from_batch_time, _ = timed(MealAnalytics.from_batch, batch)
+    print(f"  分析用DataFrame作成（辞書）: {records_time:.3f}秒")
+    print(f"  分析用DataFrame作成（列形式）: {from_batch_time:.3f}秒")
+
+# --- 履歴ファイル ---------------------------------------------------------
+
+def benchmark_storage(count: int = 100_000):
+    """CSVとParquetの書き込み・読み込みのベンチマーク"""
+    print(f"[storage] {count:,}件")
+    records = create_sample_records(count)
+    DataProcessor.resolve_dates(records)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for storage_format in ("csv", "parquet"):
+            handler = CSVHandler(storage_format)
+            handler.output_path = os.path.join(tmp_dir, os.path.basename(handler.output_path))
+            write_time, _ = timed(handler.save_data, records)
+            read_time, _ = timed(handler.load_data)
+            size = os.path.getsize(handler.output_path)
+            print(f"  {storage_format:8s} 書き込み: {write_time:.3f}秒, 読み込み: {read_time:.3f}秒, サイズ: {size / 1024:.0f}KB")
+
+def benchmark_archive(count: int = 300_000, days: int = 365 * 3):
+    """月別パーティションからの直近読み込みと全件読み込みのベンチマーク"""
+    print(f"[archive] {count:,}件 ({days}日分)")
+    records = create_sample_records(count, days)
+    DataProcessor.resolve_dates(records)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        handler = CSVHandler("parquet")
+        handler.output_path = os.path.join(tmp_dir, "meal_history.parquet")
+        handler.save_data(records)
+        archive = HistoryArchive(os.path.join(tmp_dir, "history"))
+        archive.write(records)
+        
+        full_time, _ = timed(handler.load_data)
+        recent_time, recent = timed(archive.read_recent, 10)
+        today = datetime.now()
+        month_time, _ = timed(archive.read_month, today.year, today.month)
+        print(f"  単一ファイル全件読み込み: {full_time:.3f}秒")
+        print(f"  直近10日（{len(recent):,}件）: {recent_time:.3f}秒")
+        print(f"  今月: {month_time:.3f}秒")
+
+def benchmark_streaming(count: int = 300_000):
+    """直近分のストリーミング読み込みと全件読み込みのベンチマーク"""
+    print(f"[streaming] {count:,}件")
+    records = create_sample_records(count)
+    DataProcessor.resolve_dates(records)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        handler = CSVHandler()
+        handler.output_path = os.path.join(tmp_dir, "meal_history.csv")
+        handler.save_data(records)
+        
+        full_time, _ = timed(handler.load_data)
+        full_peak = peak_memory(handler.load_data)
+        recent_time, recent = timed(handler.read_recent, 10)
+        recent_peak = peak_memory(handler.read_recent, 10)
+        print(f"  全件読み込み: {full_time:.3f}秒, ピークメモリ {full_peak / 1024 / 1024:.1f}MB")
+        print(f"  直近10日（{len(recent):,}件）: {recent_time:.3f}秒, ピークメモリ {recent_peak / 1024 / 1024:.1f}MB")
+
+def benchmark_writer(writers: int = 16, batches: int = 20, batch_size: int = 50):
+    """同時書き込み時のスループット（ジャーナル追記と履歴ファイル直接書き込み）のベンチマーク"""
+    total = writers * batches * batch_size
+    print(f"[writer] {writers}並列 × {batches}回 × {batch_size}件")
+    records = create_sample_records(batch_size)
+    DataProcessor.resolve_dates(records)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        handler = CSVHandler()
+        handler.output_path = os.path.join(tmp_dir, "meal_history.csv")
+        writer = HistoryWriter(handler, compact_threshold=10 ** 9)
+        
+        def append_batches(_):
+            for _ in range(batches):
+                writer.append(records)
+        
+        def save_batches(_):
+            for _ in range(batches):
+                handler.save_data(records)
+        
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            journal_time, _ = timed(lambda: list(executor.map(append_batches, range(writers))))
+            direct_time, _ = timed(lambda: list(executor.map(save_batches, range(writers))))
+        compact_time, _ = timed(writer.compact)
+        print(f"  ジャーナル追記: {total / journal_time:,.0f}件/秒 ({journal_time:.3f}秒)")
+        print(f"  履歴ファイル直接書き込み: {total / direct_time:,.0f}件/秒 ({direct_time:.3f}秒)")
+        print(f"  ジャーナル統合: {compact_time:.3f}秒")
+
+def benchmark_accounts(accounts: int = 300, count: int = 2_000):
+    """複数アカウントの月別合計・期間集計のベンチマーク"""
+    print(f"[accounts] {accounts}アカウント × {count:,}件")
+    records = create_sample_records(count, days=365)
+    DataProcessor.resolve_dates(records)
+    today = datetime.now()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive = HistoryArchive(tmp_dir)
+        for index in range(accounts):
+            archive.write(records, account=f"user{index:04d}")
+        
+        totals_time, totals = timed(archive.monthly_totals, today.year, today.month)
+        start = today.date().replace(day=1)
+        frame_time, _ = timed(archive.spend_by_account, start, today.date())
+        print(f"  今月の合計（マニフェスト）: {totals_time * 1000:.1f}ミリ秒 ({len(totals)}アカウント)")
+        print(f"  今月の集計（パーティション読み込み）: {frame_time:.3f}秒")
+
+def benchmark_logging(count: int = 50_000):
+    """1レコードあたりのログ出力コスト（ファイルへの同期書き込みとキュー経由）のベンチマーク"""
+    print(f"[logging] {count:,}件")
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench_logger = logging.getLogger("benchmark.logging")
+        bench_logger.propagate = False
+        bench_logger.setLevel(logging.INFO)
+        
+        def log_records():
+            for i in range(count):
+                bench_logger.warning(f"フィールドが空です: {i}")
+        
+        file_handler = logging.FileHandler(os.path.join(tmp_dir, "sync.log"), encoding='utf-8')
+        file_handler.setFormatter(formatter)
+        bench_logger.handlers = [file_handler]
+        sync_time, _ = timed(log_records)
+        file_handler.close()
+        
+        rotating_handler = logging.handlers.RotatingFileHandler(os.path.join(tmp_dir, "queue.log"), maxBytes=1024 * 1024, backupCount=3, encoding='utf-8')
+        rotating_handler.setFormatter(formatter)
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, rotating_handler)
+        listener.start()
+        bench_logger.handlers = [_QueueHandler(log_queue)]
+        queue_time, _ = timed(log_records)
+        drain_time, _ = timed(listener.stop)
+        rotating_handler.close()
+        
+        bench_logger.setLevel(logging.ERROR)
+        suppressed_time, _ = timed(log_records)
+        bench_logger.handlers = []
+        
+        print(f"  ファイル同期書き込み: {sync_time / count * 1e6:.1f}マイクロ秒/件")
+        print(f"  キュー経由: {queue_time / count * 1e6:.1f}マイクロ秒/件（書き出し待ち {drain_time:.3f}秒）")
+        print(f"  レベルで抑制: {suppressed_time / count * 1e6:.2f}マイクロ秒/件")
+
+def benchmark_browser(runs: int = 3):
+    """ブラウザ準備完了までの時間（従来の手順・起動プロファイル・起動済みブラウザの再利用）のベンチマーク"""
+    from playwright.sync_api import sync_playwright
+    from config import PLAYWRIGHT_CONFIG
+    from utils.webdriver_manager import WebDriverManager
+    print(f"[browser] {runs}回")
+    
+    def legacy_setup():
+        playwright = sync_playwright().start()
+        browser = playwright.chromium.launch(headless=True)
+        page = browser.new_page()
+        page.set_viewport_size({"width": 1920, "height": 1080})
+        page.set_extra_http_headers({"User-Agent": PLAYWRIGHT_CONFIG["user_agent"]})
+        browser.close()
+        playwright.stop()
+    
+    try:
+        legacy_time, _ = timed(lambda: [legacy_setup() for _ in range(runs)])
+        
+        cold_times, warm_times = [], []
+        for _ in range(runs):
+            manager = WebDriverManager({**PLAYWRIGHT_CONFIG, "headless": True})
+            manager.setup_driver()
+            cold_times.append(manager.ready_latency)
+            manager.setup_driver()
+            warm_times.append(manager.ready_latency)
+            manager.cleanup(wait_time=0)
+    except Exception as e:
+        print(f"  スキップしました（ブラウザを起動できません: {str(e).splitlines()[0]}）")
+        return
+    
+    print(f"  従来の手順（起動〜ページ設定）: {legacy_time / runs:.3f}秒")
+    print(f"  起動プロファイル: {sum(cold_times) / runs:.3f}秒")
+    print(f"  起動済みブラウザの再利用: {sum(warm_times) / runs:.3f}秒")
+
+def benchmark_replay(runs: int = 3):
+    """記録したHARを再生した、ログインから履歴抽出までの時間のベンチマーク（ネットワークに接続しない）"""
+    from config import PLAYWRIGHT_CONFIG
+    from meal_scraper import MealHistoryScraper
+    har_path = PLAYWRIGHT_CONFIG["har_path"]
+    print(f"[replay] {runs}回（{har_path}）")
+    if not os.path.exists(har_path):
+        print("  スキップしました（HARファイルがありません。HAR_MODE=record で一度実行して記録してください）")
+        return
+    
+    def replay_run():
+        scraper = MealHistoryScraper()
+        scraper.webdriver_manager.launch_profile.config["har_mode"] = "replay"
+        manager = scraper.webdriver_manager
+        try:
+            if not (manager.setup_driver() and scraper.login_manager.login(scraper.login_url)
+                    and scraper.navigation_manager.open_usage_detail()):
+                raise RuntimeError("再生に失敗しました")
+            return len(scraper.data_extractor.extract_meal_data())
+        finally:
+            manager.cleanup(wait_time=0)
+    
+    try:
+        times = []
+        for _ in range(runs):
+            elapsed, count = timed(replay_run)
+            times.append(elapsed)
+    except Exception as e:
+        print(f"  スキップしました（{str(e).splitlines()[0]}）")
+        return
+    
+    print(f"  ログイン〜履歴抽出: 平均 {sum(times) / runs:.3f}秒, 最小 {min(times):.3f}秒（{count}件）")
+
+def benchmark_pipeline(count: int = 3_000, article_delay: float = 0.005, smtp_delay: float = 0.2, close_delay: float = 0.5):
+    """抽出と保存・アーカイブ・メール作成を順に行う場合と並行して行う場合の実行時間のベンチマーク
+    
+    ブラウザ操作（記事ごとの抽出・ブラウザの終了）とSMTP送信は待機時間で模擬する。
+    """
+    from itertools import groupby
+    from utils.email_sender import EmailSender
+    from utils.html_template import HTMLTemplateGenerator
+    from utils.pipeline import RecordPipeline, RecordSink
+    
+    records = create_sample_records(count)
+    articles = [list(group) for _, group in groupby(records, key=lambda data: data['date'])]
+    print(f"[pipeline] {count:,}件 / {len(articles)}記事")
+    
+    def extract():
+        for article in articles:
+            time.sleep(article_delay)
+            batch = [dict(data) for data in article]
+            DataProcessor.resolve_dates(batch)
+            yield batch
+    
+    def render_email(structured_data):
+        recent = DataProcessor.filter_recent_ten_days_data(structured_data)
+        summary = EmailSender._create_analytics_summary(None, structured_data)
+        HTMLTemplateGenerator().create_email_body(recent, len(structured_data), summary)
+        time.sleep(smtp_delay)
+        return True
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def create_outputs(name):
+            handler = CSVHandler()
+            handler.output_path = os.path.join(tmp_dir, name, "meal_history.csv")
+            os.makedirs(os.path.dirname(handler.output_path))
+            return HistoryWriter(handler), HistoryArchive(os.path.join(tmp_dir, name, "history"))
+        
+        def sequential():
+            writer, archive = create_outputs("sequential")
+            structured_data = [data for batch in extract() for data in batch]
+            writer.append(structured_data)
+            archive.write(structured_data)
+            render_email(structured_data)
+            time.sleep(close_delay)
+            browser_hold = time.perf_counter() - start
+            writer.close()
+            return browser_hold
+        
+        def pipelined():
+            writer, archive = create_outputs("pipelined")
+            pipeline = RecordPipeline([
+                RecordSink("save", on_batch=writer.append),
+                RecordSink("archive", on_finish=archive.write),
+                RecordSink("email", on_finish=render_email),
+            ]).start()
+            for batch in extract():
+                pipeline.put(batch)
+            pipeline.end_input()
+            time.sleep(close_delay)
+            browser_hold = time.perf_counter() - start
+            pipeline.close()
+            writer.close()
+            return browser_hold
+        
+        start = time.perf_counter()
+        sequential_time, sequential_hold = timed(sequential)
+        start = time.perf_counter()
+        pipelined_time, pipelined_hold = timed(pipelined)
+        print(f"  順に実行: 全体 {sequential_time:.3f}秒, ブラウザ使用 {sequential_hold:.3f}秒")
+        print(f"  並行実行: 全体 {pipelined_time:.3f}秒, ブラウザ使用 {pipelined_hold:.3f}秒")
+
+def benchmark_scheduler(accounts: int = 40, requests: int = 8, capacity: int = 4, base_latency: float = 0.01):
+    """複数アカウントの実行（順に実行・固定の並列数・適応的な並列数）のベンチマーク（サイトは模擬）"""
+    import threading
+    from utils.scheduler import AccountScheduler, AdaptiveConcurrency, HostRateLimiter
+    print(f"[scheduler] {accounts}アカウント × {requests}要求（サイトの同時処理数 {capacity}）")
+    
+    def simulate(concurrency):
+        random.seed(0)
+        config = {
+            "hosts": {"meal.example": {"rate": 1000, "burst": 10}}, "start_jitter": 0.0,
+            "target_latency": base_latency * 3, "window": 10, **concurrency,
+        }
+        controller = AdaptiveConcurrency(config)
+        limiter = HostRateLimiter(config, controller)
+        state = {"in_flight": 0, "errors": 0}
+        lock = threading.Lock()
+        
+        def request():
+            limiter.acquire("https://meal.example/", "document")
+            with lock:
+                state["in_flight"] += 1
+                overload = max(0, state["in_flight"] - capacity)
+            # 同時処理数を超えると応答が遅くなり、大きく超えるとエラーになる
+            latency = base_latency * (1 + overload) ** 2
+            time.sleep(latency)
+            error = overload > capacity // 2 and random.random() < 0.5
+            with lock:
+                state["in_flight"] -= 1
+                state["errors"] += error
+            limiter.observe(latency=None if error else latency, error=error)
+            return not error
+        
+        def run_account(account):
+            return all([request() for _ in range(requests)])
+        
+        elapsed, results = timed(AccountScheduler(run_account, controller, config).run, [f"user{i}" for i in range(accounts)])
+        return elapsed, state["errors"], sum(results.values()), controller.history
+    
+    for label, concurrency in [
+        ("順に実行", {"initial_concurrency": 1, "min_concurrency": 1, "max_concurrency": 1}),
+        ("固定の並列数 8", {"initial_concurrency": 8, "min_concurrency": 8, "max_concurrency": 8}),
+        ("適応的な並列数", {"initial_concurrency": 2, "min_concurrency": 1, "max_concurrency": 8}),
+    ]:
+        elapsed, errors, succeeded, history = simulate(concurrency)
+        print(f"  {label}: {elapsed:.2f}秒, エラー {errors}件, 成功 {succeeded}/{accounts}アカウント, 並列数 {history[-1]}（最大 {max(history)}）")
+
+BENCHMARKS = {
+    "date_parse": benchmark_date_parse,
+    "analytics": benchmark_analytics,
+    "meal_record": benchmark_meal_record,
+    "storage": benchmark_storage,
+    "archive": benchmark_archive,
+    "streaming": benchmark_streaming,
+    "writer": benchmark_writer,
+    "accounts": benchmark_accounts,
+    "logging": benchmark_logging,
+    "browser": benchmark_browser,
+    "replay": benchmark_replay,
+    "pipeline": benchmark_pipeline,
+    "scheduler": benchmark_scheduler,
+}
+
+def main():
+    """メイン実行関数"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    main()
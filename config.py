@@ -29,7 +29,13 @@ PLAYWRIGHT_CONFIG = {
     "page_load_timeout": 30000,  # 30秒
     "navigation_timeout": 30000,  # ナビゲーションタイムアウト（30秒）
     "wait_for_timeout": 5000,  # 要素待機タイムアウト（5秒）
-    "user_agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    "user_agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "locale": "ja-JP",
+    "timezone_id": "Asia/Tokyo",
+    "blocked_resources": ["image", "media", "font"],  # 読み込まないリソースの種類
+    "storage_state": "",  # ログイン状態の保存先（例: "accounts/storage_state.json"）
+    "har_mode": os.getenv("HAR_MODE", "off"),  # 通信の記録・再生（"off"、"record"、"replay"）
+    "har_path": os.getenv("HAR_PATH", "debug/har/meal_history.har.zip")  # 記録・再生するHARファイル
 }
 
 # セレクター設定
@@ -39,6 +45,11 @@ SELECTORS = {
     "password_field": "input#form_password",
     "login_button": "input[type='submit'][value='ログインする']",
     
+    # 2回目のログインフォーム（cn-univ）
+    "second_login_email": "input[name='email']",
+    "second_login_password": "input[name='password']",
+    "second_login_button": "button#next",
+    
     # ミール利用履歴リンク
     "meal_history_link": "a[href*='cn-univ.coop']",
     "meal_history_xpath": "//a[contains(text(), 'ミール利用履歴')]",
@@ -61,13 +72,52 @@ SELECTORS = {
     "more_button": ".btn-more"
 }
 
+# 代替セレクター（基本セレクターが一致しない場合に順に試す。CSSまたはXPath）
+SELECTOR_FALLBACKS = {
+    "email_field": ["input[name='email']", "input[type='email']"],
+    "password_field": ["input[name='password']", "input[type='password']"],
+    "login_button": [
+        "input[type='submit']",
+        "//button[contains(., 'ログイン')]",
+        "//button[contains(., 'Login')]",
+        "input[value*='ログイン']",
+        "input[value*='Login']"
+    ],
+    "meal_history_link": ["//a[contains(text(), 'ミール利用履歴')]"],
+    "usage_detail_link": ["//a[contains(text(), 'ご利用明細')]"],
+    "history_articles": [".history-contents"]
+}
+
 # ファイルパス設定
 FILE_PATHS = {
     "csv_output": "meal_history.csv",
+    "parquet_output": "meal_history.parquet",
+    "history_format": "csv",  # 履歴の保存形式（"csv" または "parquet"。parquetはpyarrowが必要）
+    "archive_dir": "history",  # 月別パーティション履歴アーカイブ
+    "accounts_dir": "accounts",  # アカウント指定時の履歴ファイルの保存先
+    "navigation_cache": "navigation_cache.json",  # ご利用明細ページのURL（履歴ファイルと同じディレクトリに保存）
+    "checkpoint_dir": "checkpoint",  # 実行チェックポイント（履歴ファイルと同じディレクトリに保存、--resume で使用）
     "debug_dir": "debug",
     "logs_dir": "logs"
 }
 
+# 複数アカウント実行のスケジューラー設定
+SCHEDULER_CONFIG = {
+    # ホストごとの要求レート（1秒あたり）と連続して許可する要求数（サブドメインにも適用）
+    "hosts": {
+        "hiroshima.meal.univ-coop.net": {"rate": 1.0, "burst": 3},
+        "cn-univ.coop": {"rate": 1.0, "burst": 3}
+    },
+    "limited_resources": ["document", "xhr", "fetch"],  # レート制限の対象とするリソースの種類
+    "start_jitter": 5.0,  # アカウントごとの開始のばらつき（秒）
+    "initial_concurrency": 2,
+    "min_concurrency": 1,
+    "max_concurrency": 6,
+    "target_latency": 3.0,  # 応答時間（p90、秒）がこれを超えたら並列数を減らす
+    "max_error_rate": 0.1,  # エラー率がこれを超えたら並列数を減らす
+    "window": 20  # 並列数を見直すまでの観測数
+}
+
 # メール設定
 EMAIL_CONFIG = {
     "smtp_server": "smtp.gmail.com",
@@ -83,15 +133,25 @@ EMAIL_CONFIG = {
 LOG_CONFIG = {
     "level": "INFO",
     "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    "file": "logs/scraper.log"
+    "file": "logs/scraper.log",
+    "rotation": "size",          # "size"（サイズ）または "time"（日付）
+    "max_bytes": 5 * 1024 * 1024,  # サイズローテーションの上限（5MB）
+    "when": "midnight",          # 日付ローテーションのタイミング
+    "backup_count": 7,           # 保持する世代数
+    "compress": True,            # ローテーション済みファイルをgzip圧縮
+    "module_levels": {},         # 例: {"utils.data_extractor": "ERROR"}
+    "packages": ["utils"],
+    "event_log": os.getenv("EVENT_LOG", "")  # 例: "logs/events.jsonl"
 }
 
 # 待機時間設定
 WAIT_TIMES = {
     "timeout": 30000,  # 30秒
+    "state_check": 5000,  # ログイン状態の確認（ミリ秒）
     "page_load": 5,
     "element_load": 3,
     "after_click": 8,
     "after_login": 5,
-    "before_close": 15
+    "before_close": 15,
+    "run_deadline": int(os.getenv("RUN_DEADLINE_SECONDS", "600"))  # 実行全体の上限（秒、0で無制限）
 } 
\ No newline at end of file
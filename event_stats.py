@@ -0,0 +1,42 @@
+"""
+イベントログ集計スクリプト
+フェーズごとの所要時間の百分位数を表示する
+
+使い方:
+    python event_stats.py logs/                      # ディレクトリ配下のイベントログをすべて集計
+    python event_stats.py logs/events.jsonl --account alice@example.com
+    python event_stats.py logs/ --by account         # アカウントごとに集計
+"""
+
+import os
+import sys
+import argparse
+
+# プロジェクトのルートディレクトリをパスに追加
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.event_log import iter_events, phase_latency
+
+def main():
+    """メイン実行関数"""
+    parser = argparse.ArgumentParser(description="イベントログのフェーズ別所要時間を集計")
+    parser.add_argument("log_path", nargs="?", default="logs", help="イベントログのファイルまたはディレクトリ")
+    parser.add_argument("--account", help="集計するアカウント")
+    parser.add_argument("--phase", help="集計するフェーズ（--by account と組み合わせて使用）")
+    parser.add_argument("--by", default="phase", choices=["phase", "account", "run_id"], help="集計の単位")
+    args = parser.parse_args()
+
+    events = iter_events(args.log_path)
+    if args.phase:
+        events = (event for event in events if event.get("phase") == args.phase)
+    stats = phase_latency(events, account=args.account, key=args.by)
+    if not stats:
+        print("イベントが見つかりません")
+        return
+
+    print(f"{args.by:<24}{'count':>8}{'failed':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    for name, row in stats.items():
+        print(f"{name:<24}{row['count']:>8}{row['failed']:>8}{row['p50']:>10.1f}{row['p90']:>10.1f}{row['p99']:>10.1f}{row['max']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
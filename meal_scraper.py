@@ -9,8 +9,11 @@ Date: 2025-07-02
 
 __version__ = "1.5.0"
 
+import os
 import logging
-from typing import Dict, Any, List, Optional
+import argparse
+from email.utils import make_msgid
+from typing import Dict, Any, List, Optional, Tuple
 from utils.logger import setup_logger
 from utils.email_sender import EmailSender
 from utils.webdriver_manager import WebDriverManager
@@ -18,37 +21,54 @@ from utils.selector_manager import SelectorManager
 from utils.login_manager import LoginManager
 from utils.navigation_manager import NavigationManager
 from utils.data_extractor import DataExtractor
-from utils.csv_handler import CSVHandler
+from utils.csv_handler import CSVHandler, sanitize_account
+from utils.history_archive import HistoryArchive
+from utils.history_writer import HistoryWriter
+from utils.event_log import start_run, event_phase
+from utils.pipeline import RecordPipeline, RecordSink
+from utils.run_checkpoint import RunCheckpoint
+from utils.profiler import PhaseProfiler, PROFILE_CONFIG
+from utils.deadline import Deadline
+from utils.retry import Retrier
+from utils.scheduler import AccountScheduler, AdaptiveConcurrency, HostRateLimiter
+from utils.encryption import CredentialManager
 
 # 設定をインポート
-from config import EMAIL, PASSWORD, SELECTORS, WAIT_TIMES, PLAYWRIGHT_CONFIG, MEAL_PAGE_URL
+from config import EMAIL, PASSWORD, SELECTORS, SELECTOR_FALLBACKS, WAIT_TIMES, PLAYWRIGHT_CONFIG, MEAL_PAGE_URL, FILE_PATHS, SCHEDULER_CONFIG, LOG_CONFIG
 
-logger = setup_logger()
+logger = setup_logger(config=LOG_CONFIG)
 
 class MealHistoryScraper:
     """食事履歴スクレイピングクラス（統合インターフェース）"""
     
-    def __init__(self):
+    def __init__(self, account: Optional[str] = None, credentials: Optional[Tuple[str, str]] = None):
         # 設定を準備
         self.playwright_config = PLAYWRIGHT_CONFIG
         self.wait_times = WAIT_TIMES
-        self.credentials = (EMAIL or "", PASSWORD or "")
+        self.credentials = credentials or (EMAIL or "", PASSWORD or "")
         self.login_url = MEAL_PAGE_URL
         
         # 各マネージャーを初期化
         self.webdriver_manager = WebDriverManager(self.playwright_config)
-        self.selector_manager = SelectorManager(SELECTORS)
+        if account:
+            # 並行して実行する他のアカウントと同じファイルに記録しないよう、HARはアカウントごとのディレクトリに置く
+            launch_config = self.webdriver_manager.launch_profile.config
+            har_dir, har_file = os.path.split(launch_config["har_path"])
+            launch_config["har_path"] = os.path.join(har_dir, sanitize_account(account), har_file)
+        self.selector_manager = SelectorManager(SELECTORS, SELECTOR_FALLBACKS)
         self.login_manager = LoginManager(
             self.webdriver_manager, 
             self.selector_manager, 
             self.credentials, 
             self.wait_times
         )
+        self.csv_handler = CSVHandler(FILE_PATHS.get("history_format", "csv"), account)
         self.navigation_manager = NavigationManager(
             self.webdriver_manager,
             self.selector_manager,
             self.login_manager,
-            self.wait_times
+            self.wait_times,
+            os.path.join(os.path.dirname(self.csv_handler.output_path), FILE_PATHS.get("navigation_cache", "navigation_cache.json"))
         )
         self.data_extractor = DataExtractor(
             self.webdriver_manager,
@@ -58,69 +78,212 @@ class MealHistoryScraper:
         
         # その他のコンポーネント
         self.email_sender = EmailSender()
-        self.csv_handler = CSVHandler()
+        self.account = account
+        self.history_writer = HistoryWriter(self.csv_handler)
+        self.history_archive = HistoryArchive(FILE_PATHS.get("archive_dir"), account)
+        # 各フェーズの完了状況と途中結果（履歴ファイルと同じディレクトリに保存）
+        self.checkpoint = RunCheckpoint(
+            os.path.join(os.path.dirname(self.csv_handler.output_path), FILE_PATHS.get("checkpoint_dir", "checkpoint"))
+        )
+        self.deadline = Deadline()
+        self.extracted_count = 0
+        
+        # 失敗した遷移・クリック・明細の解析はその単位で再試行する（サイト停止時はサーキットブレーカーで止める）
+        self.retrier = Retrier()
+        for component in (self.webdriver_manager, self.login_manager, self.navigation_manager, self.data_extractor):
+            component.retrier = self.retrier
+    
+    def run(self, resume: bool = False) -> bool:
+        """スクレイピングを実行（resume=True の場合は前回の実行の完了済みフェーズをスキップする）"""
+        state = self.checkpoint.load() if resume else {}
+        if state:
+            # 前回の実行IDを引き継ぎ、イベントログで同じ実行として追跡できるようにする
+            run_id = start_run(self.account, state.get("run_id"))
+            logger.info(f"食事履歴スクレイピングを再開します（実行ID: {run_id}, 残りのフェーズ: {self.checkpoint.pending_phases()}）")
+        else:
+            if resume:
+                logger.info("再開できるチェックポイントがないため、最初から実行します")
+            run_id = start_run(self.account)
+            self.checkpoint.start(run_id)
+            logger.info(f"食事履歴スクレイピングを開始します（実行ID: {run_id}）")
+        
+        # 実行全体の期限を作成し、各マネージャーの待機を残り時間までに制限する
+        self._set_deadline(Deadline(self.wait_times.get("run_deadline")))
+        self.extracted_count = 0
+        
+        with event_phase("run") as event:
+            success = self._run()
+            if not success:
+                event["status"] = "failed"
+            if self.deadline.expired:
+                event["deadline_exceeded"] = True
+        
+        pending = self.checkpoint.pending_phases()
+        if self.deadline.expired:
+            logger.error(
+                f"実行時間の上限（{self.deadline.seconds:.0f}秒）を超えたため中断しました: "
+                f"抽出 {self.extracted_count}件, 完了 {self.checkpoint.completed_phases()}, 未完了 {pending}"
+            )
+        if pending:
+            logger.warning(f"未完了のフェーズがあります: {pending}（--resume で続きから再開できます）")
+        else:
+            self.checkpoint.clear()
+        return success
     
-    def run(self) -> bool:
-        """スクレイピングを実行"""
+    def _run(self) -> bool:
+        """スクレイピングの各フェーズを実行"""
         try:
-            logger.info("食事履歴スクレイピングを開始します")
             
-            # WebDriverをセットアップ
-            if not self.webdriver_manager.setup_driver():
-                logger.error("WebDriverのセットアップに失敗しました")
+            # 抽出まで完了している場合はブラウザを起動せず、保存したレコードから出力だけを行う
+            extracted = self.checkpoint.is_completed("extract")
+            if not extracted and not self._open_usage_detail():
                 return False
             
-            # ログイン
-            if not self.login_manager.login(self.login_url):
-                logger.error("ログインに失敗しました")
-                return False
+            # 食事履歴データを抽出しながら、保存・アーカイブ・メール作成の各スレッドに渡す
+            pipeline = RecordPipeline(self._create_sinks()).start()
+            structured_data = []
+            try:
+                if extracted:
+                    structured_data = self.checkpoint.load_records()
+                    self.extracted_count = len(structured_data)
+                    logger.info(f"チェックポイントからレコードを読み込みました: {len(structured_data)}件")
+                    pipeline.put(structured_data)
+                else:
+                    try:
+                        with event_phase("extract") as event:
+                            for batch in self.data_extractor.iter_meal_batches():
+                                # 出力先に渡す前に検証し、不正なレコードは保存・送信しない
+                                if not self.data_extractor.validate_extracted_data(batch):
+                                    event["status"] = "failed"
+                                    pipeline.abort()
+                                    return self._fail("validate", f"抽出されたデータに問題があるため中断しました（抽出済み {len(structured_data)}件）")
+                                structured_data.extend(batch)
+                                self.extracted_count = len(structured_data)
+                                pipeline.put(batch)
+                            event["records"] = len(structured_data)
+                    except Exception as e:
+                        # 途中で失敗した場合は一部のレコードのみのため、出力先は全レコードに対する処理を行わない
+                        pipeline.abort()
+                        return self._fail("extract", f"食事履歴データの抽出が途中で失敗しました（抽出済み {len(structured_data)}件）: {e}")
+                    
+                    if self.deadline.expired:
+                        # 一部のレコードのみのため、出力先は全レコードに対する処理（統合・メール）を行わない
+                        pipeline.abort()
+                        return self._fail("deadline", f"実行時間の上限を超えたため抽出を中断しました（抽出済み {len(structured_data)}件）")
+                    if not structured_data:
+                        return self._fail("extract", "食事履歴データの取得に失敗しました")
+                    self.checkpoint.save_records(structured_data)
+                    self.checkpoint.complete("extract", records=len(structured_data))
+                
+                # 抽出が終わった時点で出力先の処理を始め、並行してブラウザを解放する
+                pipeline.end_input()
+                self.webdriver_manager.cleanup(wait_time=0)
+            finally:
+                results = pipeline.close()
             
-            # 食事履歴ページに遷移
-            if not self.navigation_manager.navigate_to_meal_history():
-                logger.error("食事履歴ページへの遷移に失敗しました")
-                return False
-            
-            # ご利用明細を選択
-            if not self.navigation_manager.select_usage_detail():
-                logger.error("ご利用明細の選択に失敗しました")
-                return False
-            
-            # 食事履歴データを抽出
-            structured_data = self.data_extractor.extract_meal_data()
-            
-            if not structured_data:
-                logger.error("食事履歴データの取得に失敗しました")
-                return False
-            
-            # データの妥当性をチェック
-            if not self.data_extractor.validate_extracted_data(structured_data):
-                logger.warning("抽出されたデータに問題があります")
+            for name, ok in results.items():
+                if ok:
+                    self.checkpoint.complete(name)
             
             # データサマリーを取得
             summary = self.data_extractor.get_data_summary(structured_data)
             logger.info(f"データ抽出完了: {summary}")
             
-            # CSVファイルに保存
-            csv_path = self.csv_handler.save_data(structured_data)
-            if csv_path:
-                logger.info(f"CSVファイルに保存しました: {csv_path}")
-            
-            # メール通知を送信
-            self.email_sender.send_notification(structured_data)
+            failed = [name for name, ok in results.items() if not ok]
+            if failed:
+                logger.error(f"一部の出力に失敗しました: {failed}")
+                return False
             
             logger.info("食事履歴スクレイピングが完了しました")
             return True
             
         except Exception as e:
-            logger.error(f"スクレイピング実行エラー: {e}")
-            return False
+            return self._fail("run", f"スクレイピング実行エラー: {e}")
         
         finally:
             self.cleanup()
     
+    def _set_deadline(self, deadline: Deadline) -> None:
+        """実行期限を各マネージャーに渡す"""
+        self.deadline = deadline
+        self.retrier.deadline = deadline
+        for component in (self.webdriver_manager, self.login_manager, self.navigation_manager,
+                          self.data_extractor, self.email_sender.smtp_sender):
+            component.deadline = deadline
+    
+    def _open_usage_detail(self) -> bool:
+        """ブラウザを起動してログインし、ご利用明細ページを開く"""
+        session_path = self.checkpoint.session_path
+        logged_in = self.checkpoint.is_completed("login") and os.path.exists(session_path)
+        if logged_in:
+            # 前回の実行のログイン状態を読み込んでコンテキストを作成する
+            self.webdriver_manager.launch_profile.config["storage_state"] = session_path
+        
+        # WebDriverをセットアップ
+        if not self.webdriver_manager.setup_driver():
+            logger.error("WebDriverのセットアップに失敗しました")
+            return False
+        
+        # ログイン
+        if not self.login_manager.login(self.login_url):
+            return self._fail("login", "ログインに失敗しました")
+        if not logged_in:
+            self.webdriver_manager.launch_profile.save_storage_state(self.webdriver_manager.context, session_path)
+            self.checkpoint.complete("login")
+        
+        # ご利用明細ページに遷移（前回のURLに直接遷移し、失敗時は食事履歴ページからリンクをたどる）
+        if not self.navigation_manager.open_usage_detail():
+            return self._fail("navigate", "ご利用明細ページへの遷移に失敗しました")
+        return True
+    
+    def _create_sinks(self) -> List[RecordSink]:
+        """抽出したレコードの出力先を作成（チェックポイントで完了済みの出力先は除く）"""
+        sinks = [
+            # ジャーナルに追記し、履歴ファイルへの統合はバックグラウンドで行う（中断した場合は追記を取り消す）
+            RecordSink("save", on_batch=self.history_writer.append, on_finish=self._commit_history,
+                       on_abort=lambda records: self.history_writer.rollback()),
+            # 月別アーカイブに追記
+            RecordSink("archive", on_finish=self.history_archive.write),
+            # メール通知を送信
+            RecordSink("email", on_finish=self._send_notification),
+        ]
+        sinks = [sink for sink in sinks if not self.checkpoint.is_completed(sink.name)]
+        if any(sink.name == "save" for sink in sinks):
+            self.history_writer.begin()
+        return sinks
+    
+    def _commit_history(self, structured_data: List[Dict[str, Any]]) -> bool:
+        """抽出が完了した実行の追記を確定し、履歴ファイルへの統合を要求"""
+        self.history_writer.commit()
+        self.history_writer.request_compaction()
+        return True
+    
+    def _send_notification(self, structured_data: List[Dict[str, Any]]) -> bool:
+        """メール通知を送信（作成済みのメールがあれば同じ本文・Message-IDで再送する）"""
+        if not self.email_sender.config_manager.config.is_valid():
+            # メールを使わない設定では送信しないことを完了として扱う（チェックポイントを残さない）
+            logger.info("メール設定がないため、メール送信をスキップします")
+            return True
+        message = self.checkpoint.load_message()
+        if message:
+            html_body, message_id = message
+        else:
+            html_body, message_id = self.email_sender.render_notification(structured_data, self.history_archive), make_msgid()
+            self.checkpoint.save_message(html_body, message_id)
+        return self.email_sender.send_rendered(html_body, message_id)
+    
+    def _fail(self, phase: str, message: str) -> bool:
+        """失敗をログに記録し、失敗時のページのスナップショットを取得"""
+        logger.error(message)
+        self.webdriver_manager.capture_debug_snapshot(phase, failed=True)
+        return False
+    
     def cleanup(self) -> None:
         """リソースをクリーンアップ"""
+        self.selector_manager.log_stats()
         self.webdriver_manager.cleanup()
+        # 未統合のジャーナルを履歴ファイルに統合
+        self.history_writer.close()
     
     def get_data_summary(self) -> Optional[Dict[str, Any]]:
         """データサマリーを取得（テスト用）"""
@@ -133,12 +296,8 @@ class MealHistoryScraper:
             if not self.login_manager.login(self.login_url):
                 return None
             
-            # 食事履歴ページに遷移
-            if not self.navigation_manager.navigate_to_meal_history():
-                return None
-            
-            # ご利用明細を選択
-            if not self.navigation_manager.select_usage_detail():
+            # ご利用明細ページに遷移
+            if not self.navigation_manager.open_usage_detail():
                 return None
             
             # 食事履歴データを抽出
@@ -157,10 +316,50 @@ class MealHistoryScraper:
         finally:
             self.cleanup()
 
+def load_account_credentials(account: str) -> Optional[Tuple[str, str]]:
+    """アカウントごとの認証情報（accounts/<アカウント>/.credentials）を読み込み"""
+    path = os.path.join(FILE_PATHS.get("accounts_dir", "accounts"), sanitize_account(account), ".credentials")
+    email, password = CredentialManager().load_encrypted_credentials(path)
+    return (email, password) if email and password else None
+
+def run_accounts(accounts: List[str], resume: bool = False) -> Dict[str, bool]:
+    """複数アカウントをホストごとのレート制限と適応的な並列数で実行"""
+    controller = AdaptiveConcurrency(SCHEDULER_CONFIG)
+    rate_limiter = HostRateLimiter(SCHEDULER_CONFIG, controller)
+    
+    def run_account(account: str) -> bool:
+        credentials = load_account_credentials(account)
+        if not credentials:
+            logger.error(f"認証情報がありません: {account}")
+            return False
+        scraper = MealHistoryScraper(account, credentials)
+        # すべてのアカウントのブラウザで同じレート制限を共有する
+        scraper.webdriver_manager.rate_limiter = rate_limiter
+        return scraper.run(resume=resume)
+    
+    return AccountScheduler(run_account, controller, SCHEDULER_CONFIG).run(accounts)
+
 def main():
     """メイン実行関数"""
-    scraper = MealHistoryScraper()
-    success = scraper.run()
+    parser = argparse.ArgumentParser(description="広島大学生協の食事履歴を取得")
+    parser.add_argument("--resume", action="store_true", help="前回失敗した実行を完了済みのフェーズの次から再開する")
+    parser.add_argument("--profile", nargs="?", const=",".join(PROFILE_CONFIG["phases"]), metavar="PHASES",
+                        help="指定したフェーズ（カンマ区切り。省略時は主要なフェーズ）をcProfileとtracemallocで計測する")
+    parser.add_argument("--accounts", metavar="ACCOUNTS",
+                        help="複数アカウント（カンマ区切り）をレート制限付きで並行して実行する")
+    args = parser.parse_args()
+    
+    profiler = PhaseProfiler(args.profile.split(",")).start() if args.profile else None
+    try:
+        if args.accounts:
+            results = run_accounts([account.strip() for account in args.accounts.split(",") if account.strip()], args.resume)
+            success = bool(results) and all(results.values())
+        else:
+            scraper = MealHistoryScraper()
+            success = scraper.run(resume=args.resume)
+    finally:
+        if profiler:
+            profiler.stop()
     
     if success:
         logger.info("スクレイピングが正常に完了しました")
@@ -11,12 +11,20 @@ from getpass import getpass
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from utils.encryption import CredentialManager
+from utils.csv_handler import sanitize_account, FILE_PATHS
 
 def main():
-    """メイン実行関数"""
+    """メイン実行関数（引数にアカウント名を指定した場合はアカウントごとの認証情報を保存）"""
     print("🔐 認証情報セットアップ")
     print("=" * 50)
     
+    file_path = '.credentials'
+    if len(sys.argv) > 1:
+        account_dir = os.path.join(FILE_PATHS["accounts_dir"], sanitize_account(sys.argv[1]))
+        os.makedirs(account_dir, exist_ok=True)
+        file_path = os.path.join(account_dir, '.credentials')
+        print(f"👤 アカウント: {sys.argv[1]}")
+    
     # メールアドレスを入力
     print("📧 メールアドレスを入力してください:")
     email = input("メールアドレス: ").strip()
@@ -45,9 +53,9 @@ def main():
     # 認証情報を暗号化して保存
     credential_manager = CredentialManager(master_password)
     
-    if credential_manager.save_encrypted_credentials(email, password):
+    if credential_manager.save_encrypted_credentials(email, password, file_path):
         print("✅ 認証情報の暗号化・保存が完了しました")
-        print("📁 保存先: .credentials")
+        print(f"📁 保存先: {file_path}")
         print("\n⚠️  注意事項:")
         print("   - .credentialsファイルは安全に保管してください")
         print("   - マスターパスワードを忘れないでください")
@@ -4,12 +4,16 @@
 """
 
 import logging
+import tempfile
+from datetime import datetime, timedelta
 from utils import (
     DataProcessor, 
     HTMLTemplateGenerator, 
     EmailConfigManager, 
     SMTPSender, 
-    EmailSender
+    EmailSender,
+    MealAnalytics,
+    HistoryArchive
 )
 
 # ログ設定
@@ -56,6 +60,78 @@ def test_data_processor():
     filtered_data = DataProcessor.filter_recent_week_data(test_data)
     logger.info(f"フィルタリング結果: {len(filtered_data)}件")
 
+def test_date_normalization():
+    """日付正規化機能のテスト"""
+    logger.info("=== 日付正規化機能テスト ===")
+    
+    now = datetime(2025, 1, 5)
+    test_data = [
+        {'date': '1月3日(金[4])', 'hour': '12:10', 'menus': ['*豆腐'], 'amount': '¥280'},
+        {'date': '12月30日(月[0])', 'hour': '18:21', 'menus': ['*ﾗｲｽM'], 'amount': '¥110'},
+        {'date': '12月30日(月[0])', 'hour': '12:00', 'menus': ['*味噌汁'], 'amount': '¥66'},
+    ]
+    
+    DataProcessor.normalize_records(test_data, now)
+    assert test_data[0]['parsed_date'] == datetime(2025, 1, 3)
+    assert test_data[1]['parsed_date'] == datetime(2024, 12, 30)
+    assert test_data[1]['weekday'] == '月'
+    assert test_data[1]['date_label'] == '12月30日'
+    assert DataProcessor.format_record_date(test_data[0]) == '1月3日 (金)'
+    
+    # グループ化は文字列順ではなく日付順
+    grouped = DataProcessor.group_data_by_date(test_data)
+    assert DataProcessor.sort_group_keys(grouped) == ['2025-01-03', '2024-12-30']
+    assert len(grouped['2024-12-30']) == 2
+
+def test_year_resolution():
+    """年をまたぐ履歴の日付確定テスト"""
+    logger.info("=== 日付確定機能テスト ===")
+    
+    # 新しい順: 2025/1 → 2024/12 → 2024/1 → 2023/12
+    now = datetime(2025, 1, 5)
+    test_data = [{'date': d} for d in ['1月3日(金[4])', '12月30日(月[0])', '1月10日(水[2])', '12月28日(木[3])']]
+    DataProcessor.resolve_dates(test_data, now)
+    resolved = [data['resolved_date'] for data in test_data]
+    assert resolved == ['2025-01-03', '2024-12-30', '2024-01-10', '2023-12-28']
+    
+    # 確定済みの日付は再推定しない
+    test_data[0]['resolved_date'] = '2020-01-03'
+    test_data.append({'date': '11月1日(金[4])'})
+    DataProcessor.resolve_dates(test_data, now)
+    assert test_data[0]['resolved_date'] == '2020-01-03'
+    assert test_data[-1]['resolved_date'] == '2023-11-01'
+
+def test_meal_analytics():
+    """利用分析機能のテスト"""
+    logger.info("=== 利用分析機能テスト ===")
+    
+    test_data = [
+        {'date': '7月2日(水[2])', 'resolved_date': '2025-07-02', 'hour': '12:10', 'menus': ['*ﾗｲｽM', '*豆腐'], 'amount': '¥1,200'},
+        {'date': '7月1日(火[1])', 'resolved_date': '2025-07-01', 'hour': '08:05', 'menus': ['*豆腐'], 'amount': '308円'},
+        {'date': '6月29日(日[6])', 'resolved_date': '2025-06-29', 'hour': '18:21', 'menus': ['*ﾗｲｽM'], 'amount': '946円'},
+    ]
+    
+    analytics = MealAnalytics.from_records(test_data)
+    assert analytics.frame['amount'].tolist() == [1200, 308, 946]
+    
+    daily = analytics.daily_spend()
+    assert len(daily) == 4  # 6/29〜7/2（記録のない6/30は0円）
+    assert daily.loc['2025-06-30'] == 0
+    assert analytics.monthly_spend().tolist() == [946, 1508]
+    assert analytics.meals_per_time_slot().to_dict() == {'朝食': 1, '昼食': 1, '夕食': 1, 'その他': 0}
+    
+    summary = analytics.get_summary(today=datetime(2025, 7, 3).date())
+    assert summary["total_amount"] == 2454
+    assert summary["this_month_amount"] == 1508
+    # 今月の記録がない場合は最後の記録のある月ではなく0円
+    assert analytics.get_summary(today=datetime(2025, 8, 1).date())["this_month_amount"] == 0
+    assert summary["top_menus"][0][1] == 2
+    
+    # 分析セクション付きのHTML生成
+    html = HTMLTemplateGenerator(email_width=300).create_email_body(test_data, analytics_summary=summary)
+    assert "利用分析" in html
+    assert "1,508円" in html
+
 def test_html_template():
     """HTMLテンプレート機能のテスト"""
     logger.info("=== HTMLテンプレート機能テスト ===")
@@ -152,16 +228,46 @@ def test_integrated_email_sender():
     else:
         logger.info("メール設定が不完全なため、送信テストをスキップ")
 
+def test_archive_email_window():
+    """直近10日分と今月分をアーカイブの該当パーティションのみから読み込むテスト"""
+    logger.info("=== アーカイブからのメール作成テスト ===")
+    
+    def record(days_ago, amount):
+        day = datetime.now().date() - timedelta(days=days_ago)
+        return {'date': f'{day.month}月{day.day}日(月)', 'resolved_date': day.isoformat(),
+                'hour': '12:10', 'menus': [f'*定食{days_ago}'], 'amount': f'{amount}円'}
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive = HistoryArchive(tmp_dir)
+        # 前回までの実行で保存したレコード（直近と、期間外の古い月）
+        archive.write([record(3, 500), record(120, 900)])
+        read_paths = []
+        original_read = archive._read_partition
+        archive._read_partition = lambda path: read_paths.append(path) or original_read(path)
+        
+        html = EmailSender(email_width=300).render_notification([record(0, 400)], archive)
+        assert "*定食0" in html and "*定食3" in html
+        assert "*定食120" not in html
+        # 期間外のパーティションは開かない
+        assert 1 <= len(read_paths) <= 2
+        assert all(f"{(datetime.now().date() - timedelta(days=120)):%Y-%m}" not in path for path in read_paths)
+    
+    logger.info("アーカイブからのメール作成テスト完了")
+
 def main():
     """メイン実行関数"""
     logger.info("新しいモジュール構造のテストを開始します")
     
     try:
         test_data_processor()
+        test_date_normalization()
+        test_year_resolution()
+        test_meal_analytics()
         test_html_template()
         test_email_config()
         test_smtp_sender()
         test_integrated_email_sender()
+        test_archive_email_window()
         
         logger.info("すべてのテストが完了しました")
         
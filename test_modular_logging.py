@@ -0,0 +1,211 @@
+"""
+ログ機能のテスト
+キュー経由のログ出力・ローテーション・イベントログ・デバッグスナップショットが正しく動作することを確認
+"""
+
+import os
+import gzip
+import json
+import logging
+import pstats
+import tempfile
+from utils import logger as logger_module
+from utils import event_log
+from utils.debug_snapshot import DebugSnapshotter
+from utils.profiler import PhaseProfiler
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def test_async_logger():
+    """キュー経由のログ出力とローテーションのテスト"""
+    logger.info("=== キュー経由のログ出力テスト ===")
+
+    original_config = dict(logger_module.LOG_CONFIG)
+    original_paths = dict(logger_module.FILE_PATHS)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_file = os.path.join(tmp_dir, "scraper.log")
+        logger_module.FILE_PATHS["logs_dir"] = tmp_dir
+        try:
+            # config.py の LOG_CONFIG と同じ形式で既定値に重ねて指定する（既定値は変更しない）
+            scraper_logger = logger_module.setup_logger("test_async_logger", config={
+                "file": log_file,
+                "max_bytes": 2048,
+                "backup_count": 2,
+                "module_levels": {"utils.data_extractor": "ERROR"},
+            })
+            assert logger_module.LOG_CONFIG == original_config
+            file_handler = logger_module._listeners["test_async_logger"].handlers[0]
+            assert file_handler.baseFilename == os.path.abspath(log_file)
+            assert (file_handler.maxBytes, file_handler.backupCount) == (2048, 2)
+            assert logging.getLogger("utils.data_extractor").level == logging.ERROR
+            for i in range(200):
+                scraper_logger.info(f"ログ出力テスト: {i}")
+            logging.getLogger("utils.data_extractor").warning("抑制される警告")
+            logging.getLogger("utils.csv_handler").info("パッケージのログ")
+            logger_module.stop_logger("test_async_logger")
+
+            # ローテーション済みのファイルはgzip圧縮され、世代数が制限される
+            rotated = sorted(name for name in os.listdir(tmp_dir) if name.endswith(".gz"))
+            assert rotated == ["scraper.log.1.gz", "scraper.log.2.gz"]
+            with gzip.open(os.path.join(tmp_dir, rotated[0]), "rt", encoding="utf-8") as f:
+                assert "ログ出力テスト" in f.read()
+
+            # キューに残っていたログは停止時に書き出される
+            with open(log_file, "r", encoding="utf-8") as f:
+                content = f.read()
+            assert "ログ出力テスト: 199" in content
+            assert "パッケージのログ" in content
+            assert "抑制される警告" not in content
+        finally:
+            logger_module.LOG_CONFIG.clear()
+            logger_module.LOG_CONFIG.update(original_config)
+            logger_module.FILE_PATHS.update(original_paths)
+            logging.getLogger("utils.data_extractor").setLevel(logging.NOTSET)
+            utils_logger = logging.getLogger("utils")
+            utils_logger.handlers.clear()
+            utils_logger.propagate = True
+
+def test_event_log():
+    """JSON Lines形式のイベントログと集計のテスト"""
+    logger.info("=== イベントログテスト ===")
+
+    class DummyManager:
+        def get_current_url(self):
+            return "https://example.com/meal"
+
+        @event_log.traced("extract")
+        def extract(self):
+            return [{"amount": "308円"}, {"amount": "946円"}]
+
+        @event_log.traced("login")
+        def login(self):
+            return False
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        event_file = os.path.join(tmp_dir, "events.jsonl")
+        logger_module.setup_event_log(event_file)
+        try:
+            assert event_log.is_enabled()
+            run_id = event_log.start_run("alice@example.com")
+            manager = DummyManager()
+            manager.extract()
+            manager.login()
+            with event_log.event_phase("save", records=2):
+                pass
+        finally:
+            logger_module.stop_logger(event_log.event_logger.name)
+        assert not event_log.is_enabled()
+
+        events = list(event_log.iter_events(tmp_dir))
+        assert [event["phase"] for event in events] == ["extract", "login", "save"]
+        assert all(event["run_id"] == run_id and event["account"] == "alice@example.com" for event in events)
+        assert events[0]["records"] == 2
+        assert events[0]["url"] == "https://example.com/meal"
+        assert events[1]["status"] == "failed"
+
+        # フェーズごとの百分位数
+        stats = event_log.phase_latency(events + [{"phase": "save", "duration_ms": 30.0}, {"phase": "save", "duration_ms": 10.0}])
+        assert stats["login"]["failed"] == 1
+        assert stats["save"]["count"] == 3
+        assert stats["save"]["max"] == 30.0
+        assert stats["save"]["p50"] == 10.0
+        assert event_log.phase_latency(events, account="bob@example.com") == {}
+
+def test_debug_snapshot():
+    """デバッグスナップショットの条件付き取得・重複排除・保持数のテスト"""
+    logger.info("=== デバッグスナップショットテスト ===")
+
+    class DummyPage:
+        url = "https://example.com/login"
+
+        def __init__(self):
+            self.html = "<html><body>ログイン</body></html>"
+            self.content_calls = 0
+
+        def content(self):
+            self.content_calls += 1
+            return self.html
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        page = DummyPage()
+
+        # 無効時・成功時はDOMを取得しない
+        assert not DebugSnapshotter({"mode": "off", "dir": tmp_dir}).capture(page, "login", failed=True)
+        snapshotter = DebugSnapshotter({"mode": "failure", "sample_rate": 0.0, "dir": tmp_dir, "max_snapshots": 2})
+        assert not snapshotter.capture(page, "login_page")
+        assert page.content_calls == 0
+
+        # 同じ内容のページは1ファイルにまとめる
+        assert snapshotter.capture(page, "login", failed=True)
+        assert snapshotter.capture(page, "login", failed=True)
+        snapshotter.flush()
+        snapshots = [name for name in os.listdir(tmp_dir) if name.endswith(".html.gz")]
+        assert len(snapshots) == 1
+        with gzip.open(os.path.join(tmp_dir, snapshots[0]), "rt", encoding="utf-8") as f:
+            assert f.read() == page.html
+        with open(os.path.join(tmp_dir, "index.jsonl"), "r", encoding="utf-8") as f:
+            assert len(f.readlines()) == 2
+        # ログイン後のページを含むため所有者のみ読み書き可能
+        assert oct(os.stat(os.path.join(tmp_dir, snapshots[0])).st_mode & 0o777) == "0o600"
+        assert oct(os.stat(os.path.join(tmp_dir, "index.jsonl")).st_mode & 0o777) == "0o600"
+
+        # 保持数を超えた古いスナップショットは削除する
+        for i in range(3):
+            page.html = f"<html><body>{i}</body></html>"
+            snapshotter.capture(page, "navigate", failed=True)
+        snapshotter.flush()
+        remaining = sorted(name for name in os.listdir(tmp_dir) if name.endswith(".html.gz"))
+        assert len(remaining) == 2
+        # 削除したスナップショットの記録は index.jsonl に残さない
+        with open(os.path.join(tmp_dir, "index.jsonl"), "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        assert sorted({entry["file"] for entry in entries}) == remaining
+        assert len(entries) == 2
+
+def test_phase_profiler():
+    """指定したフェーズのみをプロファイルするテスト"""
+    logger.info("=== フェーズプロファイルテスト ===")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        profiler = PhaseProfiler(["render"], run_dir=tmp_dir).start()
+        try:
+            with event_log.event_phase("render"):
+                rows = ["<tr><td>%d</td></tr>" % i for i in range(20000)]
+            with event_log.event_phase("login"):
+                pass
+        finally:
+            profiler.stop()
+
+        # 対象のフェーズのみ .pstats とメモリ確保のレポートを出力する
+        assert sorted(os.listdir(tmp_dir)) == ["01_render.alloc.txt", "01_render.pstats"]
+        assert pstats.Stats(os.path.join(tmp_dir, "01_render.pstats")).total_calls > 0
+        with open(os.path.join(tmp_dir, "01_render.alloc.txt"), "r", encoding="utf-8") as f:
+            report = f.read()
+        assert "phase: render" in report
+        assert "test_modular_logging.py" in report
+
+        # 終了後は event_phase からプロファイラーを呼び出さない
+        with event_log.event_phase("render"):
+            pass
+        assert len(os.listdir(tmp_dir)) == 2
+        assert len(rows) == 20000
+
+def main():
+    """メイン実行関数"""
+    logger.info("ログ機能のテストを開始します")
+
+    try:
+        test_async_logger()
+        test_event_log()
+        test_debug_snapshot()
+        test_phase_profiler()
+
+        logger.info("すべてのテストが完了しました")
+
+    except Exception as e:
+        logger.error(f"テスト実行中にエラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
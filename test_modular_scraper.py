@@ -3,7 +3,12 @@
 各機能が独立して動作することを確認
 """
 
+import os
+import json
+import time
+import threading
 import logging
+import tempfile
 from utils import (
     WebDriverManager,
     SelectorManager,
@@ -11,6 +16,13 @@ from utils import (
     NavigationManager,
     DataExtractor
 )
+from utils.launch_profile import LaunchProfile
+from utils.browser_trace import BrowserTracer
+from utils.deadline import Deadline, DeadlineExceeded
+from utils.retry import Retrier, CircuitBreaker, report_site_failure
+from utils.scheduler import TokenBucket, AdaptiveConcurrency, HostRateLimiter, AccountScheduler
+from utils.pipeline import RecordSink
+from utils.run_checkpoint import RunCheckpoint
 from meal_scraper import MealHistoryScraper
 
 # ログ設定
@@ -83,6 +95,514 @@ def test_selector_manager():
     
     logger.info("セレクター管理機能テスト完了")
 
+class FakeProbePage:
+    """セレクター判定用の簡易Pageオブジェクト（present に含まれるセレクターだけが一致する）
+
+    hidden に含まれるセレクターは存在するが非表示の要素として扱い、表示判定のスクリプトでは一致しない。
+    """
+    
+    def __init__(self, present, hidden=()):
+        self.present = set(present)
+        self.hidden = set(hidden)
+        self.evaluate_calls = 0
+        self.timeouts = []
+    
+    def evaluate(self, script, groups):
+        self.evaluate_calls += 1
+        matched = self.present if "getClientRects" in script else self.present | self.hidden
+        return [next((i for i, selector in enumerate(candidates) if selector in matched), -1) for candidates in groups]
+    
+    def wait_for_function(self, script, arg=None, timeout=None):
+        self.timeouts.append(timeout)
+        if arg and isinstance(arg[0], list):
+            # ページ状態の判定（[状態名, 候補セレクター] のリスト）
+            found = self.evaluate(script, [candidates for _, candidates in arg])
+            values = [state for (state, _), index in zip(arg, found) if index >= 0]
+        else:
+            index = self.evaluate(script, [arg])[0]
+            values = [arg[index]] if index >= 0 else []
+        if not values:
+            raise TimeoutError("Timeout")
+        
+        class Handle:
+            def json_value(self):
+                return values[0]
+        return Handle()
+
+def test_selector_fallbacks():
+    """代替セレクターの判定・キャッシュ・統計のテスト"""
+    logger.info("=== 代替セレクターテスト ===")
+    
+    sm = SelectorManager()
+    primary = sm.get_selector("login_button")
+    assert sm.get_candidates("login_button")[0] == primary
+    
+    # 複数キーを1回の問い合わせで判定
+    page = FakeProbePage([primary, ".history-contents", ".history-contents-date"])
+    resolved = sm.probe(page, ["login_button", "history_articles", "date_element", "detail_elements"], "meal_history")
+    assert page.evaluate_calls == 1
+    assert resolved == {
+        "login_button": primary,
+        "history_articles": ".history-contents",
+        "date_element": ".history-contents-date",
+        "detail_elements": None,
+    }
+    
+    # 一致した代替セレクターはページ種別ごとに優先される
+    assert sm.get_candidates("history_articles", "meal_history")[0] == ".history-contents"
+    assert sm.get_candidates("history_articles")[0] == "article.history-contents"
+    
+    # 待機時はいずれかの候補が現れた時点で一致したセレクターを返す
+    assert sm.wait_for(FakeProbePage(["input[type='submit']"]), "login_button", "login") == "input[type='submit']"
+    assert sm.wait_for(FakeProbePage([]), "usage_detail_link", "meal_top", timeout=10) is None
+    
+    # 待機と状態判定は非表示の要素を一致とみなさない（存在の判定では一致する）
+    hidden_page = FakeProbePage([], hidden=[primary])
+    assert sm.wait_for(hidden_page, "login_button", timeout=10) is None
+    assert sm.probe(hidden_page, ["login_button"]) == {"login_button": primary}
+    
+    stats = sm.get_stats()
+    assert stats["login_button"] == {"primary": 2, "fallback": 1, "miss": 1}
+    assert stats["history_articles"]["fallback"] == 1
+    assert stats["detail_elements"]["miss"] == 1
+    assert stats["usage_detail_link"]["miss"] == 1
+    sm.log_stats()
+    
+    logger.info("代替セレクターテスト完了")
+
+def test_launch_profile():
+    """起動プロファイルのテスト"""
+    logger.info("=== 起動プロファイルテスト ===")
+    
+    class FakeContext:
+        def __init__(self, options):
+            self.options = options
+            self.routes = []
+            self.navigation_timeout = None
+        
+        def set_default_navigation_timeout(self, timeout):
+            self.navigation_timeout = timeout
+        
+        def route(self, pattern, handler):
+            self.routes.append(pattern)
+    
+    class FakeBrowser:
+        def __init__(self):
+            self.new_context_calls = 0
+        
+        def new_context(self, **options):
+            self.new_context_calls += 1
+            return FakeContext(options)
+    
+    profile = LaunchProfile({
+        "headless": True,
+        "window_size": (1280, 720),
+        "user_agent": "TestAgent/1.0",
+        "navigation_timeout": 15000
+    })
+    
+    options = profile.launch_options()
+    assert options["headless"] == True
+    assert "--disable-dev-shm-usage" in options["args"]
+    
+    # 設定のビューポート・UAがテンプレートに反映される
+    browser = FakeBrowser()
+    context = profile.new_context(browser)
+    assert browser.new_context_calls == 1
+    assert context.options["viewport"] == {"width": 1280, "height": 720}
+    assert context.options["user_agent"] == "TestAgent/1.0"
+    assert context.options["locale"] == "ja-JP"
+    assert "storage_state" not in context.options
+    assert context.navigation_timeout == 15000
+    assert profile.context_template() is not profile.context_template()
+    
+    # レート制限がない場合はブロックするリソースのURLだけをルーティングする（他の要求はHTTPキャッシュを使える）
+    assert len(context.routes) == 1
+    pattern = context.routes[0]
+    assert pattern.search("https://example.com/img/logo.PNG?v=2")
+    assert pattern.search("https://example.com/fonts/noto.woff2")
+    assert not pattern.search("https://example.com/app.js")
+    assert not pattern.search("https://example.com/history?page=png")
+    
+    # リソースをブロックしない場合はルーティングしない
+    context = LaunchProfile({"blocked_resources": []}).new_context(browser)
+    assert context.routes == []
+    
+    logger.info("起動プロファイルテスト完了")
+
+def test_har_modes():
+    """通信の記録・再生モードのテスト"""
+    logger.info("=== 通信の記録・再生モードテスト ===")
+    
+    class FakeContext:
+        def __init__(self, options):
+            self.options = options
+            self.routes = []
+        
+        def set_default_navigation_timeout(self, timeout):
+            pass
+        
+        def route(self, pattern, handler):
+            self.routes.append(("route", pattern))
+        
+        def route_from_har(self, har, not_found=None):
+            self.routes.append(("har", har, not_found))
+    
+    class FakeBrowser:
+        def new_context(self, **options):
+            return FakeContext(options)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        har_path = os.path.join(tmp_dir, "har", "flow.har.zip")
+        
+        # 記録モードでは保存先を作成し、コンテキストの記録オプションを設定する
+        profile = LaunchProfile({"har_mode": "record", "har_path": har_path})
+        context = profile.new_context(FakeBrowser())
+        assert context.options["record_har_path"] == har_path
+        assert context.options["record_har_content"] == "attach"
+        assert os.path.isdir(os.path.dirname(har_path))
+        
+        with open(har_path, "w") as f:
+            f.write("{}")
+        profile.finish_recording()
+        assert oct(os.stat(har_path).st_mode & 0o777) == "0o600"
+        
+        # 再生モードではHARのルートが最後に登録され、記録にない要求は中断される
+        context = LaunchProfile({"har_mode": "replay", "har_path": har_path}).new_context(FakeBrowser())
+        assert "record_har_path" not in context.options
+        assert context.routes[-1] == ("har", har_path, "abort")
+        
+        # 再生するHARがない場合はコンテキストを作成しない
+        try:
+            LaunchProfile({"har_mode": "replay", "har_path": os.path.join(tmp_dir, "missing.har")}).new_context(FakeBrowser())
+            assert False, "HARがない場合はエラーになるべき"
+        except FileNotFoundError:
+            pass
+    
+    logger.info("通信の記録・再生モードテスト完了")
+
+def test_browser_trace():
+    """失敗時・低速時のみトレースを保存するテスト"""
+    logger.info("=== ブラウザトレーステスト ===")
+    
+    class FakeTracing:
+        def __init__(self):
+            self.started = 0
+            self.stopped = []
+        
+        def start(self, **options):
+            self.started += 1
+        
+        def stop(self, path=None):
+            self.stopped.append(path)
+            if path:
+                with open(path, "w") as f:
+                    f.write("trace")
+    
+    class FakeContext:
+        def __init__(self):
+            self.tracing = FakeTracing()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 無効時はトレースを記録しない
+        context = FakeContext()
+        assert not BrowserTracer({"mode": "off", "dir": tmp_dir}).start(context)
+        assert context.tracing.started == 0
+        
+        # 成功した短時間の実行のトレースは破棄する
+        tracer = BrowserTracer({"mode": "on", "dir": tmp_dir, "slow_threshold": 60, "max_traces": 2})
+        assert tracer.start(context)
+        assert tracer.stop(context) is None
+        assert context.tracing.stopped == [None]
+        
+        # 失敗した実行のトレースは保存する
+        tracer.start(context)
+        tracer.mark_failed("login")
+        path = tracer.stop(context)
+        assert path.endswith("_failed-login.zip") and os.path.exists(path)
+        assert oct(os.stat(path).st_mode & 0o777) == "0o600"
+        
+        # しきい値を超えた実行のトレースも保存し、保持数を超えた古いものは削除する
+        tracer.config["slow_threshold"] = 0
+        for _ in range(3):
+            tracer.start(context)
+            assert tracer.stop(context).endswith("_slow.zip")
+        assert len(os.listdir(tmp_dir)) == 2
+    
+    logger.info("ブラウザトレーステスト完了")
+
+def test_deadline():
+    """実行期限による待機時間の制限のテスト"""
+    logger.info("=== 実行期限テスト ===")
+    
+    # 無期限の場合は既定のタイムアウトをそのまま使う
+    unlimited = Deadline(0)
+    assert unlimited.timeout_ms(30000) == 30000
+    assert not unlimited.expired
+    
+    # 各待機には残り時間を超えないタイムアウトを渡す
+    deadline = Deadline(0.2)
+    assert 0 < deadline.timeout_ms(30000) <= 200
+    assert deadline.timeout(5) <= 0.2
+    
+    wdm = WebDriverManager({"headless": True})
+    sm = SelectorManager()
+    lm = LoginManager(wdm, sm, ("test@example.com", "password"), {"timeout": 30000})
+    lm.deadline = deadline
+    assert lm._timeout() <= 200
+    de = DataExtractor(wdm, sm, NavigationManager(wdm, sm, lm, {}))
+    de.deadline = deadline
+    assert de._timeout() <= 200
+    
+    # 期限を過ぎた後の待機は DeadlineExceeded で中断する
+    deadline.sleep(1)
+    assert deadline.expired
+    try:
+        lm._timeout()
+        assert False, "期限切れの場合はエラーになるべき"
+    except DeadlineExceeded:
+        pass
+    
+    # スクレイパーは各マネージャーに同じ期限を渡す
+    scraper = MealHistoryScraper()
+    scraper._set_deadline(deadline)
+    assert scraper.navigation_manager.deadline is deadline
+    assert scraper.email_sender.smtp_sender.deadline is deadline
+    
+    logger.info("実行期限テスト完了")
+
+def test_retry_policy():
+    """フェーズごとの再試行とサーキットブレーカーのテスト"""
+    logger.info("=== 再試行・サーキットブレーカーテスト ===")
+    
+    phases = {
+        "navigate_to": {"attempts": 3, "base_delay": 0},
+        "login": {"attempts": 2, "base_delay": 0},
+        "parse": {"attempts": 2, "base_delay": 0}
+    }
+    breaker = CircuitBreaker("test", failure_threshold=4, reset_timeout=60)
+    retrier = Retrier({"phases": phases, "breaker_phases": ["navigate_to", "login"]}, breaker)
+    calls = {"navigate_to": 0, "login": 0, "parse": 0}
+    
+    # 一時的な失敗は同じ単位で再試行する
+    def flaky_navigate():
+        calls["navigate_to"] += 1
+        return calls["navigate_to"] >= 3
+    assert retrier.call("navigate_to", flaky_navigate) is True
+    assert calls["navigate_to"] == 3
+    assert breaker.state == "closed" and breaker.failures == 0
+    
+    # 再試行を使い切った例外は呼び出し元に送出する
+    def broken_parse():
+        calls["parse"] += 1
+        raise ValueError("要素が見つかりません")
+    try:
+        retrier.call("parse", broken_parse)
+        assert False, "例外が送出されるべき"
+    except ValueError:
+        assert calls["parse"] == 2
+    
+    # 内側のフェーズが再試行を使い切った場合、外側のフェーズは再試行しない
+    calls["navigate_to"] = 0
+    def login():
+        calls["login"] += 1
+        return retrier.call("navigate_to", lambda: calls.__setitem__("navigate_to", calls["navigate_to"] + 1))
+    assert not retrier.call("login", login)
+    assert calls["login"] == 1 and calls["navigate_to"] == 3
+    
+    # 認証エラーなどサイト停止でない失敗と、実行期限切れはサーキットブレーカーで数えない
+    for _ in range(3):
+        assert not retrier.call("login", lambda: False)
+    assert breaker.state == "closed" and breaker.failures == 0
+    def expired():
+        raise DeadlineExceeded("実行時間の上限を超えました")
+    calls["login"] = 0
+    def login_over_budget():
+        calls["login"] += 1
+        expired()
+    try:
+        retrier.call("login", login_over_budget)
+        assert False, "DeadlineExceededが送出されるべき"
+    except DeadlineExceeded:
+        assert calls["login"] == 1 and breaker.failures == 0
+    
+    # サイト停止の失敗が連続するとサーキットブレーカーが開き、サイトに要求しない
+    def site_down():
+        report_site_failure("status 503")
+        return False
+    assert not retrier.call("navigate_to", site_down)
+    assert not retrier.call("navigate_to", site_down)
+    assert breaker.state == "open"
+    calls["navigate_to"] = 0
+    assert not retrier.call("navigate_to", flaky_navigate)
+    assert calls["navigate_to"] == 0
+    
+    # 一定時間後に1回だけ試す。試行中のスレッドの入れ子のフェーズは通し、成功すれば閉じる
+    breaker.reset_timeout = 0
+    assert retrier.call("login", lambda: retrier.call("navigate_to", lambda: True)) is True
+    assert breaker.state == "closed"
+    
+    # 半開の試行で入れ子のフェーズがサイト停止で失敗した場合は再び開く
+    breaker.failures = breaker.failure_threshold
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not retrier.call("login", lambda: retrier.call("navigate_to", site_down))
+    assert breaker.state == "open"
+    
+    # 試行が結果を出さずに終わった場合は半開のまま残らず、次の要求で試し直す
+    assert not retrier.call("login", lambda: False)
+    assert breaker.state == "open"
+    assert retrier.call("login", lambda: retrier.call("navigate_to", lambda: True)) is True
+    assert breaker.state == "closed"
+    
+    logger.info("再試行・サーキットブレーカーテスト完了")
+
+def test_account_scheduler():
+    """ホストごとのレート制限と適応的な並列数のテスト"""
+    logger.info("=== 複数アカウントのスケジューラーテスト ===")
+    
+    # トークンバケットは連続して許可する要求数を超えると一定間隔で待たせる
+    bucket = TokenBucket(rate=20, burst=2)
+    start = time.perf_counter()
+    waits = [bucket.acquire() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert time.perf_counter() - start >= 0.09
+    
+    # 実行期限の残り時間（max_wait）に収まらない待機はトークンを消費せずに中断する
+    slow = TokenBucket(rate=1, burst=1)
+    slow.acquire()
+    try:
+        slow.acquire(max_wait=0.05)
+        assert False, "DeadlineExceeded が送出されていません"
+    except DeadlineExceeded:
+        pass
+    assert -0.01 < slow.tokens < 0.1
+    
+    # 対象ホスト（サブドメインを含む）の対象リソースのみ制限する
+    limiter = HostRateLimiter({"hosts": {"cn-univ.coop": {"rate": 1000, "burst": 1}}})
+    assert limiter.is_limited("https://portal.cn-univ.coop/login", "document")
+    assert not limiter.is_limited("https://portal.cn-univ.coop/app.js", "script")
+    assert not limiter.is_limited("https://example.com/", "document")
+    
+    # エラーが多い場合は並列数を半分に、正常な場合は1つずつ増やす
+    controller = AdaptiveConcurrency({"initial_concurrency": 4, "max_concurrency": 5, "window": 4})
+    for _ in range(4):
+        controller.record(latency=0.5, error=True)
+    assert controller.limit == 2
+    for _ in range(4):
+        controller.record(latency=0.5)
+    assert controller.limit == 3
+    for _ in range(4):
+        controller.record(latency=10.0)
+    assert controller.limit == 1
+    
+    # スケジューラーは並列数の範囲で全アカウントを実行する
+    in_flight = {"now": 0, "max": 0}
+    lock = threading.Lock()
+    def run_account(account):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        time.sleep(0.02)
+        with lock:
+            in_flight["now"] -= 1
+        return account != "user3"
+    
+    config = {"start_jitter": 0, "initial_concurrency": 2, "max_concurrency": 4}
+    scheduler = AccountScheduler(run_account, AdaptiveConcurrency(config), config)
+    results = scheduler.run([f"user{i}" for i in range(8)])
+    assert len(results) == 8
+    assert results["user3"] == False and results["user0"] == True
+    assert in_flight["max"] <= 2
+    
+    # レート制限を指定した場合はブロックするリソースがなくてもルーティングする
+    class FakeContext:
+        def __init__(self):
+            self.routes = []
+            self.handlers = []
+            self.listeners = []
+        
+        def set_default_navigation_timeout(self, timeout):
+            pass
+        
+        def route(self, pattern, handler):
+            self.routes.append(pattern)
+            self.handlers.append(handler)
+        
+        def on(self, event, handler):
+            self.listeners.append(event)
+    
+    class FakeBrowser:
+        def new_context(self, **options):
+            return FakeContext()
+    
+    context = LaunchProfile({"blocked_resources": []}).new_context(FakeBrowser(), limiter)
+    assert context.routes == ["**/*"]
+    assert context.listeners == ["response", "requestfinished", "requestfailed"]
+    
+    # 実行期限までに間隔を空けられない要求は送らずに中断する
+    class FakeRoute:
+        def __init__(self, url):
+            self.request = type("Request", (), {"url": url, "resource_type": "document"})()
+            self.result = None
+        
+        def abort(self):
+            self.result = "abort"
+        
+        def continue_(self):
+            self.result = "continue"
+    
+    strict = HostRateLimiter({"hosts": {"cn-univ.coop": {"rate": 1, "burst": 1}}})
+    context = LaunchProfile({"blocked_resources": []}).new_context(FakeBrowser(), strict, Deadline(0.5))
+    routes = [FakeRoute("https://portal.cn-univ.coop/login") for _ in range(2)]
+    for route in routes:
+        context.handlers[0](route)
+    assert [route.result for route in routes] == ["continue", "abort"]
+    
+    logger.info("複数アカウントのスケジューラーテスト完了")
+
+def test_page_state_classifier():
+    """ページ状態判定のテスト"""
+    logger.info("=== ページ状態判定テスト ===")
+    
+    sm = SelectorManager()
+    login_form = sm.get_selector("email_field")
+    second_login = sm.get_selector("second_login_button")
+    mypage = sm.get_selector("meal_history_link")
+    history = sm.get_selector("history_articles")
+    
+    # 複数の目印がある場合は優先度の高い状態を返す
+    assert sm.classify_page(FakeProbePage([login_form])) == "login_form"
+    assert sm.classify_page(FakeProbePage([second_login, mypage])) == "second_login_form"
+    assert sm.classify_page(FakeProbePage([mypage, history])) == "history"
+    assert sm.classify_page(FakeProbePage([mypage])) == "mypage"
+    
+    # 対象の状態を限定した場合はそれ以外の目印を無視する
+    assert sm.classify_page(FakeProbePage([login_form, mypage]), ["mypage"]) == "mypage"
+    assert sm.classify_page(FakeProbePage([]), timeout=10) is None
+    
+    # ログイン状態のチェックはログイン済みの目印で即座に判定する
+    class FakeWebDriverManager:
+        def __init__(self, page):
+            self.page = page
+        
+        def is_ready(self):
+            return True
+        
+        def get_page(self):
+            return self.page
+    
+    config = {"timeout": 30000}
+    assert LoginManager(FakeWebDriverManager(FakeProbePage([mypage])), sm, ("", ""), config).is_logged_in() == True
+    assert LoginManager(FakeWebDriverManager(FakeProbePage([login_form])), sm, ("", ""), config).is_logged_in() == False
+    
+    # 目印がない場合も要素待機のタイムアウトではなく短い確認時間で判定する
+    blank = FakeProbePage([])
+    assert LoginManager(FakeWebDriverManager(blank), sm, ("", ""), config).is_logged_in() == False
+    assert blank.timeouts == [5000]
+    
+    logger.info("ページ状態判定テスト完了")
+
 def test_login_manager():
     """ログイン管理機能のテスト"""
     logger.info("=== ログイン管理機能テスト ===")
@@ -149,6 +669,71 @@ def test_navigation_manager():
     
     logger.info("ナビゲーション管理機能テスト完了")
 
+def test_navigation_cache():
+    """ご利用明細ページへの直接遷移のテスト"""
+    logger.info("=== 遷移先キャッシュテスト ===")
+    
+    sm = SelectorManager()
+    
+    class FakeWebDriverManager:
+        """URLごとに表示される目印を切り替える簡易WebDriverManager"""
+        
+        def __init__(self, pages):
+            self.pages = pages
+            self.page = FakeProbePage([])
+            self.visited = []
+        
+        def get_page(self):
+            return self.page
+        
+        def get_current_url(self):
+            return self.visited[-1] if self.visited else ""
+        
+        def navigate_to(self, url):
+            self.visited.append(url)
+            if url not in self.pages:
+                return False
+            self.page.present = set(self.pages[url])
+            return True
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = os.path.join(tmp_dir, "navigation_cache.json")
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"mypage_url": "https://example.com/mypage", "usage_detail_url": "https://example.com/detail"}, f)
+        
+        # キャッシュしたURLで食事履歴一覧が表示されれば1回の読み込みで完了
+        wdm = FakeWebDriverManager({"https://example.com/detail": [sm.get_selector("history_articles")]})
+        nm = NavigationManager(wdm, sm, None, {"timeout": 10}, cache_path)
+        assert nm.open_usage_detail() == True
+        assert nm.page_loads == 1
+        assert wdm.visited == ["https://example.com/detail"]
+        
+        # 2回目のログインを求められた場合はログイン後に同じURLを開き直し、キャッシュを残す
+        wdm = FakeWebDriverManager({"https://example.com/detail": [sm.get_selector("second_login_button")]})
+        
+        class FakeLoginManager:
+            def perform_second_login(self):
+                wdm.page.present = {sm.get_selector("meal_history_link")}
+                wdm.pages["https://example.com/detail"] = [sm.get_selector("history_articles")]
+                return True
+        
+        nm = NavigationManager(wdm, sm, FakeLoginManager(), {"timeout": 10}, cache_path)
+        assert nm.open_usage_detail() == True
+        assert wdm.visited == ["https://example.com/detail", "https://example.com/detail"]
+        assert nm.page_loads == 2
+        assert nm.nav_cache["usage_detail_url"] == "https://example.com/detail"
+        assert os.path.exists(cache_path)
+        
+        # ログインページに転送された場合はキャッシュを破棄してマイページからたどり直す
+        wdm = FakeWebDriverManager({"https://example.com/detail": [sm.get_selector("email_field")]})
+        nm = NavigationManager(wdm, sm, None, {"timeout": 10}, cache_path)
+        assert nm.open_usage_detail() == False
+        assert wdm.visited == ["https://example.com/detail", "https://example.com/mypage"]
+        assert nm.nav_cache == {}
+        assert not os.path.exists(cache_path)
+    
+    logger.info("遷移先キャッシュテスト完了")
+
 def test_data_extractor():
     """データ抽出機能のテスト"""
     logger.info("=== データ抽出機能テスト ===")
@@ -194,6 +779,62 @@ def test_data_extractor():
     
     logger.info("データ抽出機能テスト完了")
 
+def test_incomplete_extraction():
+    """抽出の途中失敗・不正なレコードで出力先の全レコードに対する処理を行わないことのテスト"""
+    logger.info("=== 抽出の途中失敗テスト ===")
+    
+    valid = [{'date': '12月19日(木)', 'hour': '12:10', 'menus': ['*ﾗｲｽL'], 'amount': '¥580'}]
+    
+    def run_with(batches):
+        scraper = MealHistoryScraper()
+        finished = []
+        scraper._open_usage_detail = lambda: True
+        scraper._create_sinks = lambda: [RecordSink("email", on_finish=finished.append)]
+        scraper.data_extractor.iter_meal_batches = batches
+        scraper.cleanup = lambda: None
+        return scraper._run(), finished, scraper.checkpoint.is_completed("extract")
+    
+    # 途中で失敗した抽出は完了として扱わない
+    def failing_batches():
+        yield valid
+        raise TimeoutError("要素の待機がタイムアウトしました")
+    assert run_with(failing_batches) == (False, [], False)
+    
+    # 必須フィールドが不足したレコードは出力先に渡す前に中断する
+    def invalid_batches():
+        yield valid
+        yield [{'date': '12月18日(水)', 'hour': '12:10', 'menus': []}]
+    assert run_with(invalid_batches) == (False, [], False)
+    
+    logger.info("抽出の途中失敗テスト完了")
+
+def test_sink_results():
+    """出力先の結果による実行結果とチェックポイントのテスト"""
+    logger.info("=== 出力先の結果テスト ===")
+    
+    valid = [{'date': '12月19日(木)', 'hour': '12:10', 'menus': ['*ﾗｲｽL'], 'amount': '¥580'}]
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        scraper = MealHistoryScraper()
+        scraper.checkpoint = RunCheckpoint(tmp_dir)
+        scraper.checkpoint.start("run-1")
+        scraper._open_usage_detail = lambda: True
+        scraper.data_extractor.iter_meal_batches = lambda: iter([valid])
+        scraper.cleanup = lambda: None
+        
+        # メール設定がない場合は送信しないことを完了として扱う
+        scraper.email_sender.config_manager.config.recipient_email = ""
+        scraper._create_sinks = lambda: [RecordSink("email", on_finish=scraper._send_notification)]
+        assert scraper._run() is True
+        assert scraper.checkpoint.is_completed("email")
+        
+        # 出力先が失敗した場合は実行も失敗として扱い、--resume で再実行できるよう未完了のまま残す
+        scraper._create_sinks = lambda: [RecordSink("archive", on_finish=lambda records: False)]
+        assert scraper._run() is False
+        assert "archive" in scraper.checkpoint.pending_phases()
+    
+    logger.info("出力先の結果テスト完了")
+
 def test_integrated_scraper():
     """統合スクレイパーのテスト"""
     logger.info("=== 統合スクレイパーテスト ===")
@@ -214,9 +855,20 @@ def main():
     try:
         test_webdriver_manager()
         test_selector_manager()
+        test_selector_fallbacks()
+        test_launch_profile()
+        test_har_modes()
+        test_browser_trace()
+        test_deadline()
+        test_retry_policy()
+        test_account_scheduler()
+        test_page_state_classifier()
         test_login_manager()
         test_navigation_manager()
+        test_navigation_cache()
         test_data_extractor()
+        test_incomplete_extraction()
+        test_sink_results()
         test_integrated_scraper()
         
         logger.info("すべてのテストが完了しました")
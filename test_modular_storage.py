@@ -0,0 +1,360 @@
+"""
+履歴データ保存機能のテスト
+レコード形式・保存形式が正しく相互変換できることを確認
+"""
+
+import os
+import logging
+import tempfile
+import pandas as pd
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from utils import MealRecord, MealBatch, MealAnalytics, MenuCatalog, CSVHandler, HistoryArchive, HistoryWriter
+from utils.pipeline import RecordPipeline, RecordSink
+from utils.run_checkpoint import RunCheckpoint
+from utils.csv_handler import sanitize_account
+
+# ログ設定
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def create_test_records():
+    """テスト用の食事履歴データを作成（新しい順）"""
+    return [
+        {'date': '7月2日(水[2])', 'resolved_date': '2025-07-02', 'hour': '12:10', 'menus': ['*ﾗｲｽM', '*豆腐'], 'amount': '¥1,200'},
+        {'date': '7月1日(火[1])', 'resolved_date': '2025-07-01', 'hour': '08:05', 'menus': ['*豆腐'], 'amount': '308円'},
+        {'date': '6月29日(日[6])', 'resolved_date': '2025-06-29', 'hour': '18:21', 'menus': ["*店長's カレー"], 'amount': '946円'},
+    ]
+
+def test_meal_record():
+    """食事履歴レコードのテスト"""
+    logger.info("=== 食事履歴レコードテスト ===")
+    
+    data = create_test_records()[0]
+    record = MealRecord.from_dict(data)
+    assert record.amount == 1200
+    assert record.menus == ('*ﾗｲｽM', '*豆腐')
+    assert record.resolved_date.isoformat() == '2025-07-02'
+    assert record.to_dict() == data
+
+def test_meal_batch():
+    """列形式コンテナのテスト"""
+    logger.info("=== 列形式コンテナテスト ===")
+    
+    records = create_test_records()
+    batch = MealBatch.from_records(records)
+    assert len(batch) == 3
+    assert batch.total_amount() == 2454
+    
+    # メニュー名は重複なく登録される
+    assert batch.menu_names == ['*ﾗｲｽM', '*豆腐', "*店長's カレー"]
+    assert list(batch.get_menu_ids(1)) == [batch.get_menu_id('*豆腐')]
+    
+    assert batch[2].amount == 946
+    assert batch.to_records() == records
+    
+    # 列形式から作成した分析結果は辞書形式からの結果と一致する
+    assert MealAnalytics.from_batch(batch).get_summary() == MealAnalytics.from_records(records).get_summary()
+
+def test_menu_catalog():
+    """メニューカタログのテスト"""
+    logger.info("=== メニューカタログテスト ===")
+    
+    catalog = MenuCatalog.from_records(create_test_records())
+    assert catalog.rows_with('*豆腐') == [0, 1]
+    assert catalog.days_with('*豆腐') == [date(2025, 7, 2), date(2025, 7, 1)]
+    assert catalog.frequency_by_month('*ﾗｲｽM') == {'2025-07': 1}
+    assert catalog.most_common(1) == [('*豆腐', 2)]
+    assert catalog.rows_with('未登録') == []
+    
+    # 履歴ファイルの隣に保存・読み込み
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        handler = CSVHandler()
+        handler.output_path = os.path.join(tmp_dir, "meal_history.csv")
+        handler.save_data(create_test_records())
+        
+        loaded = handler.load_menu_catalog()
+        assert os.path.exists(os.path.join(tmp_dir, "meal_history.menu_index.json"))
+        assert loaded.menu_names == catalog.menu_names
+        assert loaded.days_with("*店長's カレー") == [date(2025, 6, 29)]
+
+def test_parquet_storage():
+    """Parquet形式の保存・読み込みテスト"""
+    logger.info("=== Parquet保存テスト ===")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        handler = CSVHandler("parquet")
+        handler.output_path = os.path.join(tmp_dir, "meal_history.parquet")
+        assert handler.save_data(create_test_records()) == handler.output_path
+        
+        loaded = handler.load_data()
+        assert len(loaded) == 3
+        # menus はリストのまま、日付・金額は型付きで読み込まれる
+        assert loaded[2]['menus'] == ["*店長's カレー"]
+        assert loaded[0]['amount_yen'] == 1200
+        assert loaded[0]['resolved_date'] == date(2025, 7, 2)
+        assert MealBatch.from_records(loaded).to_records() == create_test_records()
+
+def test_history_archive():
+    """月別パーティション履歴アーカイブのテスト"""
+    logger.info("=== 履歴アーカイブテスト ===")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive = HistoryArchive(tmp_dir, "user@example.com")
+        assert archive.write(create_test_records()) == 2
+        # 同じデータを再度書き込んでも重複しない
+        archive.write(create_test_records())
+        
+        partitions = archive.get_partitions()
+        assert sorted(partitions) == ['2025-06', '2025-07']
+        assert partitions['2025-07']['rows'] == 2
+        assert os.path.exists(os.path.join(tmp_dir, sanitize_account("user@example.com"), "2025-07.parquet"))
+        
+        # マニフェストから再読み込みしても同じパーティション構成
+        reopened = HistoryArchive(tmp_dir, "user@example.com")
+        july = reopened.read_month(2025, 7)
+        assert [data['amount_yen'] for data in july] == [1200, 308]
+        
+        recent = reopened.read_recent(days=2, today=date(2025, 7, 2))
+        assert len(recent) == 2
+        assert reopened.read(date(2025, 6, 1), date(2025, 6, 30))[0]['menus'] == ["*店長's カレー"]
+
+def test_streaming_reader():
+    """チャンク単位の読み込みテスト"""
+    logger.info("=== ストリーミング読み込みテスト ===")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for storage_format in ("csv", "parquet"):
+            handler = CSVHandler(storage_format)
+            handler.output_path = os.path.join(tmp_dir, os.path.basename(handler.output_path))
+            handler.save_data(create_test_records())
+            
+            assert handler.is_newest_first() is True
+            chunks = list(handler.iter_chunks(chunksize=2))
+            assert [len(chunk) for chunk in chunks] == [2, 1]
+            
+            # 期間指定（範囲外の行は返さない）
+            records = list(handler.iter_records(chunksize=1, start=date(2025, 7, 1)))
+            assert [record['menus'] for record in records] == [['*ﾗｲｽM', '*豆腐'], ['*豆腐']]
+            
+            recent = handler.read_recent(days=1, today=date(2025, 7, 2))
+            assert [record['amount'] for record in recent] == ['¥1,200', '308円']
+        
+        # 古い順に追記されたCSVは末尾から読む
+        handler = CSVHandler()
+        handler.output_path = os.path.join(tmp_dir, "oldest_first.csv")
+        handler.save_data(list(reversed(create_test_records())))
+        assert handler.is_newest_first() is False
+        assert [record['amount'] for record in handler.iter_records_from_end(block_size=16)] == ['¥1,200', '308円', '946円']
+        recent = handler.read_recent(days=1, today=date(2025, 7, 2))
+        assert [record['amount'] for record in recent] == ['¥1,200', '308円']
+        
+        # 確定日付の列がない旧形式のCSV（新しい順）は日付文字列から年を確定して絞り込む
+        legacy_path = os.path.join(tmp_dir, "legacy.csv")
+        legacy = [{key: data[key] for key in ('date', 'hour', 'menus', 'amount')} for data in create_test_records()]
+        pd.DataFrame(legacy).to_csv(legacy_path, index=False, encoding='utf-8-sig')
+        recent = CSVHandler().read_recent(days=1, file_path=legacy_path, today=date(2025, 7, 2))
+        assert [record['amount'] for record in recent] == ['¥1,200', '308円']
+        assert [record['resolved_date'] for record in recent] == ['2025-07-02', '2025-07-01']
+
+def test_history_writer():
+    """ジャーナル付き履歴書き込みのテスト"""
+    logger.info("=== 履歴書き込みテスト ===")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        handler = CSVHandler()
+        handler.output_path = os.path.join(tmp_dir, "meal_history.csv")
+        writer = HistoryWriter(handler)
+        
+        # 複数の書き込みが同時に追記しても行が混ざらない
+        records = create_test_records()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda i: writer.append([records[i % 3]]), range(12)))
+        assert len(writer.read_journal()) == 12
+        
+        # 書き込み途中で停止した行は読み飛ばす
+        with open(writer.journal_path, "a", encoding="utf-8") as f:
+            f.write('{"date": "7月3日')
+        assert len(writer.read_journal()) == 12
+        
+        # 統合後は重複が除外され、ジャーナルは空になる
+        assert writer.compact()
+        loaded = handler.load_data()
+        assert [data['amount'] for data in loaded] == ['¥1,200', '308円', '946円']
+        assert writer.read_journal() == []
+        
+        # 統合スレッド経由でも追記分が反映される
+        writer.append([{'date': '7月3日(木[3])', 'resolved_date': '2025-07-03', 'hour': '12:00', 'menus': ['*豆腐'], 'amount': '66円'}])
+        writer.start_compactor(interval=0.01)
+        assert writer.close()
+        assert [data['amount'] for data in handler.load_data()][:2] == ['66円', '¥1,200']
+        
+        # 確定していない実行の追記は統合せず、取り消せる
+        writer.begin()
+        writer.append(create_test_records()[:1] + [{'date': '7月4日(金[4])', 'resolved_date': '2025-07-04', 'hour': '12:00', 'menus': ['*途中'], 'amount': '1円'}])
+        assert writer.compact()
+        assert len(writer.read_journal()) == 2
+        writer.rollback()
+        assert writer.read_journal() == []
+        # 確定しないまま閉じた場合も取り消す
+        writer.begin()
+        writer.append([{'date': '7月4日(金[4])', 'resolved_date': '2025-07-04', 'hour': '12:00', 'menus': ['*途中'], 'amount': '1円'}])
+        assert writer.close()
+        assert '1円' not in [data['amount'] for data in handler.load_data()]
+        
+        # 一時ファイルが残っていない
+        assert not [name for name in os.listdir(tmp_dir) if name.endswith(".tmp")]
+
+def test_multi_account_archive():
+    """複数アカウントの履歴アーカイブのテスト"""
+    logger.info("=== 複数アカウント履歴アーカイブテスト ===")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive = HistoryArchive(tmp_dir)
+        archive.write(create_test_records(), account="alice@example.com")
+        archive.write(create_test_records()[1:], account="bob@example.com")
+        
+        alice, bob = sanitize_account("alice@example.com"), sanitize_account("bob@example.com")
+        assert archive.list_accounts() == [alice, bob]
+        # アカウントごとに分けて保存される
+        assert len(archive.read(account="bob@example.com")) == 2
+        
+        # 置き換えで同じ名前になるアカウントも別のディレクトリに保存される
+        assert alice.startswith("alice_example.com-")
+        assert sanitize_account("alice_example.com") == "alice_example.com"
+        archive.write(create_test_records()[:1], account="alice_example.com")
+        assert len(archive.read(account="alice@example.com")) == 3
+        assert len(archive.read(account="alice_example.com")) == 1
+        for invalid in ("", ".", ".."):
+            try:
+                sanitize_account(invalid)
+                assert False, "ディレクトリとして使えないアカウント名はエラーになるべき"
+            except ValueError:
+                pass
+        
+        # 月別の合計はマニフェストのみで集計
+        assert archive.monthly_totals(2025, 7) == {
+            alice: {'rows': 2, 'total_amount': 1508},
+            'alice_example.com': {'rows': 1, 'total_amount': 1200},
+            bob: {'rows': 1, 'total_amount': 308},
+        }
+        
+        # 期間指定のアカウント横断集計
+        spend = archive.spend_by_account(date(2025, 6, 1), date(2025, 7, 1))
+        assert spend.loc[alice, 'total_amount'] == 1254
+        assert spend.loc[bob, 'count'] == 2
+
+def test_record_pipeline():
+    """抽出中のレコードを複数の出力先に並行して渡すパイプラインのテスト"""
+    logger.info("=== レコードパイプラインテスト ===")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        handler = CSVHandler()
+        handler.output_path = os.path.join(tmp_dir, "meal_history.csv")
+        writer = HistoryWriter(handler)
+        finished = {}
+        
+        def fail_batch(batch):
+            raise RuntimeError("出力エラー")
+        
+        pipeline = RecordPipeline([
+            RecordSink("save", on_batch=writer.append),
+            RecordSink("email", on_finish=lambda records: finished.setdefault("email", records)),
+            RecordSink("broken", on_batch=fail_batch, on_finish=lambda records: finished.setdefault("broken", records)),
+        ], maxsize=1).start()
+        
+        records = create_test_records()
+        for data in records:
+            pipeline.put([data])
+        results = pipeline.close()
+        
+        # 失敗した出力先があってもほかの出力先は全レコードを受け取る
+        assert results == {"save": True, "email": True, "broken": False}
+        assert len(finished["email"]) == 3
+        assert "broken" not in finished
+        assert len(writer.read_journal()) == 3
+        
+        # 出力先にはコピーが渡され、元のレコードは変更されない
+        finished["email"][0]["extra"] = True
+        assert "extra" not in records[0]
+        
+        # レコードが1件もない場合は全件に対する処理を行わない
+        results = RecordPipeline([RecordSink("email", on_finish=lambda records: finished.setdefault("empty", records))]).start().close()
+        assert results == {"email": True}
+        assert "empty" not in finished
+        
+        # 中断した場合は受け取り済みのレコードのみ処理し、全件に対する処理は行わず失敗として扱う
+        pipeline = RecordPipeline([RecordSink("email", on_batch=lambda batch: None, on_finish=lambda records: finished.setdefault("aborted", records))]).start()
+        pipeline.put(records[:1])
+        pipeline.abort()
+        assert pipeline.close() == {"email": False}
+        assert "aborted" not in finished
+        
+        # 中断した場合は保存先の追記を取り消し、一部のレコードを履歴ファイルに統合しない
+        writer.compact()
+        writer.begin()
+        pipeline = RecordPipeline([RecordSink("save", on_batch=writer.append, on_finish=lambda records: writer.commit(),
+                                              on_abort=lambda records: writer.rollback())]).start()
+        pipeline.put([{'date': '7月4日(金[4])', 'resolved_date': '2025-07-04', 'hour': '12:00', 'menus': ['*途中'], 'amount': '1円'}])
+        pipeline.abort()
+        assert pipeline.close() == {"save": False}
+        assert writer.read_journal() == []
+        assert writer.close()
+        assert '1円' not in [data['amount'] for data in handler.load_data()]
+
+def test_run_checkpoint():
+    """実行チェックポイントの保存と再開のテスト"""
+    logger.info("=== 実行チェックポイントテスト ===")
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint_dir = os.path.join(tmp_dir, "checkpoint")
+        checkpoint = RunCheckpoint(checkpoint_dir)
+        checkpoint.start("run-1")
+        checkpoint.complete("login")
+        checkpoint.save_records(create_test_records())
+        checkpoint.complete("extract", records=3)
+        checkpoint.save_message("<p>本文</p>", "<id@example>")
+        checkpoint.complete("save")
+        
+        # 別のプロセスから読み込むと、完了済みのフェーズと途中結果が復元される
+        resumed = RunCheckpoint(checkpoint_dir)
+        assert resumed.load()["run_id"] == "run-1"
+        assert resumed.completed_phases() == ["login", "extract", "save"]
+        assert resumed.pending_phases() == ["archive", "email"]
+        assert [data["amount"] for data in resumed.load_records()] == ['¥1,200', '308円', '946円']
+        assert resumed.load_message() == ("<p>本文</p>", "<id@example>")
+        assert oct(os.stat(resumed.state_path).st_mode & 0o777) == "0o600"
+        
+        # 新しい実行を開始すると前回の途中結果は破棄される
+        resumed.start("run-2")
+        assert resumed.completed_phases() == []
+        assert resumed.load_records() == []
+        assert resumed.load_message() is None
+        
+        resumed.clear()
+        assert not os.path.exists(checkpoint_dir)
+        assert RunCheckpoint(checkpoint_dir).load() == {}
+
+def main():
+    """メイン実行関数"""
+    logger.info("履歴データ保存機能のテストを開始します")
+    
+    try:
+        test_meal_record()
+        test_meal_batch()
+        test_menu_catalog()
+        test_parquet_storage()
+        test_history_archive()
+        test_streaming_reader()
+        test_history_writer()
+        test_multi_account_archive()
+        test_record_pipeline()
+        test_run_checkpoint()
+        
+        logger.info("すべてのテストが完了しました")
+        
+    except Exception as e:
+        logger.error(f"テスト実行中にエラーが発生しました: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,10 @@
 # 既存のモジュール
 from .logger import setup_logger
 from .csv_handler import CSVHandler
+from .meal_record import MealRecord, MealBatch
+from .menu_catalog import MenuCatalog
+from .history_archive import HistoryArchive
+from .history_writer import HistoryWriter
 from .encryption import CredentialManager
 
 # メール関連モジュール
@@ -14,6 +18,7 @@ from .html_template import HTMLTemplateGenerator
 from .email_config import EmailConfigManager, EmailConfig
 from .smtp_sender import SMTPSender
 from .email_sender import EmailSender
+from .analytics import MealAnalytics
 
 # Webスクレイピング関連モジュール
 from .webdriver_manager import WebDriverManager
@@ -26,6 +31,11 @@ __all__ = [
     # 既存のモジュール
     'setup_logger',
     'CSVHandler',
+    'MealRecord',
+    'MealBatch',
+    'MenuCatalog',
+    'HistoryArchive',
+    'HistoryWriter',
     'CredentialManager',
     
     # メール関連モジュール
@@ -35,6 +45,7 @@ __all__ = [
     'EmailConfig',
     'SMTPSender',
     'EmailSender',
+    'MealAnalytics',
     
     # Webスクレイピング関連モジュール
     'WebDriverManager',
@@ -0,0 +1,186 @@
+"""
+食事履歴分析機能
+履歴データを型付きの列形式に変換し、集計をベクトル演算で行う
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any, Optional
+from datetime import date
+from .data_processor import DataProcessor
+from .meal_record import MealBatch
+
+logger = logging.getLogger(__name__)
+
+# datetime64 の基準日（1970-01-01）の序数
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# 時間帯の区分（時刻の「時」で判定）
+TIME_SLOTS = ["朝食", "昼食", "夕食", "その他"]
+
+def classify_time_slot(hour: str) -> str:
+    """時刻または食事区分の文字列から時間帯を判定"""
+    hour = str(hour)
+    if '朝' in hour:
+        return "朝食"
+    if '昼' in hour:
+        return "昼食"
+    if '夜' in hour or '夕' in hour:
+        return "夕食"
+    try:
+        value = int(hour.split(':')[0])
+    except ValueError:
+        return "その他"
+    if value < 10:
+        return "朝食"
+    if value < 16:
+        return "昼食"
+    return "夕食"
+
+class MealAnalytics:
+    """食事履歴分析クラス"""
+
+    def __init__(self, frame: pd.DataFrame, menu_counts: Optional[pd.Series] = None):
+        self.frame = frame
+        # メニュー別の回数（集計済みの場合は menus 列を展開しない）
+        self.menu_counts = menu_counts
+
+    @classmethod
+    def from_records(cls, structured_data: List[Dict[str, Any]]) -> "MealAnalytics":
+        """構造化データ（新しい順）から分析用のDataFrameを作成"""
+        if not structured_data:
+            return cls(cls._empty_frame())
+
+        # 年が未確定のレコードのみ一度の走査で確定する
+        DataProcessor.resolve_dates(structured_data)
+        df = pd.DataFrame(structured_data, columns=['resolved_date', 'hour', 'menus', 'amount'])
+        return cls.from_frame(df)
+
+    @classmethod
+    def from_batch(cls, batch: MealBatch) -> "MealAnalytics":
+        """列形式コンテナから作成（値は解析済みのため再解析しない）"""
+        if not len(batch):
+            return cls(cls._empty_frame())
+
+        ordinals = np.frombuffer(batch.date_ordinals, dtype=np.int32).astype('int64')
+        valid = ordinals > 0
+        dates = (ordinals - EPOCH_ORDINAL).astype('datetime64[D]').astype('datetime64[ns]')
+        hours = pd.Categorical.from_codes(np.frombuffer(batch.hour_ids, dtype=np.int32), categories=batch.strings)
+        frame = pd.DataFrame({
+            'date': dates,
+            'hour': hours,
+            'time_slot': cls.parse_time_slots(pd.Series(hours)),
+            'amount': np.frombuffer(batch.amounts, dtype=np.int32).astype('int64'),
+        })[valid].reset_index(drop=True)
+
+        # メニュー番号列をそのまま数え上げる（日付が確定しているレコードのみ）
+        menu_ids = np.frombuffer(batch.menu_ids, dtype=np.int32)
+        menu_valid = np.repeat(valid, np.diff(np.frombuffer(batch.menu_offsets, dtype=np.int32)))
+        counts = np.bincount(menu_ids[menu_valid], minlength=len(batch.menu_names))
+        menu_counts = pd.Series(counts, index=batch.menu_names)
+        menu_counts = menu_counts[menu_counts > 0].sort_values(ascending=False, kind='stable')
+        return cls(frame, menu_counts)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "MealAnalytics":
+        """resolved_date / hour / menus / amount 列を持つDataFrameから作成"""
+        frame = pd.DataFrame({
+            'date': cls.parse_dates(df['resolved_date']),
+            'hour': df['hour'].astype('category'),
+            'time_slot': cls.parse_time_slots(df['hour']),
+            'amount': cls.parse_amounts(df['amount']),
+            'menus': df['menus'],
+        })
+        frame = frame[frame['date'].notna()].reset_index(drop=True)
+        logger.info(f"分析用データを作成しました: {len(frame)}件")
+        return cls(frame)
+
+    @staticmethod
+    def _empty_frame() -> pd.DataFrame:
+        """空の分析用DataFrameを作成"""
+        return pd.DataFrame({
+            'date': pd.Series([], dtype='datetime64[ns]'),
+            'hour': pd.Series([], dtype='category'),
+            'time_slot': pd.Categorical([], categories=TIME_SLOTS),
+            'amount': pd.Series([], dtype='int64'),
+            'menus': pd.Series([], dtype='object'),
+        })
+
+    @staticmethod
+    def parse_amounts(amounts: pd.Series) -> pd.Series:
+        """'946円' や '¥1,200' 形式の金額を整数に変換（ユニーク値のみ解析）"""
+        codes, uniques = pd.factorize(amounts.astype(str))
+        digits = pd.Series(uniques).str.replace(r'[^\d]', '', regex=True)
+        values = pd.to_numeric(digits, errors='coerce').fillna(0).astype('int64').to_numpy()
+        # 欠損値（コード-1）は0円として扱う
+        return pd.Series(np.where(codes >= 0, values[codes], 0), index=amounts.index, dtype='int64')
+
+    @staticmethod
+    def parse_dates(dates: pd.Series) -> pd.Series:
+        """YYYY-MM-DD 形式の確定日付をdatetime64に変換（ユニーク値のみ解析）"""
+        codes, uniques = pd.factorize(dates)
+        parsed = pd.to_datetime(pd.Series(uniques), format='%Y-%m-%d', errors='coerce').to_numpy()
+        values = np.full(len(codes), np.datetime64('NaT'), dtype='datetime64[ns]')
+        valid = codes >= 0
+        values[valid] = parsed[codes[valid]]
+        return pd.Series(values, index=dates.index)
+
+    @staticmethod
+    def parse_time_slots(hours: pd.Series) -> pd.Categorical:
+        """時刻列を時間帯のカテゴリ列に変換（ユニーク値のみ判定）"""
+        codes, uniques = pd.factorize(hours.astype(str))
+        slots = np.array([TIME_SLOTS.index(classify_time_slot(hour)) for hour in uniques], dtype='int8')
+        return pd.Categorical.from_codes(slots[codes], categories=TIME_SLOTS)
+
+    def daily_spend(self) -> pd.Series:
+        """日別の利用金額（記録のない日は0円）"""
+        if self.frame.empty:
+            return pd.Series([], dtype='int64')
+        daily = self.frame.groupby('date')['amount'].sum()
+        full_range = pd.date_range(daily.index.min(), daily.index.max(), freq='D')
+        return daily.reindex(full_range, fill_value=0)
+
+    def weekly_spend(self) -> pd.Series:
+        """週別（月曜始まり）の利用金額"""
+        return self.daily_spend().resample('W-SUN').sum()
+
+    def monthly_spend(self) -> pd.Series:
+        """月別の利用金額"""
+        return self.daily_spend().resample('MS').sum()
+
+    def rolling_average(self, window: int = 7) -> pd.Series:
+        """日別利用金額の移動平均"""
+        return self.daily_spend().rolling(window, min_periods=1).mean()
+
+    def meals_per_time_slot(self) -> pd.Series:
+        """時間帯ごとの食事回数"""
+        return self.frame['time_slot'].value_counts().reindex(TIME_SLOTS, fill_value=0)
+
+    def top_menu_items(self, count: int = 5) -> pd.Series:
+        """よく食べたメニューの上位"""
+        if self.menu_counts is not None:
+            return self.menu_counts.head(count)
+        if self.frame.empty:
+            return pd.Series([], dtype='int64')
+        return self.frame['menus'].explode().dropna().value_counts().head(count)
+
+    def get_summary(self, top_count: int = 3, today: Optional[date] = None) -> Optional[Dict[str, Any]]:
+        """メール表示用のサマリーを取得（今月の利用額は today の月、記録がなければ0円）"""
+        if self.frame.empty:
+            return None
+
+        today = today or date.today()
+        daily = self.daily_spend()
+        monthly = self.monthly_spend()
+        return {
+            "count": len(self.frame),
+            "start_date": daily.index.min().date(),
+            "end_date": daily.index.max().date(),
+            "total_amount": int(self.frame['amount'].sum()),
+            "daily_average": float(daily.mean()),
+            "rolling_average": float(self.rolling_average().iloc[-1]),
+            "this_month_amount": int(monthly.get(pd.Timestamp(today.year, today.month, 1), 0)),
+            "time_slots": {slot: int(n) for slot, n in self.meals_per_time_slot().items()},
+            "top_menus": [(menu, int(n)) for menu, n in self.top_menu_items(top_count).items()],
+        }
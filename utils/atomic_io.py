@@ -0,0 +1,75 @@
+"""
+安全なファイル書き込み機能
+一時ファイル経由のアトミックな置き換えと、プロセス間のファイルロックを提供する
+"""
+
+import os
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+@contextmanager
+def atomic_write(path: str) -> Iterator[str]:
+    """一時ファイルのパスを渡し、書き込みが成功した場合のみ本来のパスに置き換える
+
+    使用例:
+        with atomic_write("meal_history.csv") as tmp_path:
+            df.to_csv(tmp_path)
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    os.close(fd)
+    try:
+        yield tmp_path
+        # ディスクに書き出してから置き換える（途中で停止しても元のファイルは残る）
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        _fsync_directory(directory)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _fsync_directory(directory: str) -> None:
+    """置き換え結果をディレクトリエントリごと永続化（対応OSのみ）"""
+    if fcntl is None:
+        return
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        logger.debug(f"ディレクトリのfsyncをスキップしました: {e}")
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """<path>.lock を排他ロックする（他のプロセス・スレッドの書き込みが終わるまで待機）"""
+    lock_path = f"{path}.lock"
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,102 @@
+"""
+ブラウザトレース機能
+Playwrightのトレース（スクリーンショット・DOMスナップショット・通信時間）を記録し、
+失敗した場合または所要時間がしきい値を超えた場合のみ保存する（それ以外は破棄する）
+"""
+
+import os
+import time
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# トレース設定を直接定義（循環インポート回避）
+TRACE_CONFIG = {
+    "mode": os.getenv("BROWSER_TRACE", "off"),  # "off"（無効）または "on"（失敗時・低速時に保存）
+    "slow_threshold": float(os.getenv("BROWSER_TRACE_SLOW_SECONDS", "60")),  # 成功時にも保存する所要時間（秒）
+    "dir": "debug/traces",
+    "max_traces": 10             # 保持するトレース数（古いものから削除）
+}
+
+class BrowserTracer:
+    """ブラウザトレース管理クラス
+
+    保存先: <dir>/<日時>_<理由>.zip（playwright show-trace <ファイル> で参照）
+    トレースはブラウザコンテキストごとに記録し、コンテキストを閉じる直前に保存するか破棄するかを決める。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**TRACE_CONFIG, **(config or {})}
+        self.trace_dir = self.config["dir"]
+        self._started_at: Optional[float] = None
+        self._failed_label: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        """トレースが有効かどうか"""
+        return self.config["mode"] != "off"
+
+    def start(self, context) -> bool:
+        """コンテキストのトレースを開始"""
+        if not self.enabled or context is None:
+            return False
+        try:
+            context.tracing.start(screenshots=True, snapshots=True)
+            self._started_at = time.perf_counter()
+            self._failed_label = None
+            return True
+        except Exception as e:
+            logger.warning(f"トレース開始エラー: {e}")
+            return False
+
+    def mark_failed(self, label: str) -> None:
+        """記録中のトレースを失敗として保存対象にする"""
+        if self._started_at is not None and self._failed_label is None:
+            self._failed_label = label
+
+    def stop(self, context) -> Optional[str]:
+        """トレースを終了し、失敗時・低速時のみ保存（保存したファイルのパスを返す）"""
+        if self._started_at is None or context is None:
+            return None
+        elapsed = time.perf_counter() - self._started_at
+        self._started_at = None
+
+        if self._failed_label:
+            reason = f"failed-{self._failed_label}"
+        elif elapsed >= self.config["slow_threshold"]:
+            reason = "slow"
+        else:
+            reason = None
+
+        try:
+            if reason is None:
+                context.tracing.stop()
+                logger.debug(f"トレースを破棄しました（{elapsed:.1f}秒）")
+                return None
+
+            os.makedirs(self.trace_dir, exist_ok=True)
+            path = os.path.join(self.trace_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{reason}.zip")
+            context.tracing.stop(path=path)
+            # 入力した認証情報やページの内容を含むため所有者のみ読み書き可能にする
+            os.chmod(path, 0o600)
+            logger.info(f"ブラウザトレースを保存しました（{elapsed:.1f}秒）: {path}")
+            self._apply_retention()
+            return path
+        except Exception as e:
+            logger.warning(f"トレース保存エラー: {e}")
+            return None
+
+    def _apply_retention(self) -> None:
+        """保持数を超えた古いトレースを削除"""
+        traces = [
+            os.path.join(self.trace_dir, name)
+            for name in os.listdir(self.trace_dir) if name.endswith(".zip")
+        ]
+        excess = len(traces) - self.config["max_traces"]
+        if excess <= 0:
+            return
+        for path in sorted(traces, key=os.path.getmtime)[:excess]:
+            os.remove(path)
+            logger.info(f"古いトレースを削除しました: {path}")
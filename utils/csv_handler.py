@@ -8,21 +8,58 @@ import os
 import logging
 import ast
 import re
+import csv
+import hashlib
+from datetime import datetime, timedelta
+from .menu_catalog import MenuCatalog
+from .data_processor import DataProcessor
+from .atomic_io import atomic_write, file_lock
 
 # FILE_PATHSを直接定義
 FILE_PATHS = {
     "csv_output": "meal_history.csv",
+    "parquet_output": "meal_history.parquet",
+    "accounts_dir": "accounts",
     "debug_dir": "debug",
     "logs_dir": "logs"
 }
 
+# 保存形式（"csv" または "parquet"）
+STORAGE_FORMATS = ("csv", "parquet")
+
 logger = logging.getLogger(__name__)
 
+def sanitize_account(account):
+    """アカウント名をディレクトリ名として使える形式に変換
+
+    置き換えた文字がある場合は元のアカウント名のハッシュを付け、別のアカウントが同じディレクトリにならないようにする
+    （例: "a@b.com" → "a_b.com-<ハッシュ8桁>"、"a_b.com" → "a_b.com"）。
+    """
+    if not account or account in (".", ".."):
+        raise ValueError(f"アカウント名として使えません: {account!r}")
+    slug = re.sub(r'[^0-9A-Za-z_.-]', '_', account)
+    if slug != account:
+        slug = f"{slug}-{hashlib.sha256(account.encode('utf-8')).hexdigest()[:8]}"
+    return slug
+
 class CSVHandler:
     """CSVファイル処理クラス"""
     
-    def __init__(self):
-        self.output_path = FILE_PATHS["csv_output"]
+    def __init__(self, storage_format="csv", account=None):
+        if storage_format not in STORAGE_FORMATS:
+            raise ValueError(f"未対応の保存形式です: {storage_format}")
+        self.storage_format = storage_format
+        self.account = account
+        self.output_path = FILE_PATHS[f"{storage_format}_output"]
+        if account:
+            # アカウントごとのディレクトリに分けて保存
+            self.output_path = os.path.join(FILE_PATHS["accounts_dir"], sanitize_account(account), self.output_path)
+            os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+    
+    def get_menu_index_path(self, file_path=None):
+        """履歴ファイルに対応するメニューカタログのパスを取得"""
+        path = file_path or self.output_path
+        return f"{os.path.splitext(path)[0]}.menu_index.json"
     
     def _parse_menus_string(self, menus_str):
         """メニュー文字列をリストに変換"""
@@ -55,27 +92,34 @@ class CSVHandler:
             return [menus_str] if menus_str else []
     
     def save_data(self, structured_data):
-        """構造化データをCSVファイルに保存"""
+        """構造化データを履歴ファイルに保存"""
         try:
             if not structured_data:
                 logger.warning("保存するデータがありません")
                 return None
             
-            # DataFrameを作成
-            df = pd.DataFrame(structured_data)
-            
-            # CSVファイルに保存
-            df.to_csv(self.output_path, index=False, encoding='utf-8-sig')
-            
-            logger.info(f"CSVファイルに保存しました: {self.output_path}")
+            # 他の書き込みと排他し、一時ファイルへの書き込みが完了してから置き換える
+            with file_lock(self.output_path):
+                with atomic_write(self.output_path) as tmp_path:
+                    if self._is_parquet(self.output_path):
+                        self._save_parquet(structured_data, tmp_path)
+                    else:
+                        # DataFrameを作成してCSVファイルに保存
+                        df = pd.DataFrame(structured_data)
+                        df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+                
+                logger.info(f"履歴ファイルに保存しました: {self.output_path}")
+                
+                # 同じ行順でメニューカタログを更新
+                self.save_menu_catalog(structured_data)
             return self.output_path
             
         except Exception as e:
-            logger.error(f"CSVファイル保存エラー: {e}")
+            logger.error(f"履歴ファイル保存エラー: {e}")
             return None
     
     def load_data(self, file_path=None):
-        """CSVファイルからデータを読み込み"""
+        """履歴ファイルからデータを読み込み"""
         try:
             path = file_path or self.output_path
             
@@ -83,21 +127,215 @@ class CSVHandler:
                 logger.warning(f"ファイルが存在しません: {path}")
                 return None
             
-            df = pd.read_csv(path, encoding='utf-8-sig')
-            data = df.to_dict('records')
-            
-            # メニューデータを正しく変換
-            for record in data:
-                if 'menus' in record:
-                    record['menus'] = self._parse_menus_string(record['menus'])
+            if self._is_parquet(path):
+                data = self._load_parquet(path)
+            else:
+                df = pd.read_csv(path, encoding='utf-8-sig')
+                data = df.to_dict('records')
+                
+                # メニューデータを正しく変換
+                for record in data:
+                    if 'menus' in record:
+                        record['menus'] = self._parse_menus_string(record['menus'])
             
-            logger.info(f"CSVファイルから読み込みました: {path}")
+            logger.info(f"履歴ファイルから読み込みました: {path}")
             return data
             
         except Exception as e:
-            logger.error(f"CSVファイル読み込みエラー: {e}")
+            logger.error(f"履歴ファイル読み込みエラー: {e}")
+            return None
+    
+    def _is_parquet(self, path):
+        """Parquet形式のファイルかどうかを判定"""
+        return str(path).endswith(".parquet")
+    
+    @staticmethod
+    def to_typed_frame(structured_data):
+        """menus をリスト列、日付・金額を型付き列としたDataFrameを作成"""
+        DataProcessor.resolve_dates(structured_data)
+        return pd.DataFrame({
+            'date': [data['date'] for data in structured_data],
+            'hour': [data.get('hour', "") for data in structured_data],
+            'menus': [list(data.get('menus') or []) for data in structured_data],
+            'amount': [data.get('amount', "") for data in structured_data],
+            'amount_yen': [DataProcessor.get_amount(data) for data in structured_data],
+            'resolved_date': [DataProcessor.get_resolved_date(data) for data in structured_data],
+        })
+    
+    def _save_parquet(self, structured_data, path):
+        """menus をリスト列、日付・金額を型付き列としてParquetに保存"""
+        df = self.to_typed_frame(structured_data)
+        # pyarrow が必要（未インストールの場合は ImportError）
+        df.to_parquet(path, index=False, engine='pyarrow')
+    
+    def _load_parquet(self, path):
+        """Parquetから読み込み（リスト列・型付き列をそのまま辞書に変換）"""
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pylist()
+    
+    def iter_chunks(self, file_path=None, chunksize=50000, start=None, end=None):
+        """履歴ファイルをDataFrameのチャンク単位で読み込み（期間外の行・チャンクは読み飛ばす）
+        
+        ファイルの並び順を判定し、期間より古い（新しい）チャンクに達した時点で読み込みを終了する。
+        """
+        path = file_path or self.output_path
+        if self._is_parquet(path):
+            chunks = self._iter_parquet_chunks(path, chunksize, start, end)
+        else:
+            chunks = pd.read_csv(path, encoding='utf-8-sig', chunksize=chunksize)
+        
+        has_range = start is not None or end is not None
+        newest_first = self.is_newest_first(path) if has_range else None
+        start_ts = pd.Timestamp(start) if start is not None else None
+        end_ts = pd.Timestamp(end) if end is not None else None
+        
+        for chunk in chunks:
+            if not has_range or 'resolved_date' not in chunk:
+                yield chunk
+                continue
+            
+            dates = pd.to_datetime(chunk['resolved_date'], errors='coerce', format='ISO8601')
+            mask = dates.notna()
+            if start_ts is not None:
+                mask &= dates >= start_ts
+            if end_ts is not None:
+                mask &= dates <= end_ts
+            if mask.any():
+                yield chunk[mask]
+            
+            # 並び順から、以降のチャンクがすべて期間外であれば終了
+            if newest_first is True and start_ts is not None and dates.max() < start_ts:
+                break
+            if newest_first is False and end_ts is not None and dates.min() > end_ts:
+                break
+    
+    def iter_records(self, file_path=None, chunksize=50000, start=None, end=None):
+        """履歴ファイルを1レコードずつ読み込み（メモリ使用量はチャンクサイズ分のみ）"""
+        path = file_path or self.output_path
+        parquet = self._is_parquet(path)
+        for chunk in self.iter_chunks(path, chunksize, start, end):
+            for record in chunk.to_dict('records'):
+                if 'menus' in record:
+                    menus = record['menus']
+                    record['menus'] = list(menus) if parquet else self._parse_menus_string(menus)
+                yield record
+    
+    def iter_records_from_end(self, file_path=None, block_size=65536):
+        """CSVファイルを末尾から1行ずつ逆順に読み込み（古い順に追記されたファイル用）"""
+        path = file_path or self.output_path
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            header = next(csv.reader([f.readline()]))
+        
+        for line in self._iter_lines_from_end(path, block_size):
+            values = next(csv.reader([line]))
+            record = dict(zip(header, values))
+            if 'menus' in record:
+                record['menus'] = self._parse_menus_string(record['menus'])
+            if record.get('amount_yen'):
+                record['amount_yen'] = int(record['amount_yen'])
+            yield record
+    
+    def _iter_lines_from_end(self, path, block_size):
+        """ファイル末尾からブロック単位で読み、ヘッダー以外の行を逆順に返す"""
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b''
+            while position > 0:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                lines = (f.read(read_size) + remainder).split(b'\n')
+                # 先頭の行はブロック境界で途切れている可能性があるため次のブロックに持ち越す
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        yield line.decode('utf-8').rstrip('\r')
+            # 最後に残る remainder はヘッダー行
+    
+    def _iter_parquet_chunks(self, path, chunksize, start, end):
+        """Parquetをバッチ単位で読み込み（統計情報で期間外の行グループを読み飛ばす）"""
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        names = parquet_file.schema_arrow.names
+        date_index = names.index('resolved_date') if 'resolved_date' in names else None
+        
+        for row_group in range(parquet_file.num_row_groups):
+            if date_index is not None:
+                stats = parquet_file.metadata.row_group(row_group).column(date_index).statistics
+                if stats is not None and stats.has_min_max:
+                    if (start is not None and stats.max < start) or (end is not None and stats.min > end):
+                        continue
+            for batch in parquet_file.iter_batches(batch_size=chunksize, row_groups=[row_group]):
+                yield batch.to_pandas()
+    
+    def is_newest_first(self, file_path=None):
+        """履歴ファイルが新しい順に並んでいるかを先頭・末尾の行で判定（判定できない場合はNone）"""
+        path = file_path or self.output_path
+        try:
+            if self._is_parquet(path):
+                import pyarrow.parquet as pq
+                parquet_file = pq.ParquetFile(path, memory_map=True)
+                last_group = parquet_file.num_row_groups - 1
+                first = parquet_file.read_row_group(0, columns=['resolved_date']).column(0)[0].as_py()
+                last = parquet_file.read_row_group(last_group, columns=['resolved_date']).column(0)[-1].as_py()
+            else:
+                first = DataProcessor.get_resolved_date(pd.read_csv(path, encoding='utf-8-sig', nrows=1).to_dict('records')[0])
+                last = DataProcessor.get_resolved_date(next(self.iter_records_from_end(path)))
+            if first is None or last is None or first == last:
+                return None
+            return first > last
+        except Exception as e:
+            logger.warning(f"並び順の判定エラー: {e}")
             return None
     
+    def read_recent(self, days=10, file_path=None, today=None):
+        """直近の指定日数分のレコードを新しい順に取得（ファイル全体は読み込まない）"""
+        path = file_path or self.output_path
+        if not os.path.exists(path):
+            logger.warning(f"ファイルが存在しません: {path}")
+            return []
+        
+        today = today or datetime.now().date()
+        start = today - timedelta(days=days)
+        
+        if not self._is_parquet(path) and self.is_newest_first(path) is False:
+            # 古い順のCSVは末尾から読み、期間より古い行に達したら終了
+            records = []
+            for record in self.iter_records_from_end(path):
+                resolved = DataProcessor.get_resolved_date(record)
+                if resolved is not None and resolved < start:
+                    break
+                if resolved is not None and resolved <= today:
+                    records.append(record)
+        else:
+            records = list(self.iter_records(path, start=start, end=today))
+            if any(DataProcessor.get_resolved_date(record) is None for record in records):
+                # 確定日付を持たない旧形式の履歴は、ファイルの並び（新しい順）から年を確定して期間で絞り込む
+                DataProcessor.resolve_dates(records, now=datetime.combine(today, datetime.min.time()))
+                records = [
+                    record for record in records
+                    if DataProcessor.get_resolved_date(record) is not None
+                    and start <= DataProcessor.get_resolved_date(record) <= today
+                ]
+            records.sort(key=DataProcessor.get_resolved_date, reverse=True)
+        
+        logger.info(f"直近{days}日分を読み込みました: {len(records)}件")
+        return records
+    
+    def save_menu_catalog(self, structured_data, file_path=None):
+        """メニューカタログ（転置インデックス）を履歴ファイルの隣に保存"""
+        try:
+            catalog = MenuCatalog.from_records(structured_data)
+            return catalog.save(self.get_menu_index_path(file_path))
+        except Exception as e:
+            logger.warning(f"メニューカタログ作成エラー: {e}")
+            return False
+    
+    def load_menu_catalog(self, file_path=None):
+        """履歴ファイルに対応するメニューカタログを読み込み"""
+        return MenuCatalog.load(self.get_menu_index_path(file_path))
+    
     def get_file_info(self, file_path=None):
         """CSVファイルの情報を取得"""
         try:
@@ -5,10 +5,14 @@ Webページから食事履歴データを抽出する
 
 import logging
 from playwright.sync_api import Page
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterator
 from .webdriver_manager import WebDriverManager
 from .selector_manager import SelectorManager
 from .navigation_manager import NavigationManager
+from .data_processor import DataProcessor
+from .event_log import traced
+from .deadline import Deadline
+from .retry import retried
 
 logger = logging.getLogger(__name__)
 
@@ -19,82 +23,117 @@ class DataExtractor:
         self.webdriver_manager = webdriver_manager
         self.selector_manager = selector_manager
         self.navigation_manager = navigation_manager
+        self.deadline = Deadline()  # 実行期限（MealHistoryScraper.run で設定）
+        self.retrier = None  # 再試行（MealHistoryScraper で設定。未設定の場合は再試行しない）
     
+    def _timeout(self) -> int:
+        """要素の取得のタイムアウト（ミリ秒、Playwrightの既定の30秒を実行期限の残り時間までに制限）"""
+        return self.deadline.timeout_ms(30000, "extract")
+    
+    @traced("extract")
     def extract_meal_data(self) -> List[Dict[str, Any]]:
         """食事履歴データを抽出"""
+        structured_data = [data for batch in self.iter_meal_batches() for data in batch]
+        logger.info(f"食事履歴データの抽出が完了しました。取得件数: {len(structured_data)}")
+        return structured_data
+    
+    def iter_meal_batches(self) -> Iterator[List[Dict[str, Any]]]:
+        """食事履歴データを記事（日付）ごとに抽出して順に返す
+
+        記事は新しい順に並んでいるため、直前までに確定した日付を基準にして記事ごとに年を確定する。
+        途中で失敗した場合は例外を送出する（一部のレコードを完了した抽出として扱わないため）。
+        """
         try:
             logger.info("食事履歴データの抽出を開始します")
             
             if not self.webdriver_manager.is_ready():
                 logger.error("Playwrightブラウザが初期化されていません")
-                return []
+                return
             
             page = self.webdriver_manager.get_page()
             
             if not page:
                 logger.error("Pageオブジェクトが初期化されていません")
-                return []
+                return
             
             # 「もっと見る」ボタンをクリック
             self.navigation_manager.click_more_button()
             
-            # 食事履歴記事を取得
+            # 食事履歴記事を取得（記事・日付・明細のセレクターを1回のDOM問い合わせで判定）
             selectors = self.selector_manager.get_data_extraction_selectors()
+            resolved = self.selector_manager.probe(page, ["history_articles", "date_element", "detail_elements"], "meal_history")
+            if not resolved["history_articles"]:
+                return
+            selectors.update({key: selector for key, selector in resolved.items() if selector})
             history_articles = page.locator(selectors["history_articles"]).all()
             logger.info(f"発見された食事履歴記事数: {len(history_articles)}")
             
-            structured_data = []
-            
+            anchor = None  # 年の確定に使う直前のレコード
             for article in history_articles:
+                if self.deadline.expired:
+                    # 抽出済みのレコードは返したまま中断する
+                    logger.warning("実行時間の上限を超えたため抽出を中断します")
+                    return
+                batch = self._parse_article(article, selectors)
+                if not batch:
+                    continue
+                DataProcessor.resolve_dates(([anchor] if anchor else []) + batch)
+                anchor = next((data for data in reversed(batch) if data.get('resolved_date')), anchor)
+                yield batch
+            
+        except Exception as e:
+            logger.error(f"食事履歴データ抽出エラー: {e}")
+            raise
+    
+    def _parse_article(self, article, selectors: Dict[str, str]) -> List[Dict[str, Any]]:
+        """1つの記事（日付）から明細のレコードを取得"""
+        batch = []
+        try:
+            # 日付情報を取得
+            date_element = article.locator(selectors["date_element"])
+            month = date_element.locator(selectors["month_span"]).text_content(timeout=self._timeout()) or ""
+            date = date_element.locator(selectors["date_span"]).text_content(timeout=self._timeout()) or ""
+            day = date_element.locator(selectors["day_span"]).text_content(timeout=self._timeout()) or ""
+            date_str = f"{month.strip()}月{date.strip()}日({day.strip()})"
+            
+            # 詳細要素を取得
+            detail_elements = article.locator(selectors["detail_elements"]).all()
+            
+            for detail_element in detail_elements:
                 try:
-                    # 日付情報を取得
-                    date_element = article.locator(selectors["date_element"])
-                    month = date_element.locator(selectors["month_span"]).text_content() or ""
-                    date = date_element.locator(selectors["date_span"]).text_content() or ""
-                    day = date_element.locator(selectors["day_span"]).text_content() or ""
-                    date_str = f"{month.strip()}月{date.strip()}日({day.strip()})"
-                    
-                    # 詳細要素を取得
-                    detail_elements = article.locator(selectors["detail_elements"]).all()
-                    
-                    for detail_element in detail_elements:
-                        try:
-                            # 時刻、メニュー、金額を取得
-                            hour = detail_element.locator(selectors["hour_element"]).text_content() or ""
-                            
-                            menu_elements = detail_element.locator(selectors["menu_elements"]).all()
-                            menus = []
-                            for menu in menu_elements:
-                                text = menu.text_content()
-                                if text and text.strip():
-                                    menus.append(text.strip())
-                            
-                            amount_element = detail_element.locator(selectors["amount_element"])
-                            amount = amount_element.text_content() or ""
-                            
-                            # 構造化データに追加
-                            data = {
-                                'date': date_str,
-                                'hour': hour,
-                                'menus': menus,
-                                'amount': amount
-                            }
-                            structured_data.append(data)
-                            
-                        except Exception as e:
-                            logger.warning(f"詳細要素の解析でエラー: {e}")
-                            continue
+                    # 構造化データに追加（失敗した場合はこの明細のみ再試行する）
+                    batch.append(self._parse_detail(detail_element, selectors, date_str))
                     
                 except Exception as e:
-                    logger.warning(f"記事の解析でエラー: {e}")
+                    logger.warning(f"詳細要素の解析でエラー: {e}")
                     continue
             
-            logger.info(f"食事履歴データの抽出が完了しました。取得件数: {len(structured_data)}")
-            return structured_data
-            
         except Exception as e:
-            logger.error(f"食事履歴データ抽出エラー: {e}")
-            return []
+            logger.warning(f"記事の解析でエラー: {e}")
+        return batch
+    
+    @retried("parse")
+    def _parse_detail(self, detail_element, selectors: Dict[str, str], date_str: str) -> Dict[str, Any]:
+        """1件の明細からレコードを取得"""
+        # 時刻、メニュー、金額を取得
+        hour = detail_element.locator(selectors["hour_element"]).text_content(timeout=self._timeout()) or ""
+        
+        menu_elements = detail_element.locator(selectors["menu_elements"]).all()
+        menus = []
+        for menu in menu_elements:
+            text = menu.text_content(timeout=self._timeout())
+            if text and text.strip():
+                menus.append(text.strip())
+        
+        amount_element = detail_element.locator(selectors["amount_element"])
+        amount = amount_element.text_content(timeout=self._timeout()) or ""
+        
+        return {
+            'date': date_str,
+            'hour': hour,
+            'menus': menus,
+            'amount': amount
+        }
     
     def validate_extracted_data(self, data: List[Dict[str, Any]]) -> bool:
         """抽出されたデータの妥当性をチェック"""
@@ -112,7 +151,7 @@ class DataExtractor:
                 if not item[field]:
                     logger.warning(f"フィールドが空です: {field}")
         
-        logger.info(f"データ妥当性チェック完了: {len(data)}件")
+        logger.debug(f"データ妥当性チェック完了: {len(data)}件")
         return True
     
     def get_data_summary(self, data: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -125,13 +164,7 @@ class DataExtractor:
         date_range = f"{min(dates)} 〜 {max(dates)}" if dates else None
         
         # 合計金額を計算（数値部分のみ抽出）
-        total_amount = 0
-        for item in data:
-            try:
-                amount_str = item['amount'].replace('¥', '').replace(',', '')
-                total_amount += int(amount_str)
-            except (ValueError, AttributeError):
-                continue
+        total_amount = sum(DataProcessor.get_amount(item) for item in data)
         
         return {
             "count": len(data),
@@ -5,30 +5,67 @@
 
 import re
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 日付解析用の正規表現（モジュール読み込み時に一度だけコンパイル）
+DATE_PATTERN = re.compile(r'(\d+)月(\d+)日')
+WEEKDAY_PATTERN = re.compile(r'\(([月火水木金土日])\[([0-6])\]\)')
+NON_DIGIT_PATTERN = re.compile(r'[^\d]')
+
+@lru_cache(maxsize=4096)
+def _split_date_string(date_str: str) -> Tuple[Optional[int], Optional[int], str, str]:
+    """日付文字列を (月, 日, 曜日, 曜日なし表記) に分解（結果はメモ化）"""
+    match = DATE_PATTERN.search(date_str)
+    month = int(match.group(1)) if match else None
+    day = int(match.group(2)) if match else None
+    
+    weekday_match = WEEKDAY_PATTERN.search(date_str)
+    weekday = weekday_match.group(1) if weekday_match else ""
+    label = WEEKDAY_PATTERN.sub('', date_str).strip()
+    return month, day, weekday, label
+
+@lru_cache(maxsize=4096)
+def _parse_amount_string(amount_str: str) -> int:
+    """'946円' や '¥1,200' 形式の金額を整数に変換（結果はメモ化）"""
+    digits = NON_DIGIT_PATTERN.sub('', amount_str)
+    return int(digits) if digits else 0
+
+@lru_cache(maxsize=4096)
+def _parse_iso_date(iso_str: str) -> date:
+    """YYYY-MM-DD 形式の日付文字列を解析（結果はメモ化）"""
+    return date.fromisoformat(iso_str)
+
+@lru_cache(maxsize=4096)
+def _to_datetime(value: date) -> datetime:
+    """date を datetime に変換（結果はメモ化）"""
+    return datetime(value.year, value.month, value.day)
+
+@lru_cache(maxsize=4096)
+def _format_iso_date(year: int, month: int, day: int) -> str:
+    """年月日を YYYY-MM-DD 形式に変換（結果はメモ化）"""
+    return date(year, month, day).isoformat()
+
 class DataProcessor:
     """データ処理クラス"""
     
     @staticmethod
-    def parse_date_from_string(date_str: str) -> Optional[datetime]:
-        """日付文字列から日付オブジェクトを解析"""
+    def parse_date_from_string(date_str: str, now: Optional[datetime] = None) -> Optional[datetime]:
+        """日付文字列から日付オブジェクトを解析（単独の文字列用。年は現在の月から推定）"""
         try:
             # "12月19日(木[4])" のような形式から日付を抽出
-            match = re.search(r'(\d+)月(\d+)日', date_str)
-            if match:
-                month = int(match.group(1))
-                day = int(match.group(2))
+            month, day, _, _ = _split_date_string(date_str)
+            if month is not None and day is not None:
                 # 現在の年を取得
-                current_year = datetime.now().year
+                now = now or datetime.now()
                 # 月が現在の月より大きい場合は前年
-                if month > datetime.now().month:
-                    year = current_year - 1
+                if month > now.month:
+                    year = now.year - 1
                 else:
-                    year = current_year
+                    year = now.year
                 return datetime(year, month, day)
         except Exception as e:
             logger.warning(f"日付解析エラー: {e}")
@@ -38,24 +75,111 @@ class DataProcessor:
     def clean_date_string(date_str: str) -> str:
         """日付文字列から曜日の部分を削除"""
         # "(月火水木金土日[0-6])" のパターンを削除
-        cleaned_date = re.sub(r'\([月火水木金土日]\[[0-6]\]\)', '', date_str)
-        return cleaned_date.strip()
+        return _split_date_string(date_str)[3]
     
     @staticmethod
     def format_date_with_weekday(date_str: str) -> str:
         """日付文字列を曜日付きでフォーマット"""
-        # 元の日付文字列から曜日を抽出
-        weekday_match = re.search(r'\(([月火水木金土日])\[([0-6])\]\)', date_str)
-        if weekday_match:
-            weekday_jp = weekday_match.group(1)
+        _, _, weekday_jp, date_part = _split_date_string(date_str)
+        if weekday_jp:
+            return f"{date_part} ({weekday_jp})"
+        # 曜日情報がない場合は元の文字列を返す
+        return date_str
+    
+    @staticmethod
+    def parse_amount(amount: Any) -> int:
+        """金額文字列を円単位の整数に変換（解析できない場合は0）"""
+        if isinstance(amount, int):
+            return amount
+        if not isinstance(amount, str):
+            return 0
+        return _parse_amount_string(amount)
+    
+    @staticmethod
+    def get_amount(data: Dict[str, Any]) -> int:
+        """レコードの金額を円単位の整数で取得（解析済みの amount_yen があれば使用）"""
+        amount_yen = data.get('amount_yen')
+        if isinstance(amount_yen, int):
+            return amount_yen
+        return DataProcessor.parse_amount(data.get('amount'))
+    
+    @staticmethod
+    def get_resolved_date(data: Dict[str, Any]) -> Optional[date]:
+        """レコードに保存済みの確定日付 (resolved_date) を取得"""
+        resolved = data.get('resolved_date')
+        # CSVから読み込んだ場合、未設定の値はNaN(float)になる
+        if isinstance(resolved, str) and resolved:
+            return _parse_iso_date(resolved)
+        # Parquetから読み込んだ場合は日付型のまま格納されている
+        if isinstance(resolved, datetime):
+            return resolved.date()
+        if isinstance(resolved, date):
+            return resolved
+        return None
+    
+    @staticmethod
+    def get_record_key(data: Dict[str, Any]) -> Tuple:
+        """重複判定用のキー（確定日付・時刻・メニュー・金額）を作成"""
+        return (DataProcessor.get_resolved_date(data), data.get('hour'), tuple(data.get('menus') or ()), data.get('amount'))
+    
+    @staticmethod
+    def resolve_dates(structured_data: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """新しい順に並んだレコードの年を一度の走査で確定し、resolved_date (YYYY-MM-DD) を付与
+        
+        月日が直前のレコードより大きくなった時点で年の切り替わりとみなし、年を1つ戻す。
+        既に resolved_date を持つレコードは再推定せず、後続レコードの基準として使用する。
+        """
+        now = now or datetime.now()
+        year = None
+        previous = None
+        for data in structured_data:
+            resolved = DataProcessor.get_resolved_date(data)
+            if resolved:
+                year, previous = resolved.year, (resolved.month, resolved.day)
+                continue
             
-            # 日付部分を取得
-            date_part = re.sub(r'\([月火水木金土日]\[[0-6]\]\)', '', date_str).strip()
+            month, day, _, _ = _split_date_string(data['date'])
+            if month is None or day is None:
+                data['resolved_date'] = None
+                continue
             
-            return f"{date_part} ({weekday_jp})"
-        else:
-            # 曜日情報がない場合は元の文字列を返す
-            return date_str
+            if year is None:
+                # 最新のレコードは現在日付より未来にならない年を採用
+                year = now.year - 1 if (month, day) > (now.month, now.day) else now.year
+            elif (month, day) > previous:
+                year -= 1
+            previous = (month, day)
+            
+            try:
+                data['resolved_date'] = _format_iso_date(year, month, day)
+            except ValueError as e:
+                logger.warning(f"日付解析エラー: {e}, 文字列: {data['date']}")
+                data['resolved_date'] = None
+        return structured_data
+    
+    @staticmethod
+    def normalize_records(structured_data: List[Dict[str, Any]], now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """各レコードの日付を一度だけ解析し、parsed_date / weekday / date_label を付与"""
+        DataProcessor.resolve_dates(structured_data, now)
+        for data in structured_data:
+            if 'parsed_date' in data:
+                # 正規化済みのレコードは再解析しない
+                continue
+            _, _, weekday, label = _split_date_string(data['date'])
+            resolved = DataProcessor.get_resolved_date(data)
+            data['parsed_date'] = _to_datetime(resolved) if resolved else None
+            data['weekday'] = weekday
+            data['date_label'] = label
+        return structured_data
+    
+    @staticmethod
+    def format_record_date(data: Dict[str, Any]) -> str:
+        """正規化済みレコードの日付を曜日付きでフォーマット"""
+        if 'date_label' not in data:
+            return DataProcessor.format_date_with_weekday(data['date'])
+        if data['weekday']:
+            return f"{data['date_label']} ({data['weekday']})"
+        return data['date']
     
     @staticmethod
     def filter_recent_ten_days_data(structured_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -63,22 +187,18 @@ class DataProcessor:
         if not structured_data:
             return structured_data
         
-        # 現在の日付から10日前の日付を計算
-        ten_days_ago = datetime.now() - timedelta(days=10)
-        
-        # データを日付でソート（新しい順）- Noneの場合は最小値として扱う
-        def sort_key(data):
-            date_obj = DataProcessor.parse_date_from_string(data['date'])
-            return date_obj if date_obj else datetime.min
+        now = datetime.now()
+        DataProcessor.normalize_records(structured_data, now)
         
-        sorted_data = sorted(structured_data, key=sort_key, reverse=True)
+        # 現在の日付から10日前の日付を計算
+        ten_days_ago = now - timedelta(days=10)
         
-        # 10日間以内のデータのみをフィルタリング
-        recent_data = []
-        for data in sorted_data:
-            date_obj = DataProcessor.parse_date_from_string(data['date'])
-            if date_obj and date_obj >= ten_days_ago:
-                recent_data.append(data)
+        # 10日間以内のデータのみを抽出してから日付でソート（新しい順）
+        recent_data = [
+            data for data in structured_data
+            if data['parsed_date'] and data['parsed_date'] >= ten_days_ago
+        ]
+        recent_data.sort(key=lambda data: data['parsed_date'], reverse=True)
         
         logger.info(f"全データ: {len(structured_data)}件, 10日間分データ: {len(recent_data)}件")
         return recent_data
@@ -86,15 +206,24 @@ class DataProcessor:
     @staticmethod
     def group_data_by_date(structured_data: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
         """データを日付ごとにグループ化"""
+        DataProcessor.normalize_records(structured_data)
         grouped_data = {}
         for data in structured_data:
-            original_date = data['date']  # 元の日付文字列を保持
-            clean_date = DataProcessor.clean_date_string(original_date)  # グループ化用にクリーンアップ
+            # 年をまたぐ履歴でも同じ月日が混ざらないよう確定日付でグループ化
+            clean_date = data['resolved_date'] or data['date_label']
             if clean_date not in grouped_data:
                 grouped_data[clean_date] = []
             grouped_data[clean_date].append(data)
         return grouped_data
     
+    @staticmethod
+    def sort_group_keys(grouped_data: Dict[str, List[Dict[str, Any]]]) -> List[str]:
+        """グループ化されたデータの日付キーを新しい順に並べる"""
+        def sort_key(date_key):
+            date_obj = grouped_data[date_key][0].get('parsed_date')
+            return date_obj if date_obj else datetime.min
+        return sorted(grouped_data.keys(), key=sort_key, reverse=True)
+    
     @staticmethod
     def format_menu_items(menu_items: Any) -> str:
         """メニューアイテムを改行付きHTMLに変換"""
@@ -0,0 +1,60 @@
+"""
+実行期限機能
+実行全体の期限を1つのオブジェクトで管理し、各待機には残り時間を超えないタイムアウトを渡す
+"""
+
+import time
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class DeadlineExceeded(TimeoutError):
+    """実行期限を超えた場合の例外"""
+
+class Deadline:
+    """実行期限クラス
+
+    seconds を指定しない（または0以下の）場合は無期限で、各待機には既定のタイムアウトをそのまま使う。
+    期限を過ぎた後にタイムアウトを求めると DeadlineExceeded を送出する
+    （Playwrightではタイムアウト0が無期限を意味するため、0は返さない）。
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.seconds = seconds if seconds and seconds > 0 else None
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + self.seconds if self.seconds else None
+
+    @property
+    def elapsed(self) -> float:
+        """開始からの経過時間（秒）"""
+        return time.monotonic() - self.started_at
+
+    def remaining(self) -> float:
+        """残り時間（秒）。無期限の場合は inf"""
+        if self.expires_at is None:
+            return float("inf")
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """期限を過ぎたかどうか"""
+        return self.remaining() <= 0
+
+    def check(self, phase: str = "") -> None:
+        """期限を過ぎていれば DeadlineExceeded を送出"""
+        if self.expired:
+            raise DeadlineExceeded(f"実行時間の上限（{self.seconds:.0f}秒）を超えました{f'（{phase}）' if phase else ''}")
+
+    def timeout(self, default: float, phase: str = "") -> float:
+        """既定のタイムアウト（秒）を残り時間までに制限"""
+        self.check(phase)
+        return min(default, self.remaining())
+
+    def timeout_ms(self, default_ms: int, phase: str = "") -> int:
+        """既定のタイムアウト（ミリ秒）を残り時間までに制限（Playwright用）"""
+        return max(1, int(self.timeout(default_ms / 1000, phase) * 1000))
+
+    def sleep(self, seconds: float) -> None:
+        """残り時間を超えない範囲で待機"""
+        time.sleep(min(seconds, self.remaining()))
@@ -0,0 +1,141 @@
+"""
+デバッグスナップショット機能
+失敗時またはサンプリング時のみページのHTMLを圧縮・重複排除して保存する
+
+DOMのシリアライズ（page.content()）はPlaywrightの制約上呼び出し元のスレッドで行うが、
+スナップショットを取らない場合は一切行わない。ハッシュ計算・圧縮・書き込み・古いファイルの削除は
+バックグラウンドスレッドで行う。
+"""
+
+import os
+import json
+import gzip
+import random
+import hashlib
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+from .atomic_io import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# スナップショット設定を直接定義（循環インポート回避）
+SNAPSHOT_CONFIG = {
+    "mode": os.getenv("DEBUG_SNAPSHOT", "off"),  # "off"（無効）または "failure"（失敗時）
+    "sample_rate": float(os.getenv("DEBUG_SNAPSHOT_SAMPLE_RATE", "0")),  # 成功時にも保存する割合（0〜1）
+    "dir": "debug/snapshots",
+    "index": "index.jsonl",
+    "max_snapshots": 50,         # 保持するスナップショット数（古いものから削除）
+    "max_index_entries": 500     # index.jsonl に残す取得の記録数（削除したスナップショットの記録は残さない）
+}
+
+class DebugSnapshotter:
+    """デバッグスナップショット管理クラス
+
+    保存先: <dir>/<SHA-256の先頭16文字>.html.gz
+    同じ内容のページは1ファイルだけ保存し、取得の記録（日時・ラベル・URL）は index.jsonl に追記する。
+    ログイン後のページを含むため、スナップショットと index.jsonl は所有者のみ読み書き可能にする。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**SNAPSHOT_CONFIG, **(config or {})}
+        self.snapshot_dir = self.config["dir"]
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        """スナップショットが有効かどうか"""
+        return self.config["mode"] != "off"
+
+    def should_capture(self, failed: bool = False) -> bool:
+        """スナップショットを取るかどうか（失敗時、またはサンプリングに当たった場合）"""
+        if not self.enabled:
+            return False
+        return failed or random.random() < self.config["sample_rate"]
+
+    def capture(self, page, label: str, failed: bool = False) -> bool:
+        """ページのスナップショットを取得し、保存をバックグラウンドに依頼"""
+        if page is None or not self.should_capture(failed):
+            return False
+        try:
+            html = page.content()
+            url = page.url
+        except Exception as e:
+            logger.warning(f"スナップショット取得エラー: {e}")
+            return False
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="debug-snapshot")
+        self._executor.submit(self._store, html, label, url, failed)
+        return True
+
+    def _store(self, html: str, label: str, url: str, failed: bool) -> Optional[str]:
+        """スナップショットを圧縮して保存（同じ内容のファイルがあれば再利用）"""
+        try:
+            data = html.encode("utf-8")
+            digest = hashlib.sha256(data).hexdigest()[:16]
+            path = os.path.join(self.snapshot_dir, f"{digest}.html.gz")
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+
+            if os.path.exists(path):
+                os.utime(path)  # 保持期間の判定用に更新日時を更新
+                logger.info(f"同じ内容のスナップショットがあります: {path}")
+            else:
+                with atomic_write(path) as tmp_path:
+                    with gzip.open(tmp_path, "wb") as f:
+                        f.write(data)
+                    os.chmod(tmp_path, 0o600)
+                logger.info(f"デバッグスナップショットを保存しました: {path} ({label})")
+
+            entry = {
+                "ts": datetime.now().isoformat(timespec="seconds"),
+                "label": label,
+                "url": url,
+                "failed": failed,
+                "file": os.path.basename(path),
+            }
+            index_path = os.path.join(self.snapshot_dir, self.config["index"])
+            with open(index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            os.chmod(index_path, 0o600)
+
+            self._apply_retention()
+            return path
+        except Exception as e:
+            logger.warning(f"スナップショット保存エラー: {e}")
+            return None
+
+    def _apply_retention(self) -> None:
+        """保持数を超えた古いスナップショットを削除し、index.jsonl を残っているスナップショットの記録に切り詰める"""
+        snapshots = [
+            os.path.join(self.snapshot_dir, name)
+            for name in os.listdir(self.snapshot_dir) if name.endswith(".html.gz")
+        ]
+        excess = len(snapshots) - self.config["max_snapshots"]
+        for path in sorted(snapshots, key=os.path.getmtime)[:max(0, excess)]:
+            os.remove(path)
+            logger.info(f"古いスナップショットを削除しました: {path}")
+        self._trim_index()
+
+    def _trim_index(self) -> None:
+        """削除済みのスナップショットの記録と、上限を超えた古い記録を index.jsonl から除く"""
+        index_path = os.path.join(self.snapshot_dir, self.config["index"])
+        with open(index_path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        kept = [
+            line for line in lines
+            if os.path.exists(os.path.join(self.snapshot_dir, json.loads(line)["file"]))
+        ][-self.config["max_index_entries"]:]
+        if len(kept) == len(lines):
+            return
+        with atomic_write(index_path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.writelines(kept)
+            os.chmod(tmp_path, 0o600)
+
+    def flush(self) -> None:
+        """保存待ちのスナップショットをすべて書き出す"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -4,8 +4,10 @@
 """
 
 import logging
+from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from .data_processor import DataProcessor
+from .analytics import MealAnalytics
 from .html_template import HTMLTemplateGenerator
 from .smtp_sender import SMTPSender
 from .email_config import EmailConfigManager
@@ -34,11 +36,8 @@ class EmailSender:
     def send_notification(self, structured_data: List[Dict[str, Any]]) -> bool:
         """食事履歴データの通知メールを送信（HTML形式）"""
         try:
-            # 最新の10日間分のデータのみをフィルタリング
-            recent_data = DataProcessor.filter_recent_ten_days_data(structured_data)
-            
             # HTMLメール本文を作成
-            html_body = self.html_generator.create_email_body(recent_data, len(structured_data))
+            html_body = self.render_notification(structured_data)
             
             # メールを送信
             return self.smtp_sender.send_email(html_body)
@@ -47,6 +46,51 @@ class EmailSender:
             logger.error(f"メール送信エラー: {e}")
             return False
     
+    def render_notification(self, structured_data: List[Dict[str, Any]], archive=None) -> str:
+        """食事履歴データの通知メール本文（HTML）を作成
+
+        archive（HistoryArchive）を指定した場合、直近10日分と今月の利用額は
+        アーカイブの該当する1〜2パーティションと今回抽出したレコードを統合して作成する。
+        """
+        window = self._read_history_window(structured_data, archive) if archive is not None else structured_data
+        
+        # 最新の10日間分のデータのみをフィルタリング
+        recent_data = DataProcessor.filter_recent_ten_days_data(window)
+        
+        # 全履歴の利用分析を作成
+        analytics_summary = self._create_analytics_summary(structured_data)
+        if analytics_summary and window is not structured_data:
+            window_summary = self._create_analytics_summary(window)
+            if window_summary:
+                analytics_summary["this_month_amount"] = window_summary["this_month_amount"]
+        
+        return self.html_generator.create_email_body(recent_data, len(structured_data), analytics_summary)
+    
+    def _read_history_window(self, structured_data: List[Dict[str, Any]], archive) -> List[Dict[str, Any]]:
+        """直近10日分と今月分のレコードをアーカイブから読み込み、今回抽出したレコードと統合（失敗した場合は今回のレコードのみ）"""
+        try:
+            today = datetime.now().date()
+            start = min(today - timedelta(days=10), today.replace(day=1))
+            merged = {}
+            for data in list(structured_data) + archive.read(start, today):
+                merged.setdefault(DataProcessor.get_record_key(data), data)
+            return list(merged.values())
+        except Exception as e:
+            logger.warning(f"履歴アーカイブ読み込みエラー: {e}")
+            return structured_data
+    
+    def send_rendered(self, html_body: str, message_id: Optional[str] = None) -> bool:
+        """作成済みのメール本文を送信"""
+        return self.smtp_sender.send_email(html_body, message_id=message_id)
+    
+    def _create_analytics_summary(self, structured_data: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """利用分析サマリーを作成（失敗してもメール送信は継続）"""
+        try:
+            return MealAnalytics.from_records(structured_data).get_summary()
+        except Exception as e:
+            logger.warning(f"利用分析エラー: {e}")
+            return None
+    
     def test_connection(self) -> bool:
         """SMTP接続をテスト"""
         return self.smtp_sender.test_connection()
@@ -0,0 +1,160 @@
+"""
+イベントログ機能
+実行ID・アカウント・フェーズ・所要時間などをJSON Lines形式で記録し、集計する
+
+イベントログは LOG_CONFIG["event_log"] にファイルパスを指定した場合のみ出力される。
+未設定の場合、記録処理はほとんどコストなしで読み飛ばされる。
+"""
+
+import os
+import json
+import gzip
+import time
+import uuid
+import logging
+import functools
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional, Iterator, Iterable
+
+logger = logging.getLogger(__name__)
+
+# イベントログ専用のロガー（出力先は logger.setup_event_log で設定）
+event_logger = logging.getLogger("meal_scraper.events")
+event_logger.propagate = False
+
+# 実行単位の相関ID
+_run_id: ContextVar[Optional[str]] = ContextVar("run_id", default=None)
+_account: ContextVar[Optional[str]] = ContextVar("account", default=None)
+
+# フェーズのプロファイラー（utils.profiler.PhaseProfiler。無効時はNone）
+_phase_profiler = None
+
+def is_enabled() -> bool:
+    """イベントログが有効かどうか"""
+    return bool(event_logger.handlers)
+
+def start_run(account: Optional[str] = None, run_id: Optional[str] = None) -> str:
+    """実行IDを発行し、以降のイベントに実行ID・アカウントを付与する"""
+    run_id = run_id or uuid.uuid4().hex[:12]
+    _run_id.set(run_id)
+    _account.set(account)
+    return run_id
+
+def get_run_id() -> Optional[str]:
+    """現在の実行IDを取得"""
+    return _run_id.get()
+
+def set_phase_profiler(profiler) -> None:
+    """event_phase で計測するフェーズをプロファイルするプロファイラーを設定（Noneで解除）"""
+    global _phase_profiler
+    _phase_profiler = profiler
+
+def emit_event(phase: str, **fields: Any) -> None:
+    """イベントを1行出力"""
+    if not is_enabled():
+        return
+    event = {"run_id": _run_id.get(), "account": _account.get(), "phase": phase}
+    event.update({key: value for key, value in fields.items() if value is not None})
+    event_logger.info(phase, extra={"event": event})
+
+@contextmanager
+def event_phase(phase: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """処理の所要時間を計測してイベントを出力
+
+    使用例:
+        with event_phase("save") as event:
+            event["records"] = len(rows)
+    """
+    event = dict(fields)
+    profiler = _phase_profiler
+    with profiler.profile(phase) if profiler is not None else nullcontext():
+        start = time.perf_counter()
+        try:
+            yield event
+        except Exception as e:
+            event["status"] = "error"
+            event["error"] = str(e)
+            raise
+        finally:
+            event.setdefault("status", "ok")
+            emit_event(phase, duration_ms=round((time.perf_counter() - start) * 1000, 1), **event)
+
+def traced(phase: str):
+    """マネージャーのメソッドをフェーズとして計測するデコレーター
+
+    戻り値が偽の場合は status を "failed"、リストの場合は件数を records に記録し、
+    呼び出し後のページのURLを url に記録する。
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not is_enabled() and _phase_profiler is None:
+                return method(self, *args, **kwargs)
+            with event_phase(phase) as event:
+                result = method(self, *args, **kwargs)
+                if not result:
+                    event["status"] = "failed"
+                if isinstance(result, list):
+                    event["records"] = len(result)
+                webdriver_manager = getattr(self, "webdriver_manager", self)
+                if hasattr(webdriver_manager, "get_current_url"):
+                    event["url"] = webdriver_manager.get_current_url() or None
+            return result
+        return wrapper
+    return decorator
+
+class JsonFormatter(logging.Formatter):
+    """イベントをJSON Lines形式に整形するフォーマッター"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {"ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"), "level": record.levelname}
+        payload.update(getattr(record, "event", None) or {"message": record.getMessage()})
+        return json.dumps(payload, ensure_ascii=False)
+
+def iter_events(log_path: str) -> Iterator[Dict[str, Any]]:
+    """イベントログ（ディレクトリの場合は配下の *.jsonl と圧縮済みの *.jsonl.*.gz）を読み込み"""
+    if os.path.isdir(log_path):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(log_path)
+            for name in names if ".jsonl" in name
+        )
+    else:
+        paths = [log_path]
+
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"イベントログの不正な行を読み飛ばしました: {path}")
+
+def _percentile(values: List[float], percent: float) -> float:
+    """ソート済みの値の百分位数を線形補間で取得"""
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def phase_latency(events: Iterable[Dict[str, Any]], percentiles=(50, 90, 99), account: Optional[str] = None, key: str = "phase") -> Dict[str, Dict[str, Any]]:
+    """フェーズごとの件数・失敗数・所要時間の百分位数（ミリ秒）を集計"""
+    durations: Dict[str, List[float]] = {}
+    failures: Dict[str, int] = {}
+    for event in events:
+        if "duration_ms" not in event or (account and event.get("account") != account):
+            continue
+        name = str(event.get(key))
+        durations.setdefault(name, []).append(event["duration_ms"])
+        if event.get("status", "ok") != "ok":
+            failures[name] = failures.get(name, 0) + 1
+
+    stats = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        stats[name] = {"count": len(values), "failed": failures.get(name, 0), "max": values[-1]}
+        for percent in percentiles:
+            stats[name][f"p{percent}"] = round(_percentile(values, percent), 1)
+    return stats
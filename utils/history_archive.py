@@ -0,0 +1,211 @@
+"""
+履歴アーカイブ機能
+食事履歴をアカウント・月ごとのParquetファイルに分割して保存する
+複数アカウントの履歴を共通のマニフェストで管理し、アカウント横断の集計を行う
+"""
+
+import os
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional
+from .csv_handler import CSVHandler, sanitize_account
+from .data_processor import DataProcessor
+from .atomic_io import atomic_write, file_lock
+
+logger = logging.getLogger(__name__)
+
+# アーカイブ設定を直接定義
+ARCHIVE_CONFIG = {
+    "root_dir": "history",
+    "manifest": "manifest.json",
+    "default_account": "default"
+}
+
+class HistoryArchive:
+    """月別パーティション履歴アーカイブクラス
+
+    レイアウト: <root_dir>/<account>/<YYYY-MM>.parquet
+    マニフェスト（<root_dir>/manifest.json）は全アカウント共通で、各パーティションの件数・合計金額・
+    日付範囲を記録する。読み込み時は要求された期間と重なるパーティションだけを開き、
+    月別の件数・合計金額はパーティションを開かずにマニフェストから取得する。
+    """
+
+    def __init__(self, root_dir: Optional[str] = None, account: Optional[str] = None):
+        self.root_dir = root_dir or ARCHIVE_CONFIG["root_dir"]
+        self.account = self._sanitize_account(account or ARCHIVE_CONFIG["default_account"])
+        self.manifest_path = os.path.join(self.root_dir, ARCHIVE_CONFIG["manifest"])
+        self.manifest = self._load_manifest()
+
+    @staticmethod
+    def _sanitize_account(account: str) -> str:
+        """アカウント名をディレクトリ名として使える形式に変換"""
+        return sanitize_account(account)
+
+    @staticmethod
+    def _month_key(value: date) -> str:
+        """日付からパーティションキー（YYYY-MM）を作成"""
+        return f"{value.year:04d}-{value.month:02d}"
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        """マニフェストを読み込み"""
+        try:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning(f"マニフェスト読み込みエラー: {e}")
+        return {"accounts": {}}
+
+    def _save_manifest(self) -> None:
+        """マニフェストをアトミックに保存"""
+        with atomic_write(self.manifest_path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+
+    def get_partitions(self, account: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """アカウントのパーティション情報を取得（キーは YYYY-MM）"""
+        account = self._sanitize_account(account) if account else self.account
+        return self.manifest["accounts"].get(account, {})
+
+    def list_accounts(self) -> List[str]:
+        """アーカイブに登録されているアカウントの一覧を取得"""
+        return sorted(self.manifest["accounts"])
+
+    def _partition_path(self, account: str, month_key: str) -> str:
+        """パーティションファイルのパスを取得"""
+        return os.path.join(self.root_dir, account, f"{month_key}.parquet")
+
+    def _read_partition(self, path: str) -> List[Dict[str, Any]]:
+        """パーティションファイルをメモリマップで読み込み"""
+        import pyarrow.parquet as pq
+        return pq.read_table(path, memory_map=True).to_pylist()
+
+    def write(self, structured_data: List[Dict[str, Any]], account: Optional[str] = None) -> int:
+        """レコードを月別パーティションに追記（重複は除外）。書き込んだパーティション数を返す"""
+        account = self._sanitize_account(account) if account else self.account
+        DataProcessor.resolve_dates(structured_data)
+
+        # 確定日付の月ごとに振り分け
+        by_month: Dict[str, List[Dict[str, Any]]] = {}
+        for data in structured_data:
+            resolved = DataProcessor.get_resolved_date(data)
+            if resolved is None:
+                logger.warning(f"日付が確定していないレコードはアーカイブしません: {data.get('date')}")
+                continue
+            by_month.setdefault(self._month_key(resolved), []).append(data)
+
+        # 他の書き込みと排他し、最新のマニフェストに対して更新する
+        os.makedirs(self.root_dir, exist_ok=True)
+        with file_lock(self.manifest_path):
+            self.manifest = self._load_manifest()
+            self._write_partitions(account, by_month)
+        logger.info(f"履歴アーカイブに保存しました: {account}, {len(by_month)}パーティション")
+        return len(by_month)
+
+    def _write_partitions(self, account: str, by_month: Dict[str, List[Dict[str, Any]]]) -> None:
+        """月ごとのレコードを既存パーティションと統合して書き込み、マニフェストを更新"""
+        partitions = self.manifest["accounts"].setdefault(account, {})
+        os.makedirs(os.path.join(self.root_dir, account), exist_ok=True)
+        for month_key, records in by_month.items():
+            path = self._partition_path(account, month_key)
+            existing = self._read_partition(path) if os.path.exists(path) else []
+
+            # 既存レコードと統合して重複を除外し、新しい順に並べる
+            merged = {}
+            for data in existing + records:
+                merged.setdefault(DataProcessor.get_record_key(data), data)
+            rows = sorted(merged.values(), key=DataProcessor.get_resolved_date, reverse=True)
+
+            with atomic_write(path) as tmp_path:
+                CSVHandler.to_typed_frame(rows).to_parquet(tmp_path, index=False, engine='pyarrow')
+            dates = [DataProcessor.get_resolved_date(data) for data in rows]
+            partitions[month_key] = {
+                "path": os.path.relpath(path, self.root_dir),
+                "rows": len(rows),
+                "total_amount": sum(DataProcessor.get_amount(data) for data in rows),
+                "min_date": min(dates).isoformat(),
+                "max_date": max(dates).isoformat(),
+            }
+
+        self._save_manifest()
+
+    def read(self, start: Optional[date] = None, end: Optional[date] = None, account: Optional[str] = None) -> List[Dict[str, Any]]:
+        """期間内のレコードを新しい順に取得（期間と重なるパーティションのみ読み込む）"""
+        account = self._sanitize_account(account) if account else self.account
+        partitions = self.get_partitions(account)
+        selected = self._select_partitions(account, start, end)
+        logger.info(f"履歴アーカイブ読み込み: {len(selected)}/{len(partitions)}パーティション")
+
+        records = []
+        for info in selected:
+            for data in self._read_partition(os.path.join(self.root_dir, info["path"])):
+                resolved = data['resolved_date']
+                if (start is None or resolved >= start) and (end is None or resolved <= end):
+                    records.append(data)
+        return records
+
+    def read_recent(self, days: int = 10, account: Optional[str] = None, today: Optional[date] = None) -> List[Dict[str, Any]]:
+        """直近の指定日数分のレコードを取得"""
+        today = today or datetime.now().date()
+        return self.read(today - timedelta(days=days), today, account)
+
+    def read_month(self, year: int, month: int, account: Optional[str] = None) -> List[Dict[str, Any]]:
+        """指定月のレコードを取得"""
+        start = date(year, month, 1)
+        end = (date(year + month // 12, month % 12 + 1, 1)) - timedelta(days=1)
+        return self.read(start, end, account)
+
+    def _select_partitions(self, account: str, start: Optional[date], end: Optional[date]) -> List[Dict[str, Any]]:
+        """期間と重なるパーティション情報を新しい順に取得"""
+        return [
+            info for _, info in sorted(self.get_partitions(account).items(), reverse=True)
+            if (start is None or info["max_date"] >= start.isoformat())
+            and (end is None or info["min_date"] <= end.isoformat())
+        ]
+
+    def monthly_totals(self, year: int, month: int) -> Dict[str, Dict[str, int]]:
+        """全アカウントの指定月の件数・合計金額を取得（マニフェストのみ参照）"""
+        month_key = f"{year:04d}-{month:02d}"
+        totals = {}
+        for account in self.list_accounts():
+            info = self.get_partitions(account).get(month_key)
+            if info is None:
+                continue
+            if "total_amount" not in info:
+                # 合計金額を記録していない古いマニフェストはパーティションから集計
+                rows = self._read_partition(os.path.join(self.root_dir, info["path"]))
+                info["total_amount"] = sum(DataProcessor.get_amount(data) for data in rows)
+            totals[account] = {"rows": info["rows"], "total_amount": info["total_amount"]}
+        return totals
+
+    def read_frame(self, start: Optional[date] = None, end: Optional[date] = None, accounts: Optional[List[str]] = None):
+        """複数アカウントの期間内のレコードを account 列付きの1つのDataFrameとして取得"""
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        tables = []
+        for account in accounts or self.list_accounts():
+            account = self._sanitize_account(account)
+            for info in self._select_partitions(account, start, end):
+                table = pq.read_table(os.path.join(self.root_dir, info["path"]), memory_map=True)
+                tables.append(table.append_column("account", pa.array([account] * table.num_rows, pa.string())))
+        if not tables:
+            return CSVHandler.to_typed_frame([]).assign(account=[])
+
+        table = pa.concat_tables(tables)
+        mask = None
+        if start is not None:
+            mask = pc.greater_equal(table["resolved_date"], pa.scalar(start, pa.date32()))
+        if end is not None:
+            end_mask = pc.less_equal(table["resolved_date"], pa.scalar(end, pa.date32()))
+            mask = end_mask if mask is None else pc.and_(mask, end_mask)
+        if mask is not None:
+            table = table.filter(mask)
+        return table.to_pandas()
+
+    def spend_by_account(self, start: Optional[date] = None, end: Optional[date] = None, accounts: Optional[List[str]] = None):
+        """アカウントごとの期間内の件数・合計金額を集計"""
+        df = self.read_frame(start, end, accounts)
+        return df.groupby("account")["amount_yen"].agg(["count", "sum"]).rename(columns={"sum": "total_amount"})
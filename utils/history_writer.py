@@ -0,0 +1,169 @@
+"""
+履歴書き込み機能
+追記ジャーナルで書き込みを受け付け、バックグラウンドで履歴ファイルに統合する
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import date
+from typing import List, Dict, Any, Optional
+from .csv_handler import CSVHandler
+from .data_processor import DataProcessor
+from .atomic_io import atomic_write, file_lock
+from .event_log import traced
+
+logger = logging.getLogger(__name__)
+
+# ジャーナルに保存するフィールド（表示用に付与されたフィールドは保存しない）
+JOURNAL_FIELDS = ('date', 'hour', 'menus', 'amount', 'resolved_date')
+
+class HistoryWriter:
+    """ジャーナル付き履歴書き込みクラス
+
+    append() はレコードをジャーナル（<履歴ファイル>.journal.jsonl）に追記して fsync するだけなので、
+    多数の書き込みが同時に発生しても短時間で完了する。ジャーナルは compact() で履歴ファイルと統合し、
+    履歴ファイルは一時ファイル経由でアトミックに置き換える。
+    begin() から commit() までの追記は統合せず、rollback() で取り消せる（抽出が途中で失敗した実行の
+    レコードを履歴ファイルに統合しないため）。
+    """
+
+    def __init__(self, csv_handler: CSVHandler, compact_threshold: int = 1000):
+        self.csv_handler = csv_handler
+        self.journal_path = f"{os.path.splitext(csv_handler.output_path)[0]}.journal.jsonl"
+        self.compact_threshold = compact_threshold
+        self._compact_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        self._pending = 0  # このプロセスが追記した未統合の件数
+        self._begin_offset: Optional[int] = None  # begin() 時点のジャーナルのサイズ（実行中でなければNone）
+        self._begin_pending = 0
+
+    def append(self, structured_data: List[Dict[str, Any]]) -> int:
+        """レコードをジャーナルに追記（ディスクへの書き出し完了後に戻る）。追記件数を返す"""
+        if not structured_data:
+            return 0
+
+        DataProcessor.resolve_dates(structured_data)
+        lines = "".join(self._to_journal_line(data) for data in structured_data)
+        with file_lock(self.journal_path):
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._pending += len(structured_data)
+
+        logger.debug(f"ジャーナルに追記しました: {len(structured_data)}件")
+        if self._pending >= self.compact_threshold:
+            self.request_compaction()
+        return len(structured_data)
+
+    def begin(self) -> None:
+        """実行の開始を記録（commit() または rollback() まで、以降の追記を統合しない）"""
+        with file_lock(self.journal_path):
+            self._begin_offset = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+            self._begin_pending = self._pending
+
+    def commit(self) -> None:
+        """begin() 以降の追記を確定（統合の対象にする）"""
+        self._begin_offset = None
+
+    def rollback(self) -> None:
+        """begin() 以降の追記を取り消す"""
+        if self._begin_offset is None:
+            return
+        with file_lock(self.journal_path):
+            if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) > self._begin_offset:
+                os.truncate(self.journal_path, self._begin_offset)
+                logger.warning(f"確定していない追記をジャーナルから取り消しました: {self.journal_path}")
+            self._pending = self._begin_pending
+            self._begin_offset = None
+
+    def _to_journal_line(self, data: Dict[str, Any]) -> str:
+        """レコードをジャーナルの1行（JSON）に変換"""
+        entry = {field: data.get(field) for field in JOURNAL_FIELDS}
+        if isinstance(entry['resolved_date'], date):
+            entry['resolved_date'] = entry['resolved_date'].isoformat()
+        entry['menus'] = list(entry['menus'] or [])
+        return json.dumps(entry, ensure_ascii=False) + "\n"
+
+    def read_journal(self) -> List[Dict[str, Any]]:
+        """ジャーナルのレコードを読み込み（書き込み途中で途切れた行は読み飛ばす）"""
+        if not os.path.exists(self.journal_path):
+            return []
+        records = []
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logger.warning(f"ジャーナルの不完全な行を読み飛ばしました: {line[:80]!r}")
+        return records
+
+    @traced("compact")
+    def compact(self) -> bool:
+        """ジャーナルを履歴ファイルに統合（重複は除外し新しい順に並べる）"""
+        if self._begin_offset is not None:
+            logger.debug("実行中の追記が確定していないため、統合を保留します")
+            return True
+        try:
+            with file_lock(self.journal_path):
+                journal = self.read_journal()
+                if not journal:
+                    return True
+
+                existing = []
+                if os.path.exists(self.csv_handler.output_path):
+                    existing = self.csv_handler.load_data() or []
+
+                # ジャーナルのレコード（新しい取得結果）を優先して統合
+                merged = {}
+                for data in journal + existing:
+                    merged.setdefault(DataProcessor.get_record_key(data), data)
+                rows = sorted(merged.values(), key=lambda data: DataProcessor.get_resolved_date(data) or date.min, reverse=True)
+
+                if not self.csv_handler.save_data(rows):
+                    return False
+
+                # 統合が完了してからジャーナルを空にする（途中で停止しても再統合できる）
+                with atomic_write(self.journal_path) as tmp_path:
+                    open(tmp_path, "w", encoding="utf-8").close()
+                self._pending = 0
+
+            logger.info(f"ジャーナルを統合しました: {len(journal)}件 → 履歴 {len(rows)}件")
+            return True
+
+        except Exception as e:
+            logger.error(f"ジャーナル統合エラー: {e}")
+            return False
+
+    def request_compaction(self) -> None:
+        """バックグラウンドでの統合を要求（統合スレッドが未起動の場合は起動する）"""
+        self.start_compactor()
+        self._compact_event.set()
+
+    def start_compactor(self, interval: float = 60.0) -> None:
+        """一定間隔または要求時にジャーナルを統合するバックグラウンドスレッドを起動"""
+        if self._compactor and self._compactor.is_alive():
+            return
+        self._stop_event.clear()
+        self._compactor = threading.Thread(target=self._compactor_loop, args=(interval,), name="history-compactor", daemon=True)
+        self._compactor.start()
+
+    def _compactor_loop(self, interval: float) -> None:
+        """統合スレッドの本体"""
+        while not self._stop_event.is_set():
+            self._compact_event.wait(interval)
+            self._compact_event.clear()
+            self.compact()
+
+    def close(self) -> bool:
+        """統合スレッドを停止し、残っているジャーナルを統合（確定していない追記は取り消す）"""
+        if self._compactor and self._compactor.is_alive():
+            self._stop_event.set()
+            self._compact_event.set()
+            self._compactor.join()
+        self._compactor = None
+        self.rollback()
+        return self.compact()
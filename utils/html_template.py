@@ -16,14 +16,14 @@ class HTMLTemplateGenerator:
     def __init__(self, email_width: int = 400):
         self.email_width = email_width
     
-    def create_email_body(self, structured_data: List[Dict[str, Any]], total_data_count: Optional[int] = None) -> str:
+    def create_email_body(self, structured_data: List[Dict[str, Any]], total_data_count: Optional[int] = None, analytics_summary: Optional[Dict[str, Any]] = None) -> str:
         """iPhone最適化されたHTMLメール本文を作成"""
         if not structured_data:
             return self._create_empty_template()
         
         # データを日付ごとにグループ化
         grouped_data = DataProcessor.group_data_by_date(structured_data)
-        sorted_dates = sorted(grouped_data.keys(), reverse=True)
+        sorted_dates = DataProcessor.sort_group_keys(grouped_data)
         
         # 現在の日時を取得
         current_time = datetime.now().strftime("%Y年%m月%d日 %H:%M")
@@ -34,6 +34,8 @@ class HTMLTemplateGenerator:
         # HTMLテンプレートを生成
         html = self._create_header(current_time)
         html += self._create_summary_section(summary_text, structured_data)
+        if analytics_summary:
+            html += self._create_analytics_section(analytics_summary)
         html += self._create_meal_sections(grouped_data, sorted_dates)
         html += self._create_footer()
         
@@ -96,7 +98,7 @@ class HTMLTemplateGenerator:
     
     def _create_summary_section(self, summary_text: str, structured_data: List[Dict[str, Any]]) -> str:
         """サマリー情報セクションを生成"""
-        period_text = f"取得期間: <strong>{DataProcessor.format_date_with_weekday(structured_data[-1]['date']) if structured_data else 'N/A'} 〜 {DataProcessor.format_date_with_weekday(structured_data[0]['date']) if structured_data else 'N/A'}</strong>"
+        period_text = f"取得期間: <strong>{DataProcessor.format_record_date(structured_data[-1]) if structured_data else 'N/A'} 〜 {DataProcessor.format_record_date(structured_data[0]) if structured_data else 'N/A'}</strong>"
         
         return f"""
                         <td style="padding: 12px;">
@@ -113,15 +115,34 @@ class HTMLTemplateGenerator:
                             </table>
         """
     
+    def _create_analytics_section(self, analytics_summary: Dict[str, Any]) -> str:
+        """利用分析セクションを生成"""
+        slot_text = " / ".join(f"{slot} {count}回" for slot, count in analytics_summary["time_slots"].items() if count)
+        top_menu_html = "<br>".join(f"{menu} ({count}回)" for menu, count in analytics_summary["top_menus"])
+        
+        return f"""
+                            <!-- 利用分析 -->
+                            <table width="100%" cellpadding="0" cellspacing="0" style="background-color: #f2f2f7; border-radius: 6px; margin-bottom: 12px; border-left: 3px solid #34c759;">
+                                <tr>
+                                    <td style="padding: 10px;">
+                                        <h3 style="margin: 0 0 6px 0; color: #34c759; font-size: 16px; font-family: Arial, sans-serif;">📈 利用分析</h3>
+                                        <p style="margin: 0; font-size: 13px; color: #666666; font-family: Arial, sans-serif;">今月の利用額: <strong>{analytics_summary["this_month_amount"]:,}円</strong></p>
+                                        <p style="margin: 3px 0 0 0; font-size: 13px; color: #666666; font-family: Arial, sans-serif;">1日平均: <strong>{analytics_summary["daily_average"]:,.0f}円</strong> (直近7日: {analytics_summary["rolling_average"]:,.0f}円)</p>
+                                        <p style="margin: 3px 0 0 0; font-size: 13px; color: #666666; font-family: Arial, sans-serif;">{slot_text}</p>
+                                        <p style="margin: 3px 0 0 0; font-size: 13px; color: #666666; font-family: Arial, sans-serif;">よく食べたメニュー:<br>{top_menu_html}</p>
+                                    </td>
+                                </tr>
+                            </table>
+        """
+    
     def _create_meal_sections(self, grouped_data: Dict[str, List[Dict[str, Any]]], sorted_dates: List[str]) -> str:
         """食事セクションを生成"""
         html = ""
         
         for date in sorted_dates:
             meals = grouped_data[date]
-            # 最初の食事データから元の日付文字列を取得
-            original_date = meals[0]['date'] if meals else date
-            formatted_date = DataProcessor.format_date_with_weekday(original_date)
+            # 最初の食事データの正規化済み日付を使用
+            formatted_date = DataProcessor.format_record_date(meals[0]) if meals else date
             
             html += f"""
                             <!-- 日付セクション -->
@@ -0,0 +1,164 @@
+"""
+ブラウザ起動プロファイル機能
+起動オプションとコンテキストのテンプレートを一度だけ組み立て、コンテキストを1回の呼び出しで作成する
+"""
+
+import os
+import re
+import logging
+from typing import Dict, Any, List, Optional
+from .atomic_io import atomic_write
+from .deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# 起動プロファイルの既定値（PLAYWRIGHT_CONFIG の同名キーで上書きできる）
+LAUNCH_DEFAULTS = {
+    "window_size": (1920, 1080),
+    "user_agent": None,
+    "locale": "ja-JP",
+    "timezone_id": "Asia/Tokyo",
+    "navigation_timeout": 30000,
+    # データ抽出に不要なリソースは読み込まない
+    "blocked_resources": ["image", "media", "font"],
+    # ヘッドレスでのデータ抽出向けの起動フラグ
+    "launch_args": [
+        "--disable-gpu",
+        "--disable-dev-shm-usage",
+        "--disable-extensions",
+        "--disable-background-networking",
+        "--disable-background-timer-throttling",
+        "--disable-renderer-backgrounding",
+        "--disable-sync",
+        "--no-first-run",
+        "--no-default-browser-check",
+        "--mute-audio"
+    ],
+    # ログイン状態（Cookie・localStorage）の保存先（空の場合は保存しない）
+    "storage_state": "",
+    # 通信の記録・再生: "off"、"record"（HARに記録）、"replay"（HARから応答し、ネットワークには接続しない）
+    "har_mode": os.getenv("HAR_MODE", "off"),
+    "har_path": os.getenv("HAR_PATH", "debug/har/meal_history.har.zip")
+}
+
+# ブロックするリソースの種類ごとのURLの拡張子（レート制限がない場合はこれらのURLだけをルーティングする）
+RESOURCE_EXTENSIONS = {
+    "image": ["png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico", "bmp"],
+    "media": ["mp4", "webm", "ogg", "mp3", "wav", "m4a"],
+    "font": ["woff", "woff2", "ttf", "otf", "eot"],
+}
+
+class LaunchProfile:
+    """ブラウザ起動プロファイルクラス"""
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**LAUNCH_DEFAULTS, **(config or {})}
+        self._context_template: Optional[Dict[str, Any]] = None
+
+    def launch_options(self) -> Dict[str, Any]:
+        """chromium.launch() に渡すオプションを取得"""
+        headless = self.config.get("headless", False)
+        args = list(self.config["launch_args"]) if headless else []
+        return {"headless": headless, "args": args}
+
+    def context_template(self) -> Dict[str, Any]:
+        """browser.new_context() に渡すオプション（初回のみ組み立てる）"""
+        if self._context_template is None:
+            width, height = self.config["window_size"]
+            template = {
+                "viewport": {"width": width, "height": height},
+                "locale": self.config["locale"],
+                "timezone_id": self.config["timezone_id"],
+            }
+            if self.config["user_agent"]:
+                template["user_agent"] = self.config["user_agent"]
+            if self.config["har_mode"] == "record":
+                # .zip の場合は応答本文を別ファイルとして格納し、それ以外はHARに埋め込む
+                har_path = self.config["har_path"]
+                template["record_har_path"] = har_path
+                template["record_har_mode"] = "full"
+                template["record_har_content"] = "attach" if har_path.endswith(".zip") else "embed"
+            self._context_template = template
+
+        template = dict(self._context_template)
+        storage_state = self.config["storage_state"]
+        if storage_state and os.path.exists(storage_state):
+            template["storage_state"] = storage_state
+        return template
+
+    def new_context(self, browser, rate_limiter=None, deadline=None):
+        """テンプレートからブラウザコンテキストを作成（rate_limiter を指定した場合は対象ホストへの要求の間隔を保つ。待機は deadline の残り時間まで）"""
+        har_mode, har_path = self.config["har_mode"], self.config["har_path"]
+        if har_mode == "replay" and not os.path.exists(har_path):
+            raise FileNotFoundError(f"再生するHARファイルがありません: {har_path}")
+        if har_mode == "record" and os.path.dirname(har_path):
+            os.makedirs(os.path.dirname(har_path), exist_ok=True)
+
+        context = browser.new_context(**self.context_template())
+        context.set_default_navigation_timeout(self.config["navigation_timeout"])
+
+        if rate_limiter is None:
+            # すべての要求をルーティングするとHTTPキャッシュが使われなくなるため、ブロックするURLだけに限定する
+            pattern = self.blocked_url_pattern()
+            if pattern is not None:
+                context.route(pattern, lambda route: route.abort())
+        else:
+            # 対象ホストへの要求を待たせるため、すべての要求をルーティングする（ブロックもリソースの種類で判定）
+            blocked = set(self.config["blocked_resources"])
+
+            def handle(route):
+                request = route.request
+                if request.resource_type in blocked:
+                    route.abort()
+                    return
+                try:
+                    rate_limiter.acquire(request.url, request.resource_type,
+                                         deadline.remaining() if deadline is not None else float("inf"))
+                except DeadlineExceeded as e:
+                    # 実行期限までに間隔を空けられない要求は送らない
+                    logger.warning(f"要求を中断しました: {request.url}: {e}")
+                    route.abort()
+                    return
+                route.continue_()
+            context.route("**/*", handle)
+            rate_limiter.watch(context)
+        if har_mode == "replay":
+            # 後から登録したルートが優先されるため、すべての要求にHARから応答する（記録にない要求は中断）
+            context.route_from_har(har_path, not_found="abort")
+            logger.info(f"HARから応答します（ネットワークには接続しません）: {har_path}")
+        return context
+
+    def finish_recording(self) -> None:
+        """コンテキストを閉じた後、記録したHARファイルの権限を制限（ログイン時の送信内容を含むため）"""
+        har_path = self.config["har_path"]
+        if self.config["har_mode"] == "record" and os.path.exists(har_path):
+            os.chmod(har_path, 0o600)
+            logger.info(f"通信をHARに記録しました: {har_path}")
+
+    def blocked_url_pattern(self) -> Optional[re.Pattern]:
+        """ブロックするリソースの種類に対応するURLのパターン（対応する拡張子がない場合はNone）"""
+        extensions = [ext for kind in self.config["blocked_resources"] for ext in RESOURCE_EXTENSIONS.get(kind, [])]
+        if not extensions:
+            return None
+        return re.compile(rf"\.({'|'.join(extensions)})(?:[?#].*)?$", re.IGNORECASE)
+
+    @property
+    def blocked_resources(self) -> List[str]:
+        """読み込まないリソースの種類"""
+        return list(self.config["blocked_resources"])
+
+    def save_storage_state(self, context, path: Optional[str] = None) -> bool:
+        """ログイン状態を保存（次回のコンテキスト作成時に読み込む）"""
+        path = path or self.config["storage_state"]
+        if not path or context is None:
+            return False
+        try:
+            with atomic_write(path) as tmp_path:
+                context.storage_state(path=tmp_path)
+                # セッションCookieを含むため所有者のみ読み書き可能にする
+                os.chmod(tmp_path, 0o600)
+            logger.info(f"ログイン状態を保存しました: {path}")
+            return True
+        except Exception as e:
+            logger.warning(f"ログイン状態保存エラー: {e}")
+            return False
@@ -1,49 +1,178 @@
 """
 ログ機能
 スクレイピングのログを管理
+
+ログ出力はキュー経由で別スレッドに任せ、呼び出し側ではディスクI/Oを行わない。
+ログファイルはサイズまたは日付でローテーションし、古いファイルはgzip圧縮する。
 """
 
-import logging
 import os
+import gzip
+import queue
+import atexit
+import shutil
+import logging
+import logging.handlers
+from .event_log import JsonFormatter, event_logger
 
 # ログ設定を直接定義（循環インポート回避）
 LOG_CONFIG = {
     "level": "INFO",
     "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    "file": "logs/scraper.log"
+    "file": "logs/scraper.log",
+    "rotation": "size",          # "size"（サイズ）または "time"（日付）
+    "max_bytes": 5 * 1024 * 1024,  # サイズローテーションの上限（5MB）
+    "when": "midnight",          # 日付ローテーションのタイミング
+    "backup_count": 7,           # 保持する世代数
+    "compress": True,            # ローテーション済みファイルをgzip圧縮
+    # モジュールごとのログレベル（本番では "utils.data_extractor": "ERROR" などで要素単位の警告を抑制）
+    "module_levels": {},
+    # 同じキューに流すパッケージのロガー（utils 配下のモジュールのログもファイルに出力する）
+    "packages": ["utils"],
+    # JSON Lines形式のイベントログの出力先（空の場合は出力しない）
+    "event_log": os.getenv("EVENT_LOG", "")
 }
 
 FILE_PATHS = {
     "logs_dir": "logs"
 }
 
-def setup_logger(name="meal_scraper"):
-    """ログ設定を初期化"""
+# ロガー名 -> 稼働中のQueueListener
+_listeners = {}
+
+def _gzip_namer(name):
+    """ローテーション済みファイル名に .gz を付与"""
+    return f"{name}.gz"
+
+def _gzip_rotator(source, dest):
+    """ローテーション済みファイルをgzip圧縮"""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """レコードをコピーせずにキューへ積むハンドラー（書式化はリスナースレッドで行う）"""
+
+    def prepare(self, record):
+        # 引数の埋め込みと例外情報の文字列化だけを行い、ほかの整形はリスナーに任せる
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _create_file_handler(file_path=None, settings=None):
+    """ローテーション付きのファイルハンドラーを作成"""
+    settings = settings or LOG_CONFIG
+    file_path = file_path or settings["file"]
+    if settings["rotation"] == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            file_path, when=settings["when"],
+            backupCount=settings["backup_count"], encoding='utf-8'
+        )
+    else:
+        handler = logging.handlers.RotatingFileHandler(
+            file_path, maxBytes=settings["max_bytes"],
+            backupCount=settings["backup_count"], encoding='utf-8'
+        )
+    if settings["compress"]:
+        handler.namer = _gzip_namer
+        handler.rotator = _gzip_rotator
+    return handler
+
+def apply_module_levels(module_levels=None):
+    """モジュールごとのログレベルを適用"""
+    for module, level in (module_levels or LOG_CONFIG["module_levels"]).items():
+        logging.getLogger(module).setLevel(getattr(logging, level))
+
+def setup_logger(name="meal_scraper", config=None):
+    """ログ設定を初期化（config を指定した場合は LOG_CONFIG の既定値に重ねて使う。例: config.py の LOG_CONFIG）"""
+    settings = {**LOG_CONFIG, **(config or {})}
+
     # ログディレクトリを作成
     os.makedirs(FILE_PATHS["logs_dir"], exist_ok=True)
-    
+
+    # 同じロガーを再設定する場合は既存のリスナーを停止
+    stop_logger(name)
+
     # ロガーを作成
     logger = logging.getLogger(name)
-    logger.setLevel(getattr(logging, LOG_CONFIG["level"]))
-    
+    logger.setLevel(getattr(logging, settings["level"]))
+
     # 既存のハンドラーをクリア
     logger.handlers.clear()
-    
+
     # ファイルハンドラー
-    file_handler = logging.FileHandler(LOG_CONFIG["file"], encoding='utf-8')
+    file_handler = _create_file_handler(settings=settings)
     file_handler.setLevel(logging.DEBUG)
-    
+
     # コンソールハンドラー
     console_handler = logging.StreamHandler()
     console_handler.setLevel(logging.INFO)
-    
+
     # フォーマッター
-    formatter = logging.Formatter(LOG_CONFIG["format"])
+    formatter = logging.Formatter(settings["format"])
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
-    
-    # ハンドラーを追加
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-    
-    return logger 
\ No newline at end of file
+
+    # 呼び出し側はキューに積むだけで、書き込みはリスナースレッドが行う
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    listener.start()
+    _listeners[name] = listener
+
+    queue_handler = _QueueHandler(log_queue)
+    logger.addHandler(queue_handler)
+    for package in settings["packages"]:
+        package_logger = logging.getLogger(package)
+        package_logger.handlers = [h for h in package_logger.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+        package_logger.addHandler(queue_handler)
+        package_logger.setLevel(getattr(logging, settings["level"]))
+        package_logger.propagate = False
+    apply_module_levels(settings["module_levels"])
+
+    if settings["event_log"]:
+        setup_event_log(settings=settings)
+
+    return logger
+
+def setup_event_log(file_path=None, settings=None):
+    """JSON Lines形式のイベントログを有効化"""
+    settings = settings or LOG_CONFIG
+    file_path = file_path or settings["event_log"]
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    stop_logger(event_logger.name)
+
+    file_handler = _create_file_handler(file_path, settings)
+    file_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    _listeners[event_logger.name] = listener
+
+    event_logger.handlers.clear()
+    event_logger.addHandler(_QueueHandler(log_queue))
+    event_logger.setLevel(logging.INFO)
+    return event_logger
+
+def stop_logger(name="meal_scraper"):
+    """リスナーを停止し、キューに残っているログを書き出す"""
+    listener = _listeners.pop(name, None)
+    if listener:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+        if name == event_logger.name:
+            event_logger.handlers.clear()
+
+def stop_all_loggers():
+    """すべてのリスナーを停止"""
+    for name in list(_listeners):
+        stop_logger(name)
+
+atexit.register(stop_all_loggers)
@@ -3,15 +3,21 @@
 Webサイトへのログイン処理を担当
 """
 
-import time
 import logging
-from playwright.sync_api import Page, TimeoutError as PlaywrightTimeoutError
+from playwright.sync_api import Page
 from typing import Dict, Any, Optional, Tuple
 from .webdriver_manager import WebDriverManager
 from .selector_manager import SelectorManager
+from .event_log import traced
+from .deadline import Deadline
+from .retry import retried
 
 logger = logging.getLogger(__name__)
 
+# ログイン済みと判断するページ状態・ログインが必要なページ状態
+LOGGED_IN_STATES = ("mypage", "meal_top", "history")
+LOGIN_FORM_STATES = ("login_form", "second_login_form")
+
 class LoginManager:
     """ログイン管理クラス（Playwright版）"""
     
@@ -20,7 +26,11 @@ class LoginManager:
         self.selector_manager = selector_manager
         self.email, self.password = credentials
         self.config = config
+        self.deadline = Deadline()  # 実行期限（MealHistoryScraper.run で設定）
+        self.retrier = None  # 再試行（MealHistoryScraper で設定。未設定の場合は再試行しない）
     
+    @retried("login")
+    @traced("login")
     def login(self, login_url: str) -> bool:
         """ログイン処理を実行"""
         try:
@@ -43,13 +53,19 @@ class LoginManager:
             current_url = self.webdriver_manager.get_current_url()
             logger.info(f"アクセス後のURL: {current_url}")
             
-            # デバッグ用にHTMLを保存
-            self.webdriver_manager.save_debug_html("debug/login_page_debug.html")
+            # デバッグ用スナップショット（サンプリングに当たった場合のみ）
+            self.webdriver_manager.capture_debug_snapshot("login_page")
             
-            # ログインフォームが表示されているかチェック
-            if not self._check_login_form_exists(page):
-                logger.info("ログインフォームが見つかりません。既にログイン済みの可能性があります")
+            # ページ状態を判定（ログインフォーム・ログイン済みの目印のうち先に現れたもの）
+            state = self.selector_manager.classify_page(page, page_type="login", timeout=self._timeout())
+            if state is None:
+                logger.error("ログインページの状態を判定できませんでした")
+                return False
+            if state in LOGGED_IN_STATES:
+                logger.info("既にログイン済みです")
                 return True
+            if state == "second_login_form":
+                return self.perform_second_login()
             
             # ログイン情報を入力
             if not self._input_credentials(page):
@@ -59,18 +75,25 @@ class LoginManager:
             if not self._click_login_button(page):
                 return False
             
-            # ログイン後の処理を待機
-            time.sleep(self.config.get("after_login", 5))
-            
+            # ログイン後のページが現れるまで待機
+            state = self.selector_manager.classify_page(
+                page, LOGGED_IN_STATES + ("second_login_form",), page_type="login", timeout=self._timeout()
+            )
             current_url = self.webdriver_manager.get_current_url()
             logger.info(f"ログイン後のURL: {current_url}")
             
+            if state is None:
+                logger.error("ログイン後のページを確認できませんでした")
+                return False
+            if state == "second_login_form":
+                return self.perform_second_login()
             return True
             
         except Exception as e:
             logger.error(f"ログイン処理エラー: {e}")
             return False
     
+    @retried("second_login")
     def perform_second_login(self) -> bool:
         """2回目のログイン処理"""
         try:
@@ -87,41 +110,36 @@ class LoginManager:
                 return False
             
             # ログインフォームを探す
-            email_field = page.wait_for_selector('input[name="email"]', timeout=self.config.get("timeout", 30) * 1000)
-            password_field = page.locator('input[name="password"]')
+            if self.selector_manager.classify_page(page, ["second_login_form"], timeout=self._timeout()) is None:
+                logger.error("2回目のログインフォームが見つかりませんでした")
+                return False
+            selectors = self.selector_manager.get_login_selectors()
             
             # ログイン情報を入力
-            if self.email and self.password and email_field:
-                email_field.fill(self.email)
-                password_field.fill(self.password)
+            if self.email and self.password:
+                page.locator(selectors["second_login_email"]).fill(self.email, timeout=self._timeout())
+                page.locator(selectors["second_login_password"]).fill(self.password, timeout=self._timeout())
             else:
                 logger.error("認証情報が設定されていません")
                 return False
             
             # ログインボタンをクリック
-            login_button = page.locator('button#next')
-            login_button.click()
-            
-            time.sleep(self.config.get("after_login", 5))
+            page.locator(selectors["second_login_button"]).click(timeout=self._timeout())
             
+            # ログイン後のページが現れるまで待機
+            state = self.selector_manager.classify_page(page, ["history", "meal_top"], timeout=self._timeout())
             current_url = self.webdriver_manager.get_current_url()
             logger.info(f"2回目ログイン後のURL: {current_url}")
             
-            return True
+            return state is not None
             
         except Exception as e:
             logger.error(f"2回目ログイン処理エラー: {e}")
             return False
     
-    def _check_login_form_exists(self, page: Page) -> bool:
-        """ログインフォームが存在するかチェック"""
-        try:
-            selectors = self.selector_manager.get_login_selectors()
-            email_field = page.wait_for_selector(selectors["email_field"], timeout=self.config.get("timeout", 30) * 1000)
-            logger.info("ログインフォームが表示されています")
-            return True
-        except PlaywrightTimeoutError:
-            return False
+    def _timeout(self, key: str = "timeout", default: int = 30000) -> int:
+        """要素待機のタイムアウト（ミリ秒、実行期限の残り時間まで）"""
+        return self.deadline.timeout_ms(self.config.get(key, default), "login")
     
     def _input_credentials(self, page: Page) -> bool:
         """認証情報を入力"""
@@ -131,8 +149,8 @@ class LoginManager:
             password_field = page.locator(selectors["password_field"])
 
             if self.email and self.password:
-                email_field.fill(self.email)
-                password_field.fill(self.password)
+                email_field.fill(self.email, timeout=self._timeout())
+                password_field.fill(self.password, timeout=self._timeout())
             else:
                 logger.error("認証情報が設定されていません")
                 return False
@@ -153,41 +171,14 @@ class LoginManager:
     def _click_login_button(self, page: Page) -> bool:
         """ログインボタンをクリック"""
         try:
-            selectors = self.selector_manager.get_login_selectors()
-            
-            # ログインボタンを探す（複数のセレクターを試す）
-            login_button = None
-            login_button_selectors = [
-                selectors["login_button"],
-                "input[type='submit']",
-                "button:has-text('ログイン')",
-                "button:has-text('Login')",
-                "input[value*='ログイン']",
-                "input[value*='Login']"
-            ]
-            
-            for selector in login_button_selectors:
-                try:
-                    if ":has-text(" in selector:
-                        # Playwrightのテキストセレクターに変換
-                        text = selector.split("'")[1]
-                        text_selector = f"button:has-text('{text}')"
-                        login_button = page.locator(text_selector)
-                    else:
-                        login_button = page.locator(selector)
-                    
-                    if login_button.count() > 0:
-                        logger.info(f"ログインボタン発見: {selector}")
-                        break
-                except Exception:
-                    continue
-            
-            if not login_button or login_button.count() == 0:
+            # 候補セレクターを1回のDOM問い合わせで判定
+            selector = self.selector_manager.resolve(page, "login_button", "login")
+            if not selector:
                 logger.error("ログインボタンが見つかりませんでした")
                 return False
             
-            # ログインボタンをクリック
-            login_button.click()
+            logger.info(f"ログインボタン発見: {selector}")
+            page.locator(selector).first.click(timeout=self._timeout())
             logger.info("ログインボタンをクリックしました")
             return True
             
@@ -205,13 +196,9 @@ class LoginManager:
             if not page:
                 return False
             
-            # ログインフォームが存在しない場合はログイン済みと判断
-            selectors = self.selector_manager.get_login_selectors()
-            try:
-                page.wait_for_selector(selectors["email_field"], timeout=5000)
-                return False  # ログインフォームが存在する
-            except PlaywrightTimeoutError:
-                return True  # ログインフォームが存在しない
+            # ログインフォームとログイン済みの目印のうち先に現れた方で判断（状態の確認なので短く待つ）
+            state = self.selector_manager.classify_page(page, timeout=self._timeout("state_check", 5000))
+            return state in LOGGED_IN_STATES
             
         except Exception as e:
             logger.warning(f"ログイン状態チェックエラー: {e}")
@@ -0,0 +1,171 @@
+"""
+食事履歴レコード
+履歴データを型付き・省メモリな形式で保持する
+"""
+
+import sys
+import logging
+from array import array
+from dataclasses import dataclass
+from datetime import date
+from typing import List, Dict, Any, Optional, Tuple, Iterator, Iterable
+from .data_processor import DataProcessor
+
+logger = logging.getLogger(__name__)
+
+@dataclass(slots=True)
+class MealRecord:
+    """食事履歴レコード（1回の食事）"""
+    date_ordinal: int        # 確定日付の序数（date.toordinal()、未確定は0）
+    date_text: str           # サイト上の日付表記 "12月19日(木[4])"
+    hour: str
+    menus: Tuple[str, ...]
+    amount: int              # 円単位の金額
+    amount_text: str         # サイト上の金額表記 "946円" / "¥1,200"
+
+    @property
+    def resolved_date(self) -> Optional[date]:
+        """確定日付を取得"""
+        return date.fromordinal(self.date_ordinal) if self.date_ordinal else None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MealRecord":
+        """従来の辞書形式から変換（resolved_date が確定済みであること）"""
+        resolved = DataProcessor.get_resolved_date(data)
+        amount_text = data.get('amount')
+        amount_text = amount_text if isinstance(amount_text, str) else ""
+        return cls(
+            date_ordinal=resolved.toordinal() if resolved else 0,
+            date_text=sys.intern(str(data['date'])),
+            hour=sys.intern(str(data.get('hour', ""))),
+            menus=tuple(sys.intern(menu) for menu in data.get('menus') or ()),
+            amount=DataProcessor.get_amount(data),
+            amount_text=sys.intern(amount_text),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """従来の辞書形式に変換"""
+        resolved = self.resolved_date
+        return {
+            'date': self.date_text,
+            'hour': self.hour,
+            'menus': list(self.menus),
+            'amount': self.amount_text,
+            'resolved_date': resolved.isoformat() if resolved else None,
+        }
+
+class MealBatch:
+    """食事履歴の列形式コンテナ
+
+    数値は array、文字列は重複を除いたテーブルへの番号で保持する。
+    メニューは全レコード分を1本の番号列にまとめ、各レコードの開始位置を offsets に持つ。
+    """
+
+    def __init__(self):
+        self.date_ordinals = array('i')
+        self.amounts = array('i')
+        self.date_text_ids = array('i')
+        self.hour_ids = array('i')
+        self.amount_text_ids = array('i')
+        self.menu_ids = array('i')
+        self.menu_offsets = array('i', [0])
+        self.strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        self.menu_names: List[str] = []
+        self._menu_ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.date_ordinals)
+
+    def __getitem__(self, index: int) -> MealRecord:
+        return MealRecord(
+            date_ordinal=self.date_ordinals[index],
+            date_text=self.strings[self.date_text_ids[index]],
+            hour=self.strings[self.hour_ids[index]],
+            menus=self.get_menus(index),
+            amount=self.amounts[index],
+            amount_text=self.strings[self.amount_text_ids[index]],
+        )
+
+    def __iter__(self) -> Iterator[MealRecord]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def _intern_string(self, value: str) -> int:
+        """文字列テーブルに登録して番号を取得"""
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(value)
+            self._string_ids[value] = string_id
+        return string_id
+
+    def intern_menu(self, name: str) -> int:
+        """メニュー名を登録して番号を取得"""
+        menu_id = self._menu_ids.get(name)
+        if menu_id is None:
+            menu_id = len(self.menu_names)
+            self.menu_names.append(name)
+            self._menu_ids[name] = menu_id
+        return menu_id
+
+    def get_menu_id(self, name: str) -> Optional[int]:
+        """メニュー名の番号を取得（未登録はNone）"""
+        return self._menu_ids.get(name)
+
+    def get_menu_ids(self, index: int) -> array:
+        """指定レコードのメニュー番号列を取得"""
+        return self.menu_ids[self.menu_offsets[index]:self.menu_offsets[index + 1]]
+
+    def get_menus(self, index: int) -> Tuple[str, ...]:
+        """指定レコードのメニュー名を取得"""
+        return tuple(self.menu_names[menu_id] for menu_id in self.get_menu_ids(index))
+
+    def append(self, record: MealRecord) -> None:
+        """レコードを追加"""
+        self._append_values(record.date_ordinal, record.date_text, record.hour,
+                            record.menus, record.amount, record.amount_text)
+
+    def append_dict(self, data: Dict[str, Any]) -> None:
+        """従来の辞書形式のレコードを追加（MealRecordを経由しない）"""
+        resolved = DataProcessor.get_resolved_date(data)
+        amount_text = data.get('amount')
+        amount_text = amount_text if isinstance(amount_text, str) else ""
+        self._append_values(resolved.toordinal() if resolved else 0, str(data['date']),
+                            str(data.get('hour', "")), data.get('menus') or (),
+                            DataProcessor.get_amount(data), amount_text)
+
+    def _append_values(self, date_ordinal: int, date_text: str, hour: str,
+                       menus: Iterable[str], amount: int, amount_text: str) -> None:
+        """各列に値を追加"""
+        self.date_ordinals.append(date_ordinal)
+        self.amounts.append(amount)
+        self.date_text_ids.append(self._intern_string(date_text))
+        self.hour_ids.append(self._intern_string(hour))
+        self.amount_text_ids.append(self._intern_string(amount_text))
+        self.menu_ids.extend([self.intern_menu(menu) for menu in menus])
+        self.menu_offsets.append(len(self.menu_ids))
+
+    def extend(self, records: Iterable[MealRecord]) -> None:
+        """複数のレコードを追加"""
+        for record in records:
+            self.append(record)
+
+    @classmethod
+    def from_records(cls, structured_data: List[Dict[str, Any]]) -> "MealBatch":
+        """従来の辞書形式のリスト（新しい順）から作成"""
+        # 年が未確定のレコードのみ一度の走査で確定する
+        DataProcessor.resolve_dates(structured_data)
+        batch = cls()
+        for data in structured_data:
+            batch.append_dict(data)
+        logger.info(f"食事履歴を列形式に変換しました: {len(batch)}件, メニュー種類: {len(batch.menu_names)}")
+        return batch
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """従来の辞書形式のリストに変換"""
+        return [record.to_dict() for record in self]
+
+    def total_amount(self) -> int:
+        """合計金額を取得"""
+        return sum(self.amounts)
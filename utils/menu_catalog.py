@@ -0,0 +1,120 @@
+"""
+メニューカタログ機能
+メニュー名に番号を割り当て、メニューから食事履歴の行を引ける転置インデックスを管理する
+"""
+
+import os
+import json
+import logging
+from array import array
+from collections import Counter
+from datetime import date
+from typing import List, Dict, Any, Optional
+from .meal_record import MealBatch
+from .atomic_io import atomic_write
+
+logger = logging.getLogger(__name__)
+
+class MenuCatalog:
+    """メニューカタログ・転置インデックスクラス
+
+    行番号は履歴ファイル上のレコードの位置（0始まり）に対応する。
+    """
+
+    def __init__(self):
+        self.menu_names: List[str] = []
+        self._menu_ids: Dict[str, int] = {}
+        self.postings: List[array] = []      # メニュー番号 -> 行番号の配列
+        self.date_ordinals = array('i')      # 行番号 -> 確定日付の序数
+
+    def __len__(self) -> int:
+        return len(self.menu_names)
+
+    @classmethod
+    def from_batch(cls, batch: MealBatch) -> "MenuCatalog":
+        """列形式コンテナから作成（メニュー番号はコンテナの番号をそのまま使用）"""
+        catalog = cls()
+        catalog.menu_names = list(batch.menu_names)
+        catalog._menu_ids = {name: menu_id for menu_id, name in enumerate(catalog.menu_names)}
+        catalog.postings = [array('i') for _ in catalog.menu_names]
+        catalog.date_ordinals = array('i', batch.date_ordinals)
+        for row in range(len(batch)):
+            for menu_id in batch.get_menu_ids(row):
+                catalog.postings[menu_id].append(row)
+        logger.info(f"メニューカタログを作成しました: {len(catalog)}種類, {len(batch)}行")
+        return catalog
+
+    @classmethod
+    def from_records(cls, structured_data: List[Dict[str, Any]]) -> "MenuCatalog":
+        """構造化データ（新しい順）から作成"""
+        return cls.from_batch(MealBatch.from_records(structured_data))
+
+    def get_menu_id(self, name: str) -> Optional[int]:
+        """メニュー名の番号を取得（未登録はNone）"""
+        return self._menu_ids.get(name)
+
+    def rows_with(self, name: str) -> List[int]:
+        """指定メニューを含む行番号を取得"""
+        menu_id = self.get_menu_id(name)
+        return list(self.postings[menu_id]) if menu_id is not None else []
+
+    def days_with(self, name: str) -> List[date]:
+        """指定メニューを食べた日を取得（新しい順、重複なし）"""
+        ordinals = {self.date_ordinals[row] for row in self.rows_with(name)}
+        ordinals.discard(0)
+        return [date.fromordinal(ordinal) for ordinal in sorted(ordinals, reverse=True)]
+
+    def frequency(self, name: str) -> int:
+        """指定メニューを食べた回数を取得"""
+        menu_id = self.get_menu_id(name)
+        return len(self.postings[menu_id]) if menu_id is not None else 0
+
+    def frequency_by_month(self, name: str) -> Dict[str, int]:
+        """指定メニューの月別の回数を取得（キーは YYYY-MM）"""
+        counts = Counter()
+        for row in self.rows_with(name):
+            ordinal = self.date_ordinals[row]
+            if ordinal:
+                counts[date.fromordinal(ordinal).strftime('%Y-%m')] += 1
+        return dict(sorted(counts.items()))
+
+    def most_common(self, count: int = 10) -> List[tuple]:
+        """よく食べたメニューの上位を取得"""
+        ranking = sorted(range(len(self)), key=lambda menu_id: len(self.postings[menu_id]), reverse=True)
+        return [(self.menu_names[menu_id], len(self.postings[menu_id])) for menu_id in ranking[:count]]
+
+    def save(self, file_path: str) -> bool:
+        """カタログをJSONファイルに保存"""
+        try:
+            payload = {
+                "menus": self.menu_names,
+                "dates": self.date_ordinals.tolist(),
+                "postings": [rows.tolist() for rows in self.postings],
+            }
+            with atomic_write(file_path) as tmp_path:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+            logger.info(f"メニューカタログを保存しました: {file_path}")
+            return True
+        except Exception as e:
+            logger.error(f"メニューカタログ保存エラー: {e}")
+            return False
+
+    @classmethod
+    def load(cls, file_path: str) -> Optional["MenuCatalog"]:
+        """JSONファイルからカタログを読み込み"""
+        try:
+            if not os.path.exists(file_path):
+                logger.warning(f"ファイルが存在しません: {file_path}")
+                return None
+            with open(file_path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            catalog = cls()
+            catalog.menu_names = payload["menus"]
+            catalog._menu_ids = {name: menu_id for menu_id, name in enumerate(catalog.menu_names)}
+            catalog.date_ordinals = array('i', payload["dates"])
+            catalog.postings = [array('i', rows) for rows in payload["postings"]]
+            return catalog
+        except Exception as e:
+            logger.error(f"メニューカタログ読み込みエラー: {e}")
+            return None
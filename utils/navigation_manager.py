@@ -3,25 +3,133 @@
 Webサイト内のページ遷移を担当
 """
 
-import time
+import os
+import json
 import logging
+from datetime import datetime
 from playwright.sync_api import Page, TimeoutError as PlaywrightTimeoutError
 from typing import Dict, Any, Optional
 from .webdriver_manager import WebDriverManager
 from .selector_manager import SelectorManager
 from .login_manager import LoginManager
+from .event_log import traced
+from .atomic_io import atomic_write
+from .deadline import Deadline
+from .retry import retried
 
 logger = logging.getLogger(__name__)
 
 class NavigationManager:
     """ナビゲーション管理クラス（Playwright版）"""
     
-    def __init__(self, webdriver_manager: WebDriverManager, selector_manager: SelectorManager, login_manager: LoginManager, config: Dict[str, Any]):
+    def __init__(self, webdriver_manager: WebDriverManager, selector_manager: SelectorManager, login_manager: LoginManager, config: Dict[str, Any], cache_path: Optional[str] = None):
         self.webdriver_manager = webdriver_manager
         self.selector_manager = selector_manager
         self.login_manager = login_manager
         self.config = config
+        # 前回の実行で遷移できたURL（マイページ・ミール利用履歴・ご利用明細）
+        self.cache_path = cache_path
+        self.nav_cache: Dict[str, str] = self._load_cache()
+        self.page_loads = 0  # 今回の遷移で読み込んだページ数
+        self.deep_link_state: Optional[str] = None  # キャッシュしたURLに直接遷移した後のページ状態
+        self.deadline = Deadline()  # 実行期限（MealHistoryScraper.run で設定）
+        self.retrier = None  # 再試行（MealHistoryScraper で設定。未設定の場合は再試行しない）
     
+    def _timeout(self) -> int:
+        """要素待機のタイムアウト（ミリ秒、実行期限の残り時間まで）"""
+        return self.deadline.timeout_ms(self.config.get("timeout", 30000), "navigate")
+    
+    def _load_cache(self) -> Dict[str, str]:
+        """遷移先URLのキャッシュを読み込み"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"遷移先キャッシュ読み込みエラー: {e}")
+            return {}
+    
+    def _save_cache(self) -> None:
+        """遷移先URLのキャッシュを保存"""
+        if not self.cache_path:
+            return
+        try:
+            self.nav_cache["updated_at"] = datetime.now().isoformat(timespec="seconds")
+            with atomic_write(self.cache_path) as tmp_path:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self.nav_cache, f, ensure_ascii=False, indent=2)
+                # セッションに関わるURLを含む可能性があるため所有者のみ読み書き可能にする
+                os.chmod(tmp_path, 0o600)
+            logger.info(f"遷移先キャッシュを保存しました: {self.cache_path}")
+        except Exception as e:
+            logger.warning(f"遷移先キャッシュ保存エラー: {e}")
+    
+    def clear_cache(self) -> None:
+        """遷移先URLのキャッシュを破棄"""
+        self.nav_cache = {}
+        if self.cache_path and os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+    
+    def open_usage_detail(self) -> bool:
+        """ご利用明細ページを開く（キャッシュしたURLに直接遷移し、失敗した場合はリンクをたどる）"""
+        self.page_loads = 0
+        if self.nav_cache.get("usage_detail_url"):
+            if self.navigate_by_deep_link():
+                return True
+            if self.deep_link_state == "second_login_form":
+                # 2回目のログインに失敗した場合はURLの問題ではないため、キャッシュを残す
+                return False
+            
+            # ログインページや想定外のページに転送された場合はキャッシュを破棄してリンクをたどる
+            logger.info("キャッシュしたURLに遷移できませんでした。リンクをたどります")
+            mypage_url = self.nav_cache.get("mypage_url")
+            self.clear_cache()
+            if not mypage_url or not self.webdriver_manager.navigate_to(mypage_url):
+                return False
+            self.page_loads += 1
+        
+        return self.navigate_to_meal_history() and self.select_usage_detail()
+    
+    @traced("deep_link")
+    def navigate_by_deep_link(self) -> bool:
+        """キャッシュしたご利用明細のURLに直接遷移（2回目のログインを求められた場合はログインしてから再度遷移する）"""
+        self.deep_link_state = None
+        try:
+            page = self.webdriver_manager.get_page()
+            if not page or not self.webdriver_manager.navigate_to(self.nav_cache["usage_detail_url"]):
+                return False
+            self.page_loads += 1
+            
+            # 食事履歴一覧が表示されれば成功（ログインフォームなどに転送された場合は失敗）
+            states = ["history", "second_login_form", "login_form", "meal_top", "mypage"]
+            state = self.selector_manager.classify_page(page, states, page_type="meal_history", timeout=self._timeout())
+            if state == "second_login_form":
+                # ログイン状態を保存しない場合の通常の遷移（cn-univのログイン後に同じURLを開き直す）
+                self.deep_link_state = state
+                logger.info("2回目のログインが必要です")
+                if not self.login_manager.perform_second_login():
+                    return False
+                state = self.selector_manager.classify_page(page, ["history", "meal_top"], page_type="meal_history", timeout=self._timeout())
+                if state != "history":
+                    if not self.webdriver_manager.navigate_to(self.nav_cache["usage_detail_url"]):
+                        return False
+                    self.page_loads += 1
+                    state = self.selector_manager.classify_page(page, states, page_type="meal_history", timeout=self._timeout())
+            self.deep_link_state = state
+            if state != "history":
+                logger.info(f"キャッシュしたURLの遷移先: {state}")
+                return False
+            
+            logger.info(f"ご利用明細ページに直接遷移しました: {self.webdriver_manager.get_current_url()}")
+            return True
+        
+        except Exception as e:
+            logger.warning(f"キャッシュしたURLへの遷移エラー: {e}")
+            return False
+    
+    @retried("navigate")
+    @traced("navigate")
     def navigate_to_meal_history(self) -> bool:
         """食事履歴ページに遷移"""
         try:
@@ -37,41 +145,54 @@ class NavigationManager:
                 logger.error("Pageオブジェクトが初期化されていません")
                 return False
             
-            # ミール利用履歴リンクを探してクリック
-            selectors = self.selector_manager.get_navigation_selectors()
-            meal_history_link = page.wait_for_selector(
-                selectors["meal_history_link"], 
-                state="visible",
-                timeout=self.config.get("timeout", 30) * 1000
+            # ミール利用履歴リンクを探してクリック（候補セレクターのいずれかが現れるまで待機）
+            selector = self.selector_manager.wait_for(
+                page, "meal_history_link", "portal",
+                timeout=self._timeout()
             )
             
-            if meal_history_link:
-                href = meal_history_link.get_attribute("href")
-                link_text = meal_history_link.text_content()
+            if selector:
+                self.nav_cache["mypage_url"] = self.webdriver_manager.get_current_url()
+                meal_history_link = page.locator(selector).first
+                href = meal_history_link.get_attribute("href", timeout=self._timeout())
+                link_text = meal_history_link.text_content(timeout=self._timeout())
                 logger.info(f"リンク先URL: {href}")
                 logger.info(f"リンクテキスト: {link_text.strip() if link_text else 'N/A'}")
                 
-                meal_history_link.click()
+                meal_history_link.click(timeout=self._timeout())
             else:
                 logger.error("ミール利用履歴リンクが見つかりませんでした")
                 return False
-            time.sleep(self.config.get("after_click", 8))
             
-            # 遷移後の確認
+            # 遷移後のページ状態を判定（2回目のログインフォームまたは食事履歴ページ）
+            state = self.selector_manager.classify_page(
+                page, ["second_login_form", "meal_top", "history"], page_type="meal_top",
+                timeout=self._timeout()
+            )
             current_url = self.webdriver_manager.get_current_url()
             logger.info(f"遷移後のURL: {current_url}")
             
-            # 2回目のログインが必要な場合
-            if "login" in current_url.lower():
+            self.page_loads += 1
+            if state is None:
+                logger.error("遷移後のページを確認できませんでした")
+                return False
+            
+            # 2回目のログインが必要な場合（ログインページのURLはキャッシュしない）
+            if state == "second_login_form":
                 logger.info("2回目のログインが必要です")
-                return self.login_manager.perform_second_login()
+                if not self.login_manager.perform_second_login():
+                    return False
+                current_url = self.webdriver_manager.get_current_url()
             
+            self.nav_cache["meal_history_url"] = current_url
             return True
             
         except Exception as e:
             logger.error(f"食事履歴ページ遷移エラー: {e}")
             return False
     
+    @retried("select_usage_detail")
+    @traced("select_usage_detail")
     def select_usage_detail(self) -> bool:
         """ご利用明細を選択"""
         try:
@@ -87,24 +208,33 @@ class NavigationManager:
                 logger.error("Pageオブジェクトが初期化されていません")
                 return False
             
-            # ご利用明細リンクを探してクリック
-            selectors = self.selector_manager.get_navigation_selectors()
-            usage_detail_link = page.wait_for_selector(
-                selectors["usage_detail_link"],
-                state="visible",
-                timeout=self.config.get("timeout", 30) * 1000
+            # ご利用明細リンクを探してクリック（候補セレクターのいずれかが現れるまで待機）
+            selector = self.selector_manager.wait_for(
+                page, "usage_detail_link", "meal_top",
+                timeout=self._timeout()
             )
             
-            if usage_detail_link:
-                usage_detail_link.click()
+            if selector:
+                page.locator(selector).first.click(timeout=self._timeout())
             else:
                 logger.error("ご利用明細リンクが見つかりませんでした")
                 return False
-            time.sleep(self.config.get("after_click", 8))
             
+            # 食事履歴一覧が現れるまで待機
+            state = self.selector_manager.classify_page(
+                page, ["history"], page_type="meal_history",
+                timeout=self._timeout()
+            )
             current_url = self.webdriver_manager.get_current_url()
             logger.info(f"ご利用明細遷移後のURL: {current_url}")
+            self.page_loads += 1
+            
+            if state is None:
+                return False
             
+            # 次回はこのURLに直接遷移する
+            self.nav_cache["usage_detail_url"] = current_url
+            self._save_cache()
             return True
             
         except Exception as e:
@@ -128,8 +258,8 @@ class NavigationManager:
                 more_button = page.locator(selectors["more_button"])
                 if more_button.count() > 0 and more_button.is_visible():
                     logger.info("「もっと見る」ボタンをクリックします")
-                    more_button.click()
-                    time.sleep(self.config.get("element_load", 3))
+                    more_button.click(timeout=self._timeout())
+                    self.deadline.sleep(self.config.get("element_load", 3))
                     return True
             except Exception:
                 logger.info("「もっと見る」ボタンは見つかりませんでした")
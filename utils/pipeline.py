@@ -0,0 +1,141 @@
+"""
+レコードパイプライン機能
+抽出中のレコードを上限付きキュー経由で複数の出力先（保存・アーカイブ・メール）に並行して渡す
+"""
+
+import queue
+import logging
+import threading
+import contextvars
+from typing import Dict, Any, List, Optional, Callable
+from .event_log import event_phase
+
+logger = logging.getLogger(__name__)
+
+# キューの終端を表す値
+_END = object()
+
+class RecordSink:
+    """パイプラインの出力先
+
+    on_batch はレコードが届くたびに（キューにたまっている分をまとめて）呼び出され、
+    on_finish は抽出が終わった後に全レコードを渡して呼び出される（レコードが1件もない場合は呼び出さない）。
+    いずれも戻り値が False の場合は失敗として扱う。
+    on_abort は抽出が中断された場合に受け取り済みのレコードを渡して呼び出される（on_batch の結果の取り消し用）。
+    """
+
+    def __init__(self, name: str, on_batch: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+                 on_finish: Optional[Callable[[List[Dict[str, Any]]], Any]] = None,
+                 on_abort: Optional[Callable[[List[Dict[str, Any]]], Any]] = None):
+        self.name = name
+        self.on_batch = on_batch
+        self.on_finish = on_finish
+        self.on_abort = on_abort
+
+class RecordPipeline:
+    """レコードパイプラインクラス
+
+    出力先ごとに上限付きのキューと処理スレッドを持つ。put() はキューが満杯の場合に待機するため、
+    出力先の処理が追いつかない場合でもメモリ使用量は一定に保たれる。
+    ある出力先でエラーが発生しても、ほかの出力先と抽出処理は継続する。
+    """
+
+    def __init__(self, sinks: List[RecordSink], maxsize: int = 32):
+        self.sinks = sinks
+        self.maxsize = maxsize
+        self.results: Dict[str, bool] = {}
+        self._queues: Dict[str, queue.Queue] = {}
+        self._threads: List[threading.Thread] = []
+        self._aborted = False
+
+    def start(self) -> "RecordPipeline":
+        """出力先ごとの処理スレッドを起動"""
+        for sink in self.sinks:
+            sink_queue = queue.Queue(maxsize=self.maxsize)
+            self._queues[sink.name] = sink_queue
+            # 実行IDなどの相関IDを処理スレッドに引き継ぐ
+            context = contextvars.copy_context()
+            thread = threading.Thread(target=context.run, args=(self._worker, sink, sink_queue), name=f"pipeline-{sink.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def put(self, batch: List[Dict[str, Any]]) -> None:
+        """レコードをすべての出力先に渡す"""
+        if not batch:
+            return
+        for sink_queue in self._queues.values():
+            sink_queue.put(batch)
+
+    def end_input(self) -> None:
+        """抽出の終了を通知（出力先は残りのレコードを処理した後、全レコードに対する処理を開始する）"""
+        for sink_queue in self._queues.values():
+            sink_queue.put(_END)
+        self._queues = {}
+
+    def abort(self) -> None:
+        """抽出の中断を通知（出力先は受け取り済みのレコードの処理のみ行い、全レコードに対する処理は行わない）"""
+        self._aborted = True
+        self.end_input()
+
+    def close(self) -> Dict[str, bool]:
+        """抽出の終了を通知し、すべての出力先の完了を待って結果を返す"""
+        self.end_input()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        return dict(self.results)
+
+    def _worker(self, sink: RecordSink, sink_queue: queue.Queue) -> None:
+        """出力先の処理スレッドの本体"""
+        records: List[Dict[str, Any]] = []
+        failed = False
+        finished = False
+        with event_phase(sink.name) as event:
+            while not finished:
+                # キューにたまっている分をまとめて処理する
+                batch = []
+                item = sink_queue.get()
+                while True:
+                    if item is _END:
+                        finished = True
+                        break
+                    # 出力先ごとに辞書をコピーし、他の出力先による項目の追加と干渉しないようにする
+                    batch.extend(dict(data) for data in item)
+                    try:
+                        item = sink_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if not batch:
+                    continue
+
+                records.extend(batch)
+                if sink.on_batch and not failed:
+                    try:
+                        if sink.on_batch(batch) is False:
+                            failed = True
+                    except Exception as e:
+                        # 失敗後もキューは読み続け、抽出処理を止めない
+                        logger.error(f"パイプライン出力エラー（{sink.name}）: {e}")
+                        failed = True
+
+            if self._aborted:
+                # 中断した場合は一部のレコードのみのため、完了として扱わない
+                failed = True
+                if sink.on_abort:
+                    try:
+                        sink.on_abort(records)
+                    except Exception as e:
+                        logger.error(f"パイプライン中断処理エラー（{sink.name}）: {e}")
+            elif sink.on_finish and records and not failed:
+                try:
+                    if sink.on_finish(records) is False:
+                        failed = True
+                except Exception as e:
+                    logger.error(f"パイプライン出力エラー（{sink.name}）: {e}")
+                    failed = True
+
+            event["records"] = len(records)
+            if failed:
+                event["status"] = "failed"
+        self.results[sink.name] = not failed
@@ -0,0 +1,121 @@
+"""
+フェーズプロファイル機能
+event_phase で計測しているフェーズ（ログイン・抽出・保存・メールなど）を cProfile と tracemalloc で計測し、
+フェーズごとの .pstats ファイルとメモリ確保の上位レポートを実行ディレクトリに書き出す
+
+プロファイラーを開始していない場合、event_phase の追加コストはプロファイラーの有無の確認のみ。
+"""
+
+import os
+import time
+import cProfile
+import logging
+import threading
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterable, Iterator
+from .event_log import set_phase_profiler
+
+logger = logging.getLogger(__name__)
+
+# プロファイル設定を直接定義（循環インポート回避）
+PROFILE_CONFIG = {
+    "dir": "debug/profiles",
+    # 既定でプロファイルするフェーズ（"run" は他のフェーズを含むため、指定した場合のみ）
+    "phases": ["browser_setup", "login", "navigate", "deep_link", "extract", "save", "archive", "email", "compact"],
+    "top": 30,       # レポートに出力する上位の件数
+    "frames": 10     # メモリ確保元として記録するスタックの深さ
+}
+
+class PhaseProfiler:
+    """フェーズプロファイラークラス
+
+    出力先: <dir>/<開始日時>/<連番>_<フェーズ>.pstats     cProfile の計測結果（python -m pstats で参照）
+            <dir>/<開始日時>/<連番>_<フェーズ>.alloc.txt  フェーズ中に増えたメモリ確保の上位
+
+    cProfile はスレッドごとに計測するため、出力先のスレッドで実行されるフェーズもそれぞれ計測できる。
+    同じスレッドで入れ子になったフェーズは外側のフェーズの cProfile に含まれ、内側はメモリ確保のみ記録する。
+    tracemalloc はプロセス全体で共有されるため、並行して実行されたフェーズのメモリ確保も含まれる。
+    """
+
+    def __init__(self, phases: Optional[Iterable[str]] = None, run_dir: Optional[str] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        self.config = {**PROFILE_CONFIG, **(config or {})}
+        self.phases = set(phases or self.config["phases"])
+        self.run_dir = run_dir or os.path.join(self.config["dir"], datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.reports: List[str] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+
+    def start(self) -> "PhaseProfiler":
+        """プロファイルを開始（以降の event_phase が対象になる）"""
+        os.makedirs(self.run_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.config["frames"])
+            self._started_tracemalloc = True
+        set_phase_profiler(self)
+        logger.info(f"プロファイルを開始しました: {sorted(self.phases)} → {self.run_dir}")
+        return self
+
+    def stop(self) -> None:
+        """プロファイルを終了"""
+        set_phase_profiler(None)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        logger.info(f"プロファイルを終了しました: {len(self.reports)}件 → {self.run_dir}")
+
+    @contextmanager
+    def profile(self, phase: str) -> Iterator[None]:
+        """フェーズを計測（対象外のフェーズは何もしない）"""
+        if phase not in self.phases:
+            yield
+            return
+
+        profiler = None
+        if not getattr(self._local, "active", False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self._local.active = True
+            except ValueError as e:
+                # 別のプロファイラーが動作している場合はメモリ確保のみ記録する
+                logger.debug(f"cProfileを開始できません（{phase}）: {e}")
+                profiler = None
+
+        before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                self._local.active = False
+            self._write_reports(phase, elapsed, profiler, before)
+
+    def _write_reports(self, phase: str, elapsed: float, profiler: Optional[cProfile.Profile], before) -> None:
+        """フェーズの .pstats とメモリ確保のレポートを書き出し"""
+        with self._lock:
+            name = f"{len(self.reports) + 1:02d}_{phase}"
+            self.reports.append(name)
+        try:
+            if profiler is not None:
+                profiler.dump_stats(os.path.join(self.run_dir, f"{name}.pstats"))
+
+            lines = [f"phase: {phase}", f"duration: {elapsed:.3f}s", f"thread: {threading.current_thread().name}"]
+            if before is not None and tracemalloc.is_tracing():
+                filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+                after = tracemalloc.take_snapshot().filter_traces(filters)
+                stats = after.compare_to(before.filter_traces(filters), "lineno")
+                current, peak = tracemalloc.get_traced_memory()
+                lines.append(f"traced memory: current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB")
+                lines.append(f"top {self.config['top']} allocations (size diff):")
+                lines.extend(str(stat) for stat in stats[:self.config["top"]])
+            with open(os.path.join(self.run_dir, f"{name}.alloc.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            logger.info(f"プロファイルを保存しました: {name}（{elapsed:.3f}秒）")
+        except Exception as e:
+            logger.warning(f"プロファイル保存エラー（{phase}）: {e}")
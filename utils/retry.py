@@ -0,0 +1,211 @@
+"""
+リトライ機能
+フェーズごとの試行回数・ジッター付き指数バックオフでの再試行と、サイト停止時に要求を止めるサーキットブレーカー
+
+再試行は失敗した最小の単位（ページ遷移1回・リンクのクリック1回・明細1件の解析）で行う。
+内側のフェーズが再試行を使い切って失敗した場合、外側のフェーズは同じ原因で再試行しない。
+サーキットブレーカーは report_site_failure() で報告されたサイト停止の失敗だけを数え、
+認証エラーや実行期限切れは数えない（複数アカウントの実行で他のアカウントを止めないため）。
+"""
+
+import time
+import random
+import logging
+import functools
+import threading
+from typing import Dict, Any, Optional, Callable
+from .deadline import Deadline, DeadlineExceeded
+from .event_log import emit_event
+
+logger = logging.getLogger(__name__)
+
+# リトライ設定を直接定義（循環インポート回避）
+RETRY_CONFIG = {
+    # フェーズごとの試行回数と初回の待機時間（秒）。記載のないフェーズは再試行しない
+    "phases": {
+        "browser_setup": {"attempts": 2, "base_delay": 2.0},
+        "navigate_to": {"attempts": 3, "base_delay": 1.0},
+        "login": {"attempts": 2, "base_delay": 2.0},
+        "second_login": {"attempts": 2, "base_delay": 2.0},
+        "navigate": {"attempts": 2, "base_delay": 1.0},
+        "select_usage_detail": {"attempts": 2, "base_delay": 1.0},
+        "parse": {"attempts": 2, "base_delay": 0.2}
+    },
+    "multiplier": 2.0,
+    "max_delay": 30.0,
+    # サーキットブレーカーが開いている間は要求しないフェーズ（サイトの応答に依存するもの）
+    "breaker_phases": ["navigate_to", "login", "second_login", "navigate", "select_usage_detail"],
+    "failure_threshold": 5,   # サイト停止の失敗が連続してこの回数に達したら要求を止める
+    "reset_timeout": 120.0    # 止めてから試しに1回要求するまでの時間（秒）
+}
+
+class CircuitBreaker:
+    """サーキットブレーカークラス
+
+    closed（通常）→ 連続失敗が failure_threshold 回に達すると open（要求しない）→
+    reset_timeout 秒後に half_open（1回だけ試す）→ 成功すれば closed、失敗すれば再び open。
+    half_open の間は試行中のスレッドの要求（入れ子のフェーズを含む）だけを通す。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 120.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_thread: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """要求してよいかどうか"""
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_thread = threading.get_ident()
+                logger.info(f"サーキットブレーカーを半開にします（{self.name}）")
+                return True
+            if self.state == "half_open":
+                return self._trial_thread == threading.get_ident()
+            return self.state == "closed"
+
+    def record_success(self) -> None:
+        """成功を記録"""
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"サーキットブレーカーを閉じました（{self.name}）")
+            self.state = "closed"
+            self.failures = 0
+            self._trial_thread = None
+
+    def record_failure(self) -> None:
+        """失敗を記録"""
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._trial_thread = None
+                logger.error(f"サーキットブレーカーを開きました（{self.name}、連続失敗 {self.failures}回）。{self.reset_timeout:.0f}秒間要求を止めます")
+
+    def end_trial(self) -> None:
+        """半開の試行が結果（成功・サイト停止の失敗）を出さずに終わった場合は開いた状態に戻す（次の要求で試し直す）"""
+        with self._lock:
+            if self.state == "half_open" and self._trial_thread == threading.get_ident():
+                self.state = "open"
+                self._trial_thread = None
+
+# サイト停止を示す失敗の報告（スレッドごと。Retrier.call が試行ごとに確認して消去する）
+_site_failures = threading.local()
+
+def report_site_failure(reason: str) -> None:
+    """サイト停止を示す失敗（ページ遷移のタイムアウト・接続エラー・5xx/429応答）を報告"""
+    _site_failures.reason = reason
+
+def _consume_site_failure() -> Optional[str]:
+    """この試行で報告されたサイト停止の失敗を取得して消去"""
+    reason = getattr(_site_failures, "reason", None)
+    _site_failures.reason = None
+    return reason
+
+# プロセス内で共有するサーキットブレーカー（複数アカウントの実行でも同じサイトには1つ）
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name: str, config: Optional[Dict[str, Any]] = None) -> CircuitBreaker:
+    """名前ごとのサーキットブレーカーを取得（なければ作成）"""
+    config = {**RETRY_CONFIG, **(config or {})}
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, config["failure_threshold"], config["reset_timeout"])
+        return _breakers[name]
+
+class Retrier:
+    """フェーズごとのリトライ管理クラス
+
+    失敗は例外または偽の戻り値（False・None・空リスト）で判定する。
+    再試行を使い切った場合は最後の戻り値を返す（例外の場合は送出する）。
+    DeadlineExceeded は再試行せず、サーキットブレーカーにも記録せずにそのまま送出する。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, breaker: Optional[CircuitBreaker] = None):
+        self.config = {**RETRY_CONFIG, **(config or {})}
+        self.breaker = breaker or get_circuit_breaker("meal_site", self.config)
+        self.deadline = Deadline()  # 実行期限（MealHistoryScraper.run で設定）
+        self._local = threading.local()
+
+    def backoff(self, phase: str, attempt: int) -> float:
+        """attempt 回目の失敗後の待機時間（フルジッター付き指数バックオフ）"""
+        base = self.config["phases"][phase]["base_delay"]
+        return random.uniform(0, min(self.config["max_delay"], base * self.config["multiplier"] ** (attempt - 1)))
+
+    def call(self, phase: str, func: Callable, *args, **kwargs) -> Any:
+        """フェーズの処理を再試行付きで呼び出し"""
+        self._local.depth = getattr(self._local, "depth", 0) + 1
+        try:
+            return self._call(phase, func, *args, **kwargs)
+        finally:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self.breaker.end_trial()
+
+    def _call(self, phase: str, func: Callable, *args, **kwargs) -> Any:
+        """再試行のループ（call から呼び出す）"""
+        attempts = self.config["phases"].get(phase, {}).get("attempts", 1)
+        uses_breaker = phase in self.config["breaker_phases"]
+        attempt = 0
+        while True:
+            attempt += 1
+            if uses_breaker and not self.breaker.allow():
+                logger.warning(f"サーキットブレーカーが開いているため要求しません（{phase}）")
+                self._local.exhausted = True
+                return False
+
+            self._local.exhausted = False
+            _consume_site_failure()
+            try:
+                result, error = func(*args, **kwargs), None
+            except DeadlineExceeded:
+                self._local.exhausted = True
+                raise
+            except Exception as e:
+                result, error = None, e
+            site_failure = _consume_site_failure()
+
+            if error is None and result:
+                if uses_breaker:
+                    self.breaker.record_success()
+                self._local.exhausted = False
+                return result
+
+            # サイト停止の失敗のみ数える（実行期限で打ち切られたタイムアウトは数えない）
+            if uses_breaker and site_failure and not self.deadline.expired:
+                self.breaker.record_failure()
+            # 内側のフェーズが再試行を使い切った場合は、同じ原因で再試行しない
+            if attempt >= attempts or getattr(self._local, "exhausted", False) or self.deadline.expired:
+                break
+            delay = self.backoff(phase, attempt)
+            if delay >= self.deadline.remaining():
+                logger.warning(f"実行期限までに再試行できないため中止します（{phase}）")
+                break
+            logger.warning(f"{phase}に失敗しました。{delay:.1f}秒後に再試行します（{attempt + 1}/{attempts}回目）")
+            emit_event("retry", target=phase, attempt=attempt + 1, delay_ms=round(delay * 1000, 1),
+                       error=str(error) if error else site_failure)
+            self.deadline.sleep(delay)
+
+        self._local.exhausted = True
+        if error is not None:
+            raise error
+        return result
+
+def retried(phase: str):
+    """マネージャーのメソッドを再試行付きで呼び出すデコレーター（self.retrier が未設定の場合はそのまま呼び出す）"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            retrier = getattr(self, "retrier", None)
+            if retrier is None:
+                return method(self, *args, **kwargs)
+            return retrier.call(phase, method, self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,109 @@
+"""
+実行チェックポイント機能
+実行の各フェーズの完了状況と途中結果（ログイン状態・抽出レコード・作成済みメール）を保存し、
+失敗した実行を完了済みのフェーズの次から再開できるようにする
+"""
+
+import os
+import json
+import shutil
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from .atomic_io import atomic_write
+from .history_writer import JOURNAL_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# チェックポイントを記録するフェーズ（実行順）
+CHECKPOINT_PHASES = ("login", "extract", "save", "archive", "email")
+
+class RunCheckpoint:
+    """実行チェックポイントクラス
+
+    レイアウト:
+        <directory>/state.json     完了したフェーズと実行ID
+        <directory>/session.json   ログイン状態（Cookie・localStorage）
+        <directory>/records.json   抽出したレコード
+        <directory>/message.json   作成済みのメール本文とMessage-ID
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.state_path = os.path.join(directory, "state.json")
+        self.session_path = os.path.join(directory, "session.json")
+        self.records_path = os.path.join(directory, "records.json")
+        self.message_path = os.path.join(directory, "message.json")
+        self.state: Dict[str, Any] = {}
+
+    def load(self) -> Dict[str, Any]:
+        """保存されているチェックポイントを読み込み（ない場合は空）"""
+        self.state = self._read_json(self.state_path) or {}
+        if self.state:
+            logger.info(f"チェックポイントを読み込みました: 実行ID {self.state.get('run_id')}, 完了 {self.completed_phases()}")
+        return self.state
+
+    def start(self, run_id: str) -> None:
+        """新しい実行のチェックポイントを開始（前回の途中結果は破棄）"""
+        self.clear()
+        self.state = {"run_id": run_id, "started_at": datetime.now().isoformat(timespec="seconds"), "completed": {}}
+        self._write_json(self.state_path, self.state)
+
+    def is_completed(self, phase: str) -> bool:
+        """フェーズが完了済みかどうか"""
+        return phase in self.state.get("completed", {})
+
+    def completed_phases(self) -> List[str]:
+        """完了済みのフェーズを実行順に取得"""
+        return [phase for phase in CHECKPOINT_PHASES if self.is_completed(phase)]
+
+    def pending_phases(self) -> List[str]:
+        """未完了のフェーズを実行順に取得"""
+        return [phase for phase in CHECKPOINT_PHASES if not self.is_completed(phase)]
+
+    def complete(self, phase: str, **info: Any) -> None:
+        """フェーズの完了を記録"""
+        self.state.setdefault("completed", {})[phase] = {"at": datetime.now().isoformat(timespec="seconds"), **info}
+        self._write_json(self.state_path, self.state)
+        logger.info(f"チェックポイントを記録しました: {phase}")
+
+    def save_records(self, structured_data: List[Dict[str, Any]]) -> None:
+        """抽出したレコードを保存"""
+        self._write_json(self.records_path, [{field: data.get(field) for field in JOURNAL_FIELDS} for data in structured_data])
+
+    def load_records(self) -> List[Dict[str, Any]]:
+        """保存したレコードを読み込み"""
+        return self._read_json(self.records_path) or []
+
+    def save_message(self, html_body: str, message_id: str) -> None:
+        """作成したメール本文とMessage-IDを保存（再送時に同じメールとして扱われるようにする）"""
+        self._write_json(self.message_path, {"message_id": message_id, "html_body": html_body})
+
+    def load_message(self) -> Optional[Tuple[str, str]]:
+        """保存したメール本文とMessage-IDを読み込み"""
+        message = self._read_json(self.message_path)
+        return (message["html_body"], message["message_id"]) if message else None
+
+    def clear(self) -> None:
+        """チェックポイントを削除"""
+        self.state = {}
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+    def _read_json(self, path: str) -> Optional[Any]:
+        """JSONファイルを読み込み（存在しない・壊れている場合はNone）"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"チェックポイント読み込みエラー: {path}: {e}")
+            return None
+
+    def _write_json(self, path: str, payload: Any) -> None:
+        """JSONファイルをアトミックに書き込み（所有者のみ読み書き可能）"""
+        with atomic_write(path) as tmp_path:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, default=str)
+            os.chmod(tmp_path, 0o600)
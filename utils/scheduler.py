@@ -0,0 +1,236 @@
+"""
+複数アカウントのスケジューラー機能
+対象ホストごとのトークンバケットで要求の間隔を保ち、応答時間とエラー率から並列数を調整しながら
+複数アカウントのスクレイピングを実行する
+"""
+
+import time
+import random
+import logging
+import threading
+from urllib.parse import urlparse
+from typing import Dict, Any, List, Optional, Callable
+from .event_log import emit_event
+from .deadline import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# スケジューラー設定を直接定義（循環インポート回避）
+SCHEDULER_CONFIG = {
+    # ホストごとの要求レート（1秒あたり）と連続して許可する要求数。サブドメインにも適用する
+    "hosts": {
+        "hiroshima.meal.univ-coop.net": {"rate": 1.0, "burst": 3},
+        "cn-univ.coop": {"rate": 1.0, "burst": 3}
+    },
+    "limited_resources": ["document", "xhr", "fetch"],  # レート制限の対象とするリソースの種類
+    "start_jitter": 5.0,          # アカウントごとの開始のばらつき（秒）
+    "initial_concurrency": 2,
+    "min_concurrency": 1,
+    "max_concurrency": 6,
+    "target_latency": 3.0,        # 応答時間（p90、秒）がこれを超えたら並列数を減らす
+    "max_error_rate": 0.1,        # エラー率がこれを超えたら並列数を減らす
+    "window": 20                  # 並列数を見直すまでの観測数
+}
+
+class TokenBucket:
+    """トークンバケットクラス（スレッドセーフ）
+
+    トークンが足りない場合は先に予約して不足分の時間だけ待つため、待機中の要求も到着順に間隔が空く。
+    待機が max_wait 秒に収まらない場合は予約せずに DeadlineExceeded を送出する（間隔を詰めて送らない）。
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: float = float("inf")) -> float:
+        """トークンを1つ取得（待機した秒数を返す。待機が max_wait 秒を超える場合は DeadlineExceeded）"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+            if wait > max_wait:
+                raise DeadlineExceeded(f"要求の間隔を保つには{wait:.2f}秒待つ必要があります（残り{max_wait:.2f}秒）")
+            self.tokens -= 1
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+class AdaptiveConcurrency:
+    """適応的な並列数制御クラス
+
+    観測（応答時間・エラー）が window 件たまるごとに並列数を見直し、エラー率または応答時間（p90）が
+    目標を超えた場合は半分に減らし、それ以外は1つ増やす（加算増加・乗算減少）。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**SCHEDULER_CONFIG, **(config or {})}
+        self.limit = self.config["initial_concurrency"]
+        self.in_flight = 0
+        self.history: List[int] = [self.limit]
+        self._latencies: List[float] = []
+        self._samples = 0
+        self._errors = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """実行枠を取得（並列数の上限に達している場合は待機）"""
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self) -> None:
+        """実行枠を返却"""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record(self, latency: Optional[float] = None, error: bool = False) -> None:
+        """応答時間（秒）またはエラーを記録"""
+        with self._condition:
+            self._samples += 1
+            if error:
+                self._errors += 1
+            if latency is not None:
+                self._latencies.append(latency)
+            if self._samples >= self.config["window"]:
+                self._adjust()
+
+    def _adjust(self) -> None:
+        """観測結果から並列数を見直す（ロック取得済みで呼び出す）"""
+        error_rate = self._errors / self._samples
+        latencies = sorted(self._latencies)
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))] if latencies else 0.0
+        if error_rate > self.config["max_error_rate"] or p90 > self.config["target_latency"]:
+            limit = max(self.config["min_concurrency"], self.limit // 2)
+        else:
+            limit = min(self.config["max_concurrency"], self.limit + 1)
+
+        if limit != self.limit:
+            logger.info(f"並列数を変更します: {self.limit} → {limit}（エラー率 {error_rate:.0%}, p90 {p90:.2f}秒）")
+            emit_event("concurrency", limit=limit, error_rate=round(error_rate, 3), p90_ms=round(p90 * 1000, 1))
+            self.limit = limit
+            self.history.append(limit)
+            self._condition.notify_all()
+        self._latencies, self._samples, self._errors = [], 0, 0
+
+class HostRateLimiter:
+    """対象ホストごとのレート制限クラス
+
+    LaunchProfile.new_context() で作成したコンテキストの要求をホストごとのトークンバケットで待たせ、
+    応答時間とエラー（5xx・429・通信エラー）を並列数の制御に渡す。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, controller: Optional[AdaptiveConcurrency] = None):
+        self.config = {**SCHEDULER_CONFIG, **(config or {})}
+        self.controller = controller
+        self.limited_resources = set(self.config["limited_resources"])
+        self._buckets = {
+            host: TokenBucket(limit["rate"], limit["burst"])
+            for host, limit in self.config["hosts"].items()
+        }
+
+    def _bucket(self, url: str) -> Optional[TokenBucket]:
+        """URLのホストに対応するトークンバケットを取得（対象外のホストはNone）"""
+        host = urlparse(url).hostname or ""
+        for name, bucket in self._buckets.items():
+            if host == name or host.endswith("." + name):
+                return bucket
+        return None
+
+    def is_limited(self, url: str, resource_type: str) -> bool:
+        """レート制限の対象の要求かどうか"""
+        return resource_type in self.limited_resources and self._bucket(url) is not None
+
+    def acquire(self, url: str, resource_type: str = "document", max_wait: float = float("inf")) -> float:
+        """要求を送ってよくなるまで待機（待機した秒数を返す。実行期限の残り時間などの max_wait 秒に収まらない場合は DeadlineExceeded）"""
+        if resource_type not in self.limited_resources:
+            return 0.0
+        bucket = self._bucket(url)
+        return bucket.acquire(max_wait) if bucket else 0.0
+
+    def observe(self, latency: Optional[float] = None, error: bool = False) -> None:
+        """応答時間またはエラーを並列数の制御に渡す"""
+        if self.controller is not None:
+            self.controller.record(latency, error)
+
+    def watch(self, context) -> None:
+        """コンテキストの応答を観測"""
+        def on_response(response):
+            request = response.request
+            if response.status >= 500 or response.status == 429:
+                if self.is_limited(request.url, request.resource_type):
+                    self.observe(error=True)
+
+        def on_finished(request):
+            if self.is_limited(request.url, request.resource_type):
+                response_end = request.timing.get("responseEnd", -1)
+                if response_end >= 0:
+                    self.observe(latency=response_end / 1000)
+
+        def on_failed(request):
+            if self.is_limited(request.url, request.resource_type):
+                self.observe(error=True)
+
+        context.on("response", on_response)
+        context.on("requestfinished", on_finished)
+        context.on("requestfailed", on_failed)
+
+class AccountScheduler:
+    """複数アカウントのスケジューラークラス
+
+    アカウントごとに開始時刻をずらし、AdaptiveConcurrency の並列数の範囲でアカウントを並行して実行する。
+    """
+
+    def __init__(self, run_account: Callable[[str], bool], controller: Optional[AdaptiveConcurrency] = None,
+                 config: Optional[Dict[str, Any]] = None):
+        self.config = {**SCHEDULER_CONFIG, **(config or {})}
+        self.run_account = run_account
+        self.controller = controller or AdaptiveConcurrency(self.config)
+        self.results: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def run(self, accounts: List[str]) -> Dict[str, bool]:
+        """すべてのアカウントを実行して結果（アカウント → 成否）を返す"""
+        pending = list(accounts)
+        start = time.perf_counter()
+
+        def worker():
+            while True:
+                with self._lock:
+                    if not pending:
+                        return
+                    account = pending.pop(0)
+                # 同時に始まった要求がサイトに集中しないよう、アカウントごとに開始をずらす
+                time.sleep(random.uniform(0, self.config["start_jitter"]))
+                self.controller.acquire()
+                try:
+                    success = bool(self.run_account(account))
+                except Exception as e:
+                    logger.error(f"アカウントの実行エラー（{account}）: {e}")
+                    success = False
+                finally:
+                    self.controller.release()
+                if not success:
+                    self.controller.record(error=True)
+                with self._lock:
+                    self.results[account] = success
+
+        workers = min(self.config["max_concurrency"], len(accounts))
+        threads = [threading.Thread(target=worker, name=f"scheduler-{index}", daemon=True) for index in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        succeeded = sum(self.results.values())
+        logger.info(
+            f"全アカウントの実行が完了しました: 成功 {succeeded}/{len(accounts)}, "
+            f"{time.perf_counter() - start:.1f}秒, 並列数の推移 {self.controller.history}"
+        )
+        return dict(self.results)
@@ -9,6 +9,45 @@ from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
+# 候補セレクターのうち最初に一致したものの番号を返すスクリプトの雛形（1回の呼び出しで複数キーを判定）
+# CSSセレクターとXPath（"/" または "(" で始まるもの）に対応し、{match} で要素の判定条件を差し替える
+_PROBE_TEMPLATE = """
+(groups) => groups.map((candidates) => candidates.findIndex((selector) => {{
+    try {{
+        const el = (selector.startsWith('/') || selector.startsWith('('))
+            ? document.evaluate(selector, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue
+            : document.querySelector(selector);
+        return {match};
+    }} catch (e) {{
+        return false;
+    }}
+}}))
+"""
+
+# 要素が存在するかだけを判定するスクリプト（probe 用）
+PROBE_SCRIPT = _PROBE_TEMPLATE.format(match="el !== null")
+
+# 要素が表示されているかを判定するスクリプト（Playwright の state="visible" と同じく、
+# 描画領域を持ち visibility: hidden でない要素だけを一致とみなす。待機用）
+VISIBLE_PROBE_SCRIPT = _PROBE_TEMPLATE.format(
+    match="el !== null && el.getClientRects().length > 0 && getComputedStyle(el).visibility !== 'hidden'"
+)
+
+# 候補セレクターのいずれかが表示されるまで待機するスクリプト（一致したセレクターを返す）
+WAIT_SCRIPT = f"(candidates) => {{ const index = ({VISIBLE_PROBE_SCRIPT})([candidates])[0]; return index >= 0 ? candidates[index] : null; }}"
+
+# 複数のページ状態の目印が表示されるのを同時に待機し、最初に見つかった状態名を返すスクリプト
+CLASSIFY_SCRIPT = f"(states) => {{ const found = ({VISIBLE_PROBE_SCRIPT})(states.map((state) => state[1])); const index = found.findIndex((i) => i >= 0); return index >= 0 ? states[index][0] : null; }}"
+
+# ページ状態と目印となるセレクターのキー（複数の目印が同時にある場合は先に書いた状態を優先）
+PAGE_STATES = [
+    ("second_login_form", "second_login_button"),  # cn-univの2回目のログインフォーム
+    ("login_form", "email_field"),                # ログインフォーム
+    ("history", "history_articles"),              # 食事履歴一覧
+    ("meal_top", "usage_detail_link"),            # ミール利用履歴トップ
+    ("mypage", "meal_history_link"),              # マイページ（ログイン済み）
+]
+
 @dataclass
 class SelectorConfig:
     """セレクター設定データクラス"""
@@ -37,11 +76,18 @@ class SelectorConfig:
     more_button: str
 
 class SelectorManager:
-    """セレクター管理クラス"""
+    """セレクター管理クラス
+
+    各キーのセレクターは「基本セレクター → 代替セレクター」の順の候補として扱う。
+    ページ上で一致した候補はページ種別ごとに記録し、次回以降はその候補を優先する。
+    """
     
-    def __init__(self, selectors: Optional[Dict[str, str]] = None):
-        self.selectors = selectors or self._get_default_selectors()
+    def __init__(self, selectors: Optional[Dict[str, str]] = None, fallbacks: Optional[Dict[str, List[str]]] = None):
+        self.selectors = {**self._get_default_selectors(), **(selectors or {})}
+        self.fallbacks = fallbacks if fallbacks is not None else self._get_default_fallbacks()
         self.selector_config = self._create_selector_config()
+        self._winners: Dict[tuple, str] = {}  # (ページ種別, キー) -> 一致したセレクター
+        self.stats: Dict[str, Dict[str, int]] = {}  # キー -> {"primary", "fallback", "miss"}
     
     def _get_default_selectors(self) -> Dict[str, str]:
         """デフォルトのセレクターを取得"""
@@ -51,6 +97,11 @@ class SelectorManager:
             "password_field": "input#form_password",
             "login_button": "input[type='submit'][value='ログインする']",
             
+            # 2回目のログインフォーム（cn-univ）
+            "second_login_email": "input[name='email']",
+            "second_login_password": "input[name='password']",
+            "second_login_button": "button#next",
+            
             # ミール利用履歴リンク
             "meal_history_link": "a[href*='cn-univ.coop']",
             "meal_history_xpath": "//a[contains(text(), 'ミール利用履歴')]",
@@ -73,6 +124,23 @@ class SelectorManager:
             "more_button": ".btn-more"
         }
     
+    def _get_default_fallbacks(self) -> Dict[str, List[str]]:
+        """デフォルトの代替セレクター（CSSまたはXPath）を取得"""
+        return {
+            "email_field": ["input[name='email']", "input[type='email']"],
+            "password_field": ["input[name='password']", "input[type='password']"],
+            "login_button": [
+                "input[type='submit']",
+                "//button[contains(., 'ログイン')]",
+                "//button[contains(., 'Login')]",
+                "input[value*='ログイン']",
+                "input[value*='Login']"
+            ],
+            "meal_history_link": ["//a[contains(text(), 'ミール利用履歴')]"],
+            "usage_detail_link": ["//a[contains(text(), 'ご利用明細')]"],
+            "history_articles": [".history-contents"]
+        }
+    
     def _create_selector_config(self) -> SelectorConfig:
         """セレクター設定オブジェクトを作成"""
         return SelectorConfig(
@@ -103,7 +171,10 @@ class SelectorManager:
         return {
             "email_field": self.selectors["email_field"],
             "password_field": self.selectors["password_field"],
-            "login_button": self.selectors["login_button"]
+            "login_button": self.selectors["login_button"],
+            "second_login_email": self.selectors["second_login_email"],
+            "second_login_password": self.selectors["second_login_password"],
+            "second_login_button": self.selectors["second_login_button"]
         }
     
     def get_navigation_selectors(self) -> Dict[str, str]:
@@ -153,4 +224,95 @@ class SelectorManager:
             logger.error(f"必須セレクターが不足しています: {missing_keys}")
             return False
         
-        return True 
\ No newline at end of file
+        unknown_keys = [key for key in self.fallbacks if key not in self.selectors]
+        if unknown_keys:
+            logger.error(f"代替セレクターのキーが不正です: {unknown_keys}")
+            return False
+        
+        return True
+    
+    def get_candidates(self, key: str, page_type: Optional[str] = None) -> List[str]:
+        """キーの候補セレクターを優先順に取得（前回一致したセレクターを先頭にする）"""
+        candidates = [self.selectors[key]] + [s for s in self.fallbacks.get(key, []) if s != self.selectors[key]]
+        winner = self._winners.get((page_type, key))
+        if winner in candidates:
+            candidates.remove(winner)
+            candidates.insert(0, winner)
+        return candidates
+    
+    def probe(self, page, keys: List[str], page_type: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """複数キーの候補を1回のDOM問い合わせで判定し、キーごとに一致したセレクターを返す（一致なしはNone）"""
+        groups = [self.get_candidates(key, page_type) for key in keys]
+        try:
+            indexes = page.evaluate(PROBE_SCRIPT, groups)
+        except Exception as e:
+            logger.warning(f"セレクター判定エラー: {e}")
+            return {key: None for key in keys}
+        
+        return {
+            key: self._record(key, page_type, candidates[index] if index >= 0 else None, candidates)
+            for key, candidates, index in zip(keys, groups, indexes)
+        }
+    
+    def resolve(self, page, key: str, page_type: Optional[str] = None) -> Optional[str]:
+        """キーの候補のうちページ上で一致したセレクターを取得"""
+        return self.probe(page, [key], page_type)[key]
+    
+    def wait_for(self, page, key: str, page_type: Optional[str] = None, timeout: int = 30000) -> Optional[str]:
+        """キーの候補のいずれかが表示されるまで待機し、一致したセレクターを返す（タイムアウト時はNone）"""
+        candidates = self.get_candidates(key, page_type)
+        try:
+            handle = page.wait_for_function(WAIT_SCRIPT, arg=candidates, timeout=timeout)
+            selector = handle.json_value()
+        except Exception as e:
+            logger.warning(f"セレクター待機エラー: {key}: {e}")
+            selector = None
+        return self._record(key, page_type, selector, candidates)
+    
+    def _record(self, key: str, page_type: Optional[str], selector: Optional[str], candidates: List[str]) -> Optional[str]:
+        """判定結果を統計に記録し、一致したセレクターをページ種別ごとに保存"""
+        stats = self.stats.setdefault(key, {"primary": 0, "fallback": 0, "miss": 0})
+        if selector is None:
+            stats["miss"] += 1
+            logger.error(f"セレクターが見つかりません: {key}（候補: {candidates}）")
+        elif selector == self.selectors[key]:
+            stats["primary"] += 1
+        else:
+            stats["fallback"] += 1
+            logger.warning(f"代替セレクターを使用しました: {key} → {selector}")
+        if selector is not None:
+            self._winners[(page_type, key)] = selector
+        return selector
+    
+    def classify_page(self, page, states: Optional[List[str]] = None, page_type: Optional[str] = None, timeout: int = 30000) -> Optional[str]:
+        """ページ状態を判定（指定した状態の目印を同時に待機し、最初に見つかった状態を返す）
+
+        目印のいずれかが現れた時点で戻るため、通常はタイムアウトを待たない。
+        タイムアウトまでにどの目印も見つからない場合はNoneを返す。
+        """
+        groups = [
+            [state, self.get_candidates(key, page_type)]
+            for state, key in PAGE_STATES if states is None or state in states
+        ]
+        try:
+            handle = page.wait_for_function(CLASSIFY_SCRIPT, arg=groups, timeout=timeout)
+            state = handle.json_value()
+        except Exception as e:
+            logger.warning(f"ページ状態を判定できませんでした: {e}")
+            return None
+        logger.info(f"ページ状態: {state}")
+        return state
+    
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """キーごとの一致統計（基本セレクター・代替セレクター・一致なしの回数）を取得"""
+        return {key: dict(stats) for key, stats in self.stats.items()}
+    
+    def log_stats(self) -> None:
+        """一致統計をログに出力（代替セレクターの使用や一致なしがあれば警告）"""
+        if not self.stats:
+            return
+        degraded = {key: stats for key, stats in self.stats.items() if stats["fallback"] or stats["miss"]}
+        if degraded:
+            logger.warning(f"セレクターの一致状況に問題があります: {degraded}")
+        else:
+            logger.info(f"すべてのセレクターが基本セレクターで一致しました: {len(self.stats)}件") 
\ No newline at end of file
@@ -7,20 +7,26 @@ import smtplib
 import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.utils import make_msgid
 from datetime import datetime
 from typing import Dict, Any, Optional
 from .email_config import EmailConfigManager
+from .deadline import Deadline
 
 logger = logging.getLogger(__name__)
 
+# SMTPの接続・応答のタイムアウト（秒）
+SMTP_TIMEOUT = 30
+
 class SMTPSender:
     """SMTP送信クラス"""
     
     def __init__(self, config_manager: Optional[EmailConfigManager] = None):
         self.config_manager = config_manager or EmailConfigManager()
+        self.deadline = Deadline()  # 実行期限（MealHistoryScraper.run で設定）
     
-    def send_email(self, html_body: str, subject: Optional[str] = None) -> bool:
-        """HTMLメールを送信"""
+    def send_email(self, html_body: str, subject: Optional[str] = None, message_id: Optional[str] = None) -> bool:
+        """HTMLメールを送信（message_id を指定した場合は同じMessage-IDで送信する）"""
         if not self.config_manager.validate_config():
             logger.warning("メール設定が不完全なため、メール送信をスキップします")
             return False
@@ -40,12 +46,14 @@ class SMTPSender:
             msg['From'] = smtp_config["sender_email"]
             msg['To'] = email_config["recipient_email"]
             msg['Subject'] = subject or "食事履歴データ"
+            msg['Message-ID'] = message_id or make_msgid()
             
             # HTML本文を追加
             msg.attach(MIMEText(html_body, 'html', 'utf-8'))
             
-            # メールを送信
-            with smtplib.SMTP(smtp_config["smtp_server"], smtp_config["smtp_port"]) as server:
+            # メールを送信（実行期限の残り時間を超えて待機しない）
+            timeout = self.deadline.timeout(SMTP_TIMEOUT, "email")
+            with smtplib.SMTP(smtp_config["smtp_server"], smtp_config["smtp_port"], timeout=timeout) as server:
                 server.starttls()
                 server.login(smtp_config["sender_email"], smtp_config["sender_password"])
                 server.send_message(msg)
@@ -5,8 +5,14 @@ Playwrightの設定、管理、クリーンアップを担当
 
 import time
 import logging
-from playwright.sync_api import sync_playwright, Browser, Page
+from playwright.sync_api import sync_playwright, Browser, BrowserContext, Page, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
 from typing import Optional, Dict, Any
+from .event_log import traced
+from .debug_snapshot import DebugSnapshotter
+from .browser_trace import BrowserTracer
+from .launch_profile import LaunchProfile
+from .deadline import Deadline, DeadlineExceeded
+from .retry import retried, report_site_failure
 
 logger = logging.getLogger(__name__)
 
@@ -17,46 +23,67 @@ class WebDriverManager:
         self.config = config
         self.playwright = None
         self.browser: Optional[Browser] = None
+        self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
+        self.launch_profile = LaunchProfile(config)
+        self.ready_latency: Optional[float] = None
+        self.debug_snapshot = DebugSnapshotter(config.get("debug_snapshot"))
+        self.browser_trace = BrowserTracer(config.get("browser_trace"))
+        self.deadline = Deadline()  # 実行期限（MealHistoryScraper.run で設定）
+        self.retrier = None  # 再試行（MealHistoryScraper で設定。未設定の場合は再試行しない）
+        self.rate_limiter = None  # ホストごとのレート制限（複数アカウントの実行時に設定）
     
+    @retried("browser_setup")
+    @traced("browser_setup")
     def setup_driver(self) -> bool:
-        """Playwrightブラウザをセットアップ"""
+        """Playwrightブラウザをセットアップ（起動済みのブラウザがあれば再利用し、コンテキストのみ作り直す）"""
         try:
             logger.info("Playwrightブラウザをセットアップ中...")
+            start = time.perf_counter()
             
-            # 既存のリソースをクリーンアップ
-            if self.browser:
-                self.browser.close()
-                self.browser = None
-            if self.playwright:
-                self.playwright.stop()
-                self.playwright = None
-            
-            # Playwrightを初期化
-            self.playwright = sync_playwright().start()
-            headless = self.config.get("headless", False)
-            
-            # シンプルなブラウザ起動
-            self.browser = self.playwright.chromium.launch(headless=headless)
+            # 既存のコンテキストを閉じる
+            self._close_context()
             
-            # 新しいページを作成
-            self.page = self.browser.new_page()
+            # ブラウザが起動していない場合のみPlaywrightを初期化して起動
+            if not (self.browser and self.browser.is_connected()):
+                self._stop_browser()
+                self.playwright = sync_playwright().start()
+                self.browser = self.playwright.chromium.launch(**self.launch_profile.launch_options())
             
-            # ウィンドウサイズやUAなども必要に応じて設定
-            self.page.set_viewport_size({"width": 1920, "height": 1080})
-            self.page.set_extra_http_headers({
-                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-            })
+            # テンプレート（ビューポート・UA・ロケール・ブロックするリソース・ログイン状態）からページを作成
+            self.context = self.launch_profile.new_context(self.browser, self.rate_limiter, self.deadline)
+            self.browser_trace.start(self.context)
+            self.page = self.context.new_page()
             
-            logger.info("Playwrightブラウザのセットアップが完了しました")
+            self.ready_latency = time.perf_counter() - start
+            logger.info(f"Playwrightブラウザのセットアップが完了しました（{self.ready_latency:.2f}秒）")
             return True
             
         except Exception as e:
             logger.error(f"Playwrightセットアップエラー: {e}")
             # エラー時はリソースをクリーンアップ
-            self.cleanup()
+            self.cleanup(wait_time=0)
             return False
     
+    def _close_context(self) -> None:
+        """ページとコンテキストを閉じる"""
+        if self.context:
+            # トレースは失敗時・低速時のみ保存し、HARの記録はコンテキストを閉じた時点で書き出される
+            self.browser_trace.stop(self.context)
+            self.context.close()
+            self.launch_profile.finish_recording()
+        self.context = None
+        self.page = None
+    
+    def _stop_browser(self) -> None:
+        """ブラウザとPlaywrightを停止"""
+        if self.browser:
+            self.browser.close()
+            self.browser = None
+        if self.playwright:
+            self.playwright.stop()
+            self.playwright = None
+    
     def get_page(self) -> Optional[Page]:
         """Pageオブジェクトを取得"""
         return self.page
@@ -79,12 +106,20 @@ class WebDriverManager:
             logger.warning(f"HTML保存エラー: {e}")
             return False
     
+    def capture_debug_snapshot(self, label: str, failed: bool = False) -> bool:
+        """デバッグスナップショットを取得（無効時・サンプリング対象外の場合はHTMLを取得しない）"""
+        if failed:
+            # 記録中のトレースも失敗として保存する
+            self.browser_trace.mark_failed(label)
+        return self.debug_snapshot.capture(self.page, label, failed)
+    
     def get_current_url(self) -> str:
         """現在のURLを取得"""
         if self.page:
             return self.page.url
         return ""
     
+    @retried("navigate_to")
     def navigate_to(self, url: str) -> bool:
         """指定されたURLに遷移"""
         try:
@@ -92,14 +127,28 @@ class WebDriverManager:
                 return False
             
             # Playwrightの最適化されたナビゲーション
-            self.page.goto(
+            response = self.page.goto(
                 url, 
-                timeout=self.config.get("navigation_timeout", 30000),
+                timeout=self.deadline.timeout_ms(self.config.get("navigation_timeout", 30000), "navigate_to"),
                 wait_until="networkidle"  # ネットワークが安定するまで待機
             )
             
+            # サーバーエラー・要求過多の応答はサイト停止としてサーキットブレーカーに報告する
+            if response is not None and (response.status >= 500 or response.status == 429):
+                logger.error(f"URL遷移エラー: {url} がステータス {response.status} を返しました")
+                report_site_failure(f"status {response.status}")
+                return False
+            
             logger.info(f"URLに遷移しました: {url}")
             return True
+        except DeadlineExceeded:
+            raise
+        except PlaywrightError as e:
+            logger.error(f"URL遷移エラー: {e}")
+            # タイムアウト・接続エラーはサイト停止の可能性がある
+            if isinstance(e, PlaywrightTimeoutError) or "net::ERR_" in str(e):
+                report_site_failure(type(e).__name__)
+            return False
         except Exception as e:
             logger.error(f"URL遷移エラー: {e}")
             return False
@@ -109,15 +158,17 @@ class WebDriverManager:
         try:
             if self.browser:
                 time.sleep(wait_time)
-                self.browser.close()
-                self.browser = None
-                self.page = None
+                # ログイン状態を保存してから閉じる（保存先が設定されている場合のみ）
+                self.launch_profile.save_storage_state(self.context)
+                self._close_context()
+                self._stop_browser()
                 logger.info("ブラウザを閉じました")
-            if self.playwright:
-                self.playwright.stop()
-                self.playwright = None
+            elif self.playwright:
+                self._stop_browser()
         except Exception as e:
             logger.error(f"クリーンアップエラー: {e}")
+        finally:
+            self.debug_snapshot.flush()
     
     def __enter__(self):
         self.setup_driver()